@@ -0,0 +1,182 @@
+"""
+Benchmark de latencia y viajes a la base de datos de las funciones de `bigquery_client`.
+
+Uso:
+    python -m benchmarks.bench_storage                       # SQLite en memoria con datos sintéticos
+    python -m benchmarks.bench_storage --tiquetes 5000 --iteraciones 500
+    python -m benchmarks.bench_storage --backend bigquery --ticket-id DEX-20250826-1FA8 --email jose.solano@connect.inc
+
+Para cada función se reporta la latencia (p50, p95, promedio) y los viajes de ida
+y vuelta al backend por llamada. Al final se simulan los turnos de chat que
+ejecutan herramientas para ver cuántas consultas cuesta cada uno.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--backend", choices=["sqlite", "bigquery"], default="sqlite")
+parser.add_argument("--db", default=":memory:", help="Ruta de la base SQLite (por defecto en memoria).")
+parser.add_argument("--tiquetes", type=int, default=1000, help="Tiquetes sintéticos a sembrar (solo SQLite).")
+parser.add_argument("--iteraciones", type=int, default=200)
+parser.add_argument("--ticket-id", help="Tiquete existente a consultar (obligatorio con BigQuery).")
+parser.add_argument("--email", default="usuario@connect.inc", help="Correo a consultar en la tabla de roles.")
+parser.add_argument("--incluir-escrituras", action="store_true", help="Incluye registrar_evento y los turnos con escrituras en BigQuery.")
+args = parser.parse_args()
+
+os.environ["STORAGE_BACKEND"] = args.backend
+os.environ["SQLITE_DB_PATH"] = args.db
+# Nunca enviar correos ni mensajes reales desde un benchmark.
+os.environ["BREVO_API_KEY"] = ""
+os.environ["GOOGLE_CHAT_WEBHOOK_URL"] = ""
+os.environ["NOTIFICATION_SPILL_PATH"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils import metrics
+from src.utils import bigquery_client
+from src.utils.storage_backend import obtener_backend, SQLiteBackend
+from src.tasks.rebuild_ticket_state import reconstruir_ticket_state
+
+DEPARTAMENTOS = ["Data Engineering", "Data Analyst / BI"]
+PRIORIDADES = ["alta", "media", "baja"]
+
+
+def sembrar_datos(backend: SQLiteBackend, num_tiquetes: int) -> list:
+    """Crea tiquetes, eventos, roles y configuración de SLA sintéticos."""
+    random.seed(42)
+    ahora = datetime.utcnow()
+    backend.insertar_filas("sla_configuracion", [
+        {"department": d, "priority": p, "sla_hours": h}
+        for d in DEPARTAMENTOS for p, h in zip(PRIORIDADES, (8, 24, 72))
+    ])
+    backend.insertar_filas("roles_usuarios", [
+        {"user_email": f"agente{i}@connect.inc", "role": random.choice(["agent", "lead", "admin"]), "department": random.choice(DEPARTAMENTOS)}
+        for i in range(50)
+    ])
+    tickets, eventos, ids = [], [], []
+    for i in range(num_tiquetes):
+        ticket_id = f"DEX-BENCH-{i:06d}"
+        creado = ahora - timedelta(hours=random.randint(1, 24 * 90))
+        departamento = random.choice(DEPARTAMENTOS)
+        sla = random.choice((8, 24, 72))
+        tickets.append({
+            "TicketID": ticket_id, "Solicitante": f"usuario{i % 200}@connect.inc",
+            "FechaCreacion": creado, "SLA_Horas": sla, "FechaVencimiento": creado + timedelta(hours=sla),
+        })
+        historial = [("CREADO", {"equipo_asignado": departamento, "responsable_inicial": f"agente{i % 50}@connect.inc", "prioridad_asignada": "media", "sla_calculado_horas": sla})]
+        for _ in range(random.randint(0, 4)):
+            historial.append(("REASIGNADO", {"nuevo_responsable": f"agente{random.randint(0, 49)}@connect.inc"}))
+        if random.random() < 0.6:
+            historial.append(("CERRADO", {"resolucion": "Resuelto en benchmark."}))
+        for n, (tipo, detalles) in enumerate(historial):
+            eventos.append({
+                "EventoID": str(uuid.uuid4()), "TicketID": ticket_id, "FechaEvento": creado + timedelta(minutes=30 * n),
+                "Autor": "benchmark", "TipoEvento": tipo, "Detalles": json.dumps(detalles),
+            })
+        ids.append(ticket_id)
+    backend.insertar_filas("tickets", tickets)
+    backend.insertar_filas("eventos_tiquetes", eventos)
+    print(f"▶️  Sembrados {len(tickets)} tiquetes y {len(eventos)} eventos en SQLite.")
+    return ids
+
+
+def medir(nombre: str, funcion, iteraciones: int) -> dict:
+    """Ejecuta `funcion(i)` varias veces y devuelve latencias y viajes por llamada."""
+    latencias = []
+    viajes_antes = metrics.obtener_contador("backend.round_trips")
+    for i in range(iteraciones):
+        inicio = time.perf_counter()
+        funcion(i)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    viajes = metrics.obtener_contador("backend.round_trips") - viajes_antes
+    latencias.sort()
+    return {
+        "funcion": nombre,
+        "p50_ms": statistics.median(latencias),
+        "p95_ms": latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))],
+        "promedio_ms": statistics.fmean(latencias),
+        "viajes_por_llamada": viajes / iteraciones,
+    }
+
+
+def imprimir_tabla(titulo: str, resultados: list):
+    print(f"\n{titulo}")
+    print(f"{'Función':<42}{'p50 ms':>10}{'p95 ms':>10}{'prom ms':>10}{'viajes':>9}")
+    for r in resultados:
+        print(f"{r['funcion']:<42}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['promedio_ms']:>10.2f}{r['viajes_por_llamada']:>9.2f}")
+
+
+def main():
+    backend = obtener_backend()
+    if isinstance(backend, SQLiteBackend):
+        ids = sembrar_datos(backend, args.tiquetes)
+        bigquery_client.cargar_matriz_sla()
+        reconstruir_ticket_state()
+    elif args.ticket_id:
+        ids = [args.ticket_id]
+        bigquery_client.cargar_matriz_sla()
+    else:
+        parser.error("--ticket-id es obligatorio con --backend bigquery")
+
+    escrituras = isinstance(backend, SQLiteBackend) or args.incluir_escrituras
+    ticket = lambda i: ids[i % len(ids)]
+    n = args.iteraciones
+
+    from src.services.ticket_querier import consultar_estado_tiquete
+    from src.tasks.summary_task import get_open_tickets_summary
+
+    funciones = [
+        ("validar_tiquete", lambda i: bigquery_client.validar_tiquete(ticket(i))),
+        ("obtener_rol_usuario", lambda i: bigquery_client.obtener_rol_usuario(args.email)),
+        ("obtener_sla_por_configuracion", lambda i: bigquery_client.obtener_sla_por_configuracion(DEPARTAMENTOS[i % 2], PRIORIDADES[i % 3])),
+        ("obtener_departamento_tiquete", lambda i: bigquery_client.obtener_departamento_tiquete(ticket(i))),
+        ("obtener_participantes_tiquete", lambda i: bigquery_client.obtener_participantes_tiquete(ticket(i))),
+        ("cargar_snapshot_tiquete", lambda i: bigquery_client.cargar_snapshot_tiquete(ticket(i))),
+        ("consultar_estado_tiquete", lambda i: consultar_estado_tiquete(ticket(i))),
+        ("get_open_tickets_summary", lambda i: get_open_tickets_summary()),
+    ]
+    if escrituras:
+        funciones.append(("registrar_evento", lambda i: bigquery_client.registrar_evento(ticket(i), "COMENTARIO", "benchmark", {"nota": "benchmark"})))
+
+    resultados = []
+    for nombre, funcion in funciones:
+        iteraciones = max(1, n // 20) if nombre == "get_open_tickets_summary" else n
+        resultados.append(medir(nombre, funcion, iteraciones))
+    imprimir_tabla(f"Backend '{backend.nombre}' — latencia por función", resultados)
+
+    if escrituras:
+        from src.services import ticket_manager
+        contexto = {"solicitante_email": "agente0@connect.inc", "solicitante_rol": "admin", "solicitante_departamento": DEPARTAMENTOS[0]}
+        turnos = [
+            ("turno: crear_tiquete", lambda i: ticket_manager.crear_tiquete(
+                descripcion="Benchmark", equipo_asignado=DEPARTAMENTOS[i % 2], prioridad="media",
+                solicitante="usuario@connect.inc", nombre_solicitante="Usuario Benchmark")),
+            ("turno: reasignar_tiquete", lambda i: ticket_manager.reasignar_tiquete(
+                ticket_id=ticket(i), nuevo_responsable_email="agente1@connect.inc", **contexto)),
+            ("turno: cerrar_tiquete", lambda i: ticket_manager.cerrar_tiquete(
+                ticket_id=ticket(i), resolucion="Benchmark", **{**contexto, "solicitante_rol": "lead"})),
+            ("turno: modificar_sla_manual", lambda i: ticket_manager.modificar_sla_manual(
+                ticket_id=ticket(i), nuevas_horas_sla=48, **contexto)),
+        ]
+        imprimir_tabla("Costo por turno de chat con herramienta", [medir(nombre, funcion, max(1, n // 4)) for nombre, funcion in turnos])
+
+    bigquery_client.flush_eventos()
+    flush = metrics.snapshot()["tiempos"].get("eventos.flush")
+    if flush:
+        print(f"\nEscritor de eventos: {flush['llamadas']} lotes, {metrics.obtener_contador('eventos.filas_escritas')} eventos, "
+              f"flush promedio {flush['promedio_ms']:.2f} ms (máx {flush['max_ms']:.2f} ms)")
+
+    print("\nViajes por operación del backend:")
+    for nombre, valor in sorted(metrics.snapshot()["contadores"].items()):
+        if nombre.startswith("backend.round_trips."):
+            print(f"  {nombre.removeprefix('backend.round_trips.'):<36}{valor:>8}")
+
+
+if __name__ == "__main__":
+    main()
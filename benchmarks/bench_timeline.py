@@ -0,0 +1,112 @@
+"""
+Benchmark de los dos modos de `visualizar_flujo_tiquete`: dibujo local con Pillow e Imagen.
+
+Uso:
+    python -m benchmarks.bench_timeline                          # solo el dibujo local
+    python -m benchmarks.bench_timeline --eventos 12 --hilos 8 --iteraciones 100
+    python -m benchmarks.bench_timeline --imagen --iteraciones 3   # incluye Imagen (requiere IMAGEN_MODEL y credenciales)
+
+Para cada modo se reporta la latencia por imagen (p50, p95, promedio) y el tamaño del PNG.
+El dibujo local se mide en el propio hilo y en el pool de procesos con `--hilos` solicitudes
+concurrentes; mientras tanto un hilo "latido" mide cuánto se retrasa el resto del proceso,
+que es lo que el pool evita al sacar el trabajo de CPU del GIL. No se sube nada a GCS.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--eventos", type=int, default=5, help="Eventos del tiquete sintético.")
+parser.add_argument("--iteraciones", type=int, default=50)
+parser.add_argument("--hilos", type=int, default=4, help="Solicitudes concurrentes en los modos con hilos.")
+parser.add_argument("--workers", type=int, default=2, help="Procesos del pool de render.")
+parser.add_argument("--imagen", action="store_true", help="Mide también el modo estilizado con Imagen.")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TICKET_ID = "DEX-20250826-1FA8"
+
+
+def eventos_sinteticos(cantidad: int) -> list:
+    inicio = datetime(2025, 8, 26, 9, 0, tzinfo=timezone.utc)
+    eventos = [{"TipoEvento": "CREADO", "FechaEvento": inicio, "Detalles": json.dumps({"prioridad_asignada": "alta"})}]
+    for i in range(1, cantidad - 1):
+        eventos.append({
+            "TipoEvento": "REASIGNADO", "FechaEvento": inicio + timedelta(hours=3 * i),
+            "Detalles": json.dumps({"nuevo_responsable": f"agente{i}@connect.inc"}),
+        })
+    if cantidad > 1:
+        eventos.append({"TipoEvento": "CERRADO", "FechaEvento": inicio + timedelta(days=2), "Detalles": "{}"})
+    return eventos
+
+
+def medir_latido(detener: threading.Event, retrasos: list, intervalo: float = 0.005):
+    """Duerme `intervalo` en bucle y registra cuánto tarda de más en despertar (espera por el GIL)."""
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        time.sleep(intervalo)
+        retrasos.append((time.perf_counter() - inicio - intervalo) * 1000)
+
+
+def medir(funcion, iteraciones: int, hilos: int) -> (list, list, bytes):
+    tiempos, retrasos, detener = [], [], threading.Event()
+    latido = threading.Thread(target=medir_latido, args=(detener, retrasos), daemon=True)
+    latido.start()
+
+    def una():
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        return resultado
+
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        resultados = list(executor.map(lambda _: una(), range(iteraciones)))
+    detener.set()
+    latido.join()
+    return tiempos, retrasos, resultados[-1]
+
+
+def reportar(nombre: str, tiempos: list, retrasos: list, png: bytes):
+    ordenados = sorted(tiempos)
+    p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+    retraso = statistics.mean(retrasos) if retrasos else 0.0
+    print(f"{nombre:<34}{statistics.median(tiempos):>10.1f}{p95:>10.1f}{statistics.mean(tiempos):>10.1f}{retraso:>12.2f}{len(png) / 1024:>10.1f}")
+
+
+def main():
+    # Los procesos del pool reimportan este módulo: los argumentos y el import del renderer,
+    # que lee TIMELINE_RENDER_WORKERS al cargarse, quedan aquí y no a nivel de módulo.
+    args = parser.parse_args()
+    os.environ["TIMELINE_RENDER_WORKERS"] = str(args.workers)
+    from src.services import timeline_renderer
+
+    eventos = eventos_sinteticos(args.eventos)
+    hitos = timeline_renderer.preparar_hitos(eventos)
+    timeline_renderer.iniciar_pool_render()
+    timeline_renderer.renderizar_linea_tiempo(TICKET_ID, eventos)
+
+    print(f"\nTiquete sintético con {len(eventos)} eventos, {args.iteraciones} imágenes por modo, pool de {args.workers} procesos")
+    print(f"{'Modo':<34}{'p50 ms':>10}{'p95 ms':>10}{'prom ms':>10}{'latido ms':>12}{'PNG KB':>10}")
+
+    modos = [
+        ("local, en el hilo (1 hilo)", lambda: timeline_renderer.dibujar_linea_tiempo(TICKET_ID, hitos), 1),
+        (f"local, en el hilo ({args.hilos} hilos)", lambda: timeline_renderer.dibujar_linea_tiempo(TICKET_ID, hitos), args.hilos),
+        (f"local, pool de procesos ({args.hilos} hilos)", lambda: timeline_renderer.renderizar_linea_tiempo(TICKET_ID, eventos), args.hilos),
+    ]
+    for nombre, funcion, hilos in modos:
+        reportar(nombre, *medir(funcion, args.iteraciones, hilos))
+
+    if args.imagen:
+        from src.services.ticket_visualizer import generar_con_imagen
+        reportar("estilizado (Imagen)", *medir(lambda: generar_con_imagen(TICKET_ID, eventos), args.iteraciones, 1))
+    print("\n'latido ms': retraso promedio de un hilo que despierta cada 5 ms mientras se dibuja.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark del índice vectorial local de la KB frente a la búsqueda por fuerza bruta.
+
+Uso:
+    python -m benchmarks.bench_vector_index                         # 500 documentos de dimensión 768
+    python -m benchmarks.bench_vector_index --documentos 50000 --consultas 500 --hnsw
+    python -m benchmarks.bench_vector_index --snapshot /tmp/kb_index   # usa un snapshot real
+
+Compara, con los mismos vectores de consulta:
+  - fuerza bruta en Python puro (referencia, solo con corpus pequeños),
+  - producto punto NumPy sobre la matriz en memoria,
+  - producto punto NumPy sobre la matriz memory-mapped (lo que usa `IndiceVectorial`),
+  - HNSW (si se pide con --hnsw y `hnswlib` está instalado), con su recall@k frente al exacto.
+También verifica que el umbral de similitud 0.75 da el mismo resultado en todos los modos.
+"""
+import os
+import sys
+import time
+import math
+import argparse
+import tempfile
+import statistics
+import numpy as np
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--documentos", type=int, default=500)
+parser.add_argument("--dimension", type=int, default=768)
+parser.add_argument("--consultas", type=int, default=200)
+parser.add_argument("--k", type=int, default=1)
+parser.add_argument("--hnsw", action="store_true", help="Construye también un índice HNSW (requiere hnswlib).")
+parser.add_argument("--snapshot", help="Directorio con embeddings.npy + ids.json en lugar de datos sintéticos.")
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.vector_index import IndiceVectorial, guardar_snapshot
+
+UMBRAL_SIMILITUD = 0.75
+
+
+def medir(funcion, consultas) -> (list, list):
+    tiempos, resultados = [], []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultados.append(funcion(consulta))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos, resultados
+
+
+def fuerza_bruta_python(matriz_lista, ids, k):
+    def buscar(consulta):
+        q = consulta.tolist()
+        norma = math.sqrt(sum(x * x for x in q)) or 1.0
+        similitudes = [(ids[i], sum(a * b for a, b in zip(fila, q)) / norma) for i, fila in enumerate(matriz_lista)]
+        return sorted(similitudes, key=lambda par: -par[1])[:k]
+    return buscar
+
+
+def main():
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as directorio:
+        if args.snapshot:
+            directorio = args.snapshot
+        else:
+            # Corpus sintético con grupos de documentos parecidos, como artículos de una misma área.
+            centros = rng.standard_normal((max(args.documentos // 20, 1), args.dimension))
+            corpus = centros[rng.integers(0, len(centros), args.documentos)] + 0.6 * rng.standard_normal((args.documentos, args.dimension))
+            guardar_snapshot(directorio, [f"doc_{i}.txt" for i in range(args.documentos)], corpus)
+
+        inicio = time.perf_counter()
+        indice = IndiceVectorial.cargar(directorio)
+        carga_ms = (time.perf_counter() - inicio) * 1000
+        matriz_ram = np.array(indice.matriz)
+        ids = indice.ids
+
+        # Consultas cercanas a documentos existentes (aciertos) y aleatorias (fallos del umbral).
+        base = matriz_ram[rng.integers(0, len(ids), args.consultas)]
+        ruido = rng.standard_normal(base.shape).astype(np.float32)
+        consultas = [fila + (0.02 if i % 2 == 0 else 1.0) * r for i, (fila, r) in enumerate(zip(base, ruido))]
+
+        modos = [
+            ("numpy mmap (IndiceVectorial)", lambda q: indice.buscar(q, k=args.k)),
+            ("numpy en memoria", lambda q: IndiceVectorial(ids, matriz_ram).buscar(q, k=args.k)),
+        ]
+        if len(ids) * args.dimension <= 5_000_000:
+            modos.insert(0, ("fuerza bruta Python", fuerza_bruta_python(matriz_ram.tolist(), ids, args.k)))
+        if args.hnsw:
+            inicio = time.perf_counter()
+            indice_hnsw = IndiceVectorial(ids, matriz_ram, min_docs_hnsw=1)
+            print(f"Construcción HNSW: {(time.perf_counter() - inicio) * 1000:.0f} ms")
+            if indice_hnsw._hnsw is not None:
+                modos.append(("HNSW (hnswlib)", lambda q: indice_hnsw.buscar(q, k=args.k)))
+
+        print(f"\nCorpus: {len(ids)} documentos x {indice.dimension} dimensiones, {len(consultas)} consultas, k={args.k}")
+        print(f"Carga del snapshot (mmap): {carga_ms:.2f} ms")
+        print(f"{'Modo':<32}{'p50 ms':>10}{'p95 ms':>10}{'prom ms':>10}{'recall@k':>10}{'> 0.75':>8}")
+
+        _, exactos = medir(lambda q: indice.buscar(q, k=args.k, exacto=True), consultas)
+        for nombre, funcion in modos:
+            tiempos, resultados = medir(funcion, consultas)
+            ordenados = sorted(tiempos)
+            p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+            recall = statistics.mean(
+                len({i for i, _ in r} & {i for i, _ in e}) / len(e) for r, e in zip(resultados, exactos)
+            )
+            sobre_umbral = sum(1 for r in resultados if r and r[0][1] > UMBRAL_SIMILITUD)
+            print(f"{nombre:<32}{statistics.median(tiempos):>10.3f}{p95:>10.3f}{statistics.mean(tiempos):>10.3f}{recall:>10.3f}{sobre_umbral:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,33 @@ import traceback
 from flask import Flask, request, jsonify
 from src.logic import handle_dex_logic
 from src.tasks.summary_task import send_daily_summaries
-from src.utils.bigquery_client import registrar_feedback
-from src.services.memory_service import get_or_create_active_session, set_session_state
+from src.tasks.rebuild_ticket_state import reconstruir_ticket_state, actualizar_proyecciones
+from src.utils.bigquery_client import registrar_feedback, precargar_roles, invalidar_cache_roles, iniciar_refresco_sla
+from src.services.memory_service import abrir_turno, set_session_state, turno_actual
+from src.utils import metrics
+from src.utils.admin_auth import requiere_admin
+from src.services.knowledge_service import precargar_documentos_kb, cargar_indice_local
+from src.services.sql_template_cache import cargar_plantillas_fijadas
+from src.services.timeline_renderer import iniciar_pool_render
+from src.services.notification_service import iniciar_outbox_notificaciones
+from src.config import KB_DOC_WARMUP, KB_SEARCH_BACKEND, PROJECTION_LOOKBACK_HOURS
 
 app = Flask(__name__)
+# Con `python main.py`, los procesos del pool de render reimportan este módulo como
+# __mp_main__; en ellos no se arranca nada.
+if __name__ != "__mp_main__":
+    iniciar_outbox_notificaciones()
+    iniciar_pool_render()
+    precargar_roles()
+    iniciar_refresco_sla()
+    cargar_plantillas_fijadas()
+    if KB_DOC_WARMUP:
+        precargar_documentos_kb()
+    if KB_SEARCH_BACKEND == "local":
+        try:
+            cargar_indice_local()
+        except Exception as e:
+            print(f"🔴 No se pudo cargar el índice vectorial local de la KB: {e}")
 
 @app.route("/", methods=["POST"])
 def handle_chat_event():
@@ -28,6 +51,13 @@ def handle_chat_event():
             )
             
             if isinstance(response_data, str) and "Por favor, valora mi respuesta" in response_data:
+                # Los botones llevan la sesión del turno y el ID de la respuesta valorada en el historial
+                # (`mensajes/{seq}`); el clic no necesita consultar la sesión.
+                turno = turno_actual()
+                parametros_feedback = [
+                    {"key": "session_id", "value": turno.session_id if turno else ""},
+                    {"key": "message_id", "value": (turno.id_ultimo_mensaje or "") if turno else ""}
+                ]
                 return jsonify({
                     "text": response_data,
                     "cardsV2": [{
@@ -39,11 +69,11 @@ def handle_chat_event():
                                         "buttons": [
                                             {
                                                 "text": "👍",
-                                                "onClick": { "action": { "function": "register_feedback_positive" } }
+                                                "onClick": { "action": { "function": "register_feedback_positive", "parameters": parametros_feedback } }
                                             },
                                             {
                                                 "text": "👎",
-                                                "onClick": { "action": { "function": "register_feedback_negative" } }
+                                                "onClick": { "action": { "function": "register_feedback_negative", "parameters": parametros_feedback } }
                                             }
                                         ]
                                     }
@@ -64,18 +94,30 @@ def handle_chat_event():
             user_info = event_data.get('user', {})
             user_email = user_info.get("email")
             user_id = user_info.get("name")
-            session_id, _ = get_or_create_active_session(user_id)
+            parametros = event_data.get('common', {}).get('parameters') or {
+                p.get("key"): p.get("value") for p in event_data.get('action', {}).get('parameters', [])
+            }
+            session_id = parametros.get("session_id")
+            # Tarjetas anteriores sin el ID de la respuesta: se guarda None. El `message.name` del evento
+            # es el recurso de Chat, no un ID de `chat_histories/{session_id}/mensajes`.
+            message_id = parametros.get("message_id") or None
+            if not session_id:
+                # Tarjetas enviadas antes de que los botones llevaran la sesión.
+                turno = abrir_turno(user_id, con_historial=False)
+                session_id = turno.session_id if turno else None
+                if turno:
+                    turno.confirmar()
 
             response_card = { "actionResponse": { "type": "UPDATE_MESSAGE" } }
 
             if action == 'register_feedback_positive':
-                registrar_feedback(session_id, user_email, 1)
+                registrar_feedback(session_id, user_email, 1, message_id)
                 response_card["text"] = "¡Gracias por tu feedback!"
                 return jsonify(response_card)
 
             elif action == 'register_feedback_negative':
-                registrar_feedback(session_id, user_email, 0)
-                set_session_state(user_id, 'AWAITING_FEEDBACK_COMMENT')
+                registrar_feedback(session_id, user_email, 0, message_id)
+                set_session_state(user_id, 'AWAITING_FEEDBACK_COMMENT', feedback_session_id=session_id)
                 response_card["text"] = "Lamento que tu experiencia no haya sido la mejor. ¿Podrías darme más detalles para poder mejorar?"
                 return jsonify(response_card)
 
@@ -90,7 +132,22 @@ def handle_chat_event():
         print(json.dumps({"log_name": "HandleChatEvent_Error", "error": str(e), "traceback": traceback.format_exc()}))
         return jsonify({"text": "Ocurrió un error inesperado."})
 
+@app.route("/metrics", methods=["GET"])
+@requiere_admin
+def handle_metrics():
+    return jsonify(metrics.snapshot())
+
+@app.route("/roles/invalidate", methods=["POST"])
+@requiere_admin
+def handle_roles_invalidation():
+    payload = request.get_json(silent=True) or {}
+    invalidar_cache_roles(payload.get("email"))
+    if payload.get("reload"):
+        precargar_roles()
+    return jsonify({"status": "ok"})
+
 @app.route("/run-summary", methods=["POST"])
+@requiere_admin
 def handle_summary_trigger():
     print("🚀 Tarea de resumen diario iniciada por Cloud Scheduler.")
     try:
@@ -100,6 +157,28 @@ def handle_summary_trigger():
         print(f"🔴 Error ejecutando la tarea de resumen: {e}")
         return "Error interno ejecutando la tarea.", 500
 
+@app.route("/rebuild-ticket-state", methods=["POST"])
+@requiere_admin
+def handle_rebuild_ticket_state():
+    payload = request.get_json(silent=True) or {}
+    try:
+        total = reconstruir_ticket_state(payload.get("ticket_id"))
+        return jsonify({"status": "ok", "tiquetes": total}), 200
+    except Exception as e:
+        print(f"🔴 Error reconstruyendo ticket_state: {e}")
+        return "Error interno reconstruyendo ticket_state.", 500
+
+@app.route("/refresh-projections", methods=["POST"])
+@requiere_admin
+def handle_refresh_projections():
+    payload = request.get_json(silent=True) or {}
+    try:
+        total = actualizar_proyecciones(float(payload.get("horas", PROJECTION_LOOKBACK_HOURS)))
+        return jsonify({"status": "ok", "tiquetes": total}), 200
+    except Exception as e:
+        print(f"🔴 Error actualizando ticket_state y metricas_diarias: {e}")
+        return "Error interno actualizando las proyecciones.", 500
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
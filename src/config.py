@@ -11,4 +11,88 @@ TICKETS_TABLE_NAME = "tickets"
 EVENTOS_TABLE_NAME = "eventos_tiquetes"
 
 DATA_ENGINEERING_LEAD = os.getenv("DATA_ENGINEERING_LEAD", "jose.solano@connect.inc")
-BI_ANALYST_LEAD = os.getenv("BI_ANALYST_LEAD", "ivan.galindo@connect.inc")
\ No newline at end of file
+BI_ANALYST_LEAD = os.getenv("BI_ANALYST_LEAD", "ivan.galindo@connect.inc")
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "bigquery").lower()
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "helpdesk_local.db")
+
+EVENT_WRITER_MODE = os.getenv("EVENT_WRITER_MODE", "batch").lower()
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "200"))
+EVENT_FLUSH_INTERVAL_SECONDS = float(os.getenv("EVENT_FLUSH_INTERVAL_SECONDS", "2"))
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+FEEDBACK_FLUSH_INTERVAL_SECONDS = float(os.getenv("FEEDBACK_FLUSH_INTERVAL_SECONDS", "5"))
+PROJECTION_LOOKBACK_HOURS = float(os.getenv("PROJECTION_LOOKBACK_HOURS", "3"))
+
+ROLES_CACHE_TTL_SECONDS = float(os.getenv("ROLES_CACHE_TTL_SECONDS", "900"))
+ROLES_NEGATIVE_CACHE_TTL_SECONDS = float(os.getenv("ROLES_NEGATIVE_CACHE_TTL_SECONDS", "300"))
+
+SLA_REFRESH_INTERVAL_SECONDS = float(os.getenv("SLA_REFRESH_INTERVAL_SECONDS", "300"))
+
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+ADMIN_OIDC_AUDIENCE = os.getenv("ADMIN_OIDC_AUDIENCE")
+ADMIN_OIDC_SERVICE_ACCOUNTS = {cuenta.strip() for cuenta in os.getenv("ADMIN_OIDC_SERVICE_ACCOUNTS", "").split(",") if cuenta.strip()}
+
+NOTIFICATION_MODE = os.getenv("NOTIFICATION_MODE", "async").lower()
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "4"))
+NOTIFICATION_QUEUE_SIZE = int(os.getenv("NOTIFICATION_QUEUE_SIZE", "1000"))
+NOTIFICATION_MAX_RETRIES = int(os.getenv("NOTIFICATION_MAX_RETRIES", "5"))
+NOTIFICATION_SPILL_PATH = os.getenv("NOTIFICATION_SPILL_PATH") or (f"gs://{os.getenv('GCS_BUCKET_NAME')}/outbox" if os.getenv("GCS_BUCKET_NAME") else None)
+
+BREVO_BATCH_SIZE = int(os.getenv("BREVO_BATCH_SIZE", "100"))
+BREVO_BATCH_CONCURRENCY = int(os.getenv("BREVO_BATCH_CONCURRENCY", "4"))
+BREVO_MAX_REQUESTS_PER_SECOND = float(os.getenv("BREVO_MAX_REQUESTS_PER_SECOND", "5"))
+
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "32"))
+FANOUT_KB_TIMEOUT_SECONDS = float(os.getenv("FANOUT_KB_TIMEOUT_SECONDS", "8"))
+FANOUT_ROLE_TIMEOUT_SECONDS = float(os.getenv("FANOUT_ROLE_TIMEOUT_SECONDS", "5"))
+FANOUT_SENTIMENT_TIMEOUT_SECONDS = float(os.getenv("FANOUT_SENTIMENT_TIMEOUT_SECONDS", "5"))
+
+SENTIMENT_MODE = os.getenv("SENTIMENT_MODE", "hybrid").lower()
+SENTIMENT_CONFIDENCE_THRESHOLD = float(os.getenv("SENTIMENT_CONFIDENCE_THRESHOLD", "0.5"))
+SENTIMENT_CACHE_TTL_SECONDS = float(os.getenv("SENTIMENT_CACHE_TTL_SECONDS", "3600"))
+
+TURN_MODE = os.getenv("TURN_MODE", "single_call").lower()
+
+EMBEDDING_CACHE_BACKEND = os.getenv("EMBEDDING_CACHE_BACKEND", "firestore").lower()
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "/tmp/embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "5000"))
+EMBEDDING_CACHE_COLLECTION = os.getenv("EMBEDDING_CACHE_COLLECTION", "embedding_cache")
+
+KB_DOC_CACHE_MAX_BYTES = int(os.getenv("KB_DOC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+KB_DOC_REVALIDATE_SECONDS = float(os.getenv("KB_DOC_REVALIDATE_SECONDS", "300"))
+KB_DOC_WARMUP = os.getenv("KB_DOC_WARMUP", "true").lower() == "true"
+
+KB_SEARCH_BACKEND = os.getenv("KB_SEARCH_BACKEND", "vertex").lower()
+KB_VECTOR_INDEX_PATH = os.getenv("KB_VECTOR_INDEX_PATH", "/tmp/kb_index")
+KB_VECTOR_HNSW_MIN_DOCS = int(os.getenv("KB_VECTOR_HNSW_MIN_DOCS", "5000"))
+KB_INDEX_EMBED_BATCH_SIZE = int(os.getenv("KB_INDEX_EMBED_BATCH_SIZE", "16"))
+KB_INDEX_MAX_CHARS = int(os.getenv("KB_INDEX_MAX_CHARS", "8000"))
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+HISTORY_SUMMARY_MIN_PENDING = int(os.getenv("HISTORY_SUMMARY_MIN_PENDING", "8"))
+HISTORY_TAIL_MESSAGES = int(os.getenv("HISTORY_TAIL_MESSAGES", "60"))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+
+METRICS_SQL_CACHE_TTL_SECONDS = float(os.getenv("METRICS_SQL_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+METRICS_SQL_CACHE_MAX_ENTRIES = int(os.getenv("METRICS_SQL_CACHE_MAX_ENTRIES", "500"))
+METRICS_SQL_TEMPLATES_PATH = os.getenv("METRICS_SQL_TEMPLATES_PATH", "src/tools/plantillas_metricas.json")
+METRICS_CUBE_ENABLED = os.getenv("METRICS_CUBE_ENABLED", "true").lower() == "true"
+METRICS_SQL_MAX_BYTES = int(os.getenv("METRICS_SQL_MAX_BYTES", str(1024 ** 3)))
+METRICS_SQL_TIMEOUT_SECONDS = float(os.getenv("METRICS_SQL_TIMEOUT_SECONDS", "20"))
+METRICS_SQL_MAX_ATTEMPTS = int(os.getenv("METRICS_SQL_MAX_ATTEMPTS", "3"))
+METRICS_RESULT_LIMIT = int(os.getenv("METRICS_RESULT_LIMIT", "10000"))
+METRICS_RESULT_MAX_ROWS = int(os.getenv("METRICS_RESULT_MAX_ROWS", "500"))
+METRICS_RESULT_PROMPT_ROWS = int(os.getenv("METRICS_RESULT_PROMPT_ROWS", "50"))
+METRICS_RESULT_PROMPT_CHARS = int(os.getenv("METRICS_RESULT_PROMPT_CHARS", "6000"))
+
+TIMELINE_RENDER_WORKERS = int(os.getenv("TIMELINE_RENDER_WORKERS", "2"))
+TIMELINE_RENDER_TIMEOUT_SECONDS = float(os.getenv("TIMELINE_RENDER_TIMEOUT_SECONDS", "10"))
+TIMELINE_CACHE_TTL_SECONDS = float(os.getenv("TIMELINE_CACHE_TTL_SECONDS", "3600"))
+TIMELINE_CACHE_MAX_ENTRIES = int(os.getenv("TIMELINE_CACHE_MAX_ENTRIES", "1000"))
+TIMELINE_RENDER_WAIT_SECONDS = float(os.getenv("TIMELINE_RENDER_WAIT_SECONDS", "60"))
@@ -1,18 +1,30 @@
 import os
+import re
 import json
+import time
 import traceback
 from dotenv import load_dotenv
 import vertexai
-from vertexai.generative_models import GenerativeModel, Part
+from vertexai.generative_models import GenerativeModel, Part, Content
 
 load_dotenv()
 GEMINI_CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL")
-from src.config import GCP_PROJECT_ID, LOCATION
+from src.config import (
+    GCP_PROJECT_ID, LOCATION, FANOUT_KB_TIMEOUT_SECONDS, FANOUT_ROLE_TIMEOUT_SECONDS,
+    FANOUT_SENTIMENT_TIMEOUT_SECONDS, TURN_MODE
+)
 from src.services import ticket_manager, ticket_querier, ticket_visualizer
-from src.tools.tool_definitions import all_tools_config
-from src.services.memory_service import get_chat_history, save_chat_history, get_or_create_active_session, set_session_state
-from src.utils.bigquery_client import obtener_rol_usuario, actualizar_feedback_comentario
-from src.services.knowledge_service import search_knowledge_base
+from src.tools.tool_definitions import (
+    all_tools_config, structured_turn_tools_config, CAMPOS_CONTEXTO_TURNO,
+    SENTIMIENTOS_TURNO, INTENCIONES_TURNO
+)
+from src.services.memory_service import abrir_turno
+from src.utils.bigquery_client import obtener_rol_usuario, actualizar_feedback_comentario, iniciar_memo_snapshots
+from src.services.knowledge_service import search_knowledge_base, embedding_consulta
+from src.services.response_cache import buscar_respuesta, guardar_respuesta
+from src.utils.fan_out import lanzar, esperar_resultado, cancelar
+from src.services.sentiment_service import analizar_sentimiento, clasificar_local
+from src.utils import metrics
 
 model = None
 initialized = False
@@ -52,6 +64,15 @@ Eres 'ConnectGPT', un asistente personal y multiagente virtual experto. Tu motor
 - 2. **Solicitud de Feedback:** Inmediatamente después, en una nueva línea, añade la frase para solicitar la valoración.
 """
 
+instrucciones_turno_estructurado = f"""
+**## Contexto del Turno (uso interno) ##**
+- Evalúa tú mismo el sentimiento del usuario ({', '.join(SENTIMIENTOS_TURNO)}) y su intención ({', '.join(INTENCIONES_TURNO)}); aplica las reglas de Manejo de Sentimientos según tu evaluación.
+- Si llamas a una herramienta, informa ambos valores en los argumentos `sentimiento_usuario` e `intencion_usuario`.
+- Si respondes con texto, la PRIMERA línea debe ser exactamente `[[meta {{"sentimiento": "<sentimiento>", "intencion": "<intencion>"}}]]` y luego tu respuesta. Esa línea no se muestra al usuario.
+"""
+
+_META_TURNO = re.compile(r"^\s*\[\[meta\s+(\{.*?\})\]\]\s*", re.DOTALL)
+
 available_tools = {
     "crear_tiquete_helpdesk": ticket_manager.crear_tiquete,
     "consultar_estado_tiquete": ticket_querier.consultar_estado_tiquete,
@@ -69,23 +90,45 @@ def initialize_ai():
     global model, initialized
     if not initialized:
         vertexai.init(project=GCP_PROJECT_ID, location=LOCATION)
-        model = GenerativeModel(GEMINI_CHAT_MODEL, system_instruction=system_prompt, tools=[all_tools_config])
+        if TURN_MODE == "single_call":
+            model = GenerativeModel(GEMINI_CHAT_MODEL, system_instruction=system_prompt + instrucciones_turno_estructurado, tools=[structured_turn_tools_config])
+        else:
+            model = GenerativeModel(GEMINI_CHAT_MODEL, system_instruction=system_prompt, tools=[all_tools_config])
         initialized = True
 
-def analizar_sentimiento(user_message: str) -> str:
-    """Clasifica el sentimiento de un mensaje usando el modelo de chat principal."""
+def extraer_meta_turno(texto: str) -> (str, dict):
+    """Separa la línea `[[meta {...}]]` del modo single_call del texto visible para el usuario."""
+    coincidencia = _META_TURNO.match(texto or "")
+    if not coincidencia:
+        return texto, {}
     try:
-        sentiment_model = GenerativeModel(GEMINI_CHAT_MODEL)
-        prompt = f"""
-        Analiza el sentimiento del siguiente texto y clasifícalo estrictamente como 'positivo', 'negativo' o 'neutro'.
-        Responde únicamente con una de esas tres palabras.
-        Texto: "{user_message}"
-        """
-        response = sentiment_model.generate_content(prompt)
-        return response.text.strip().lower()
-    except Exception as e:
-        print(f"⚠️  Advertencia: No se pudo analizar el sentimiento. {e}")
-        return "neutro"
+        meta = json.loads(coincidencia.group(1))
+    except json.JSONDecodeError:
+        meta = {}
+    return texto[coincidencia.end():], meta
+
+def registrar_contexto_turno(sentimiento: str | None, intencion: str | None, mensaje: str):
+    """
+    Registra en métricas el sentimiento e intención reportados por el modelo. Si el modelo no
+    reportó un sentimiento válido, se usa el clasificador local (léxico) sobre el mensaje.
+    """
+    if sentimiento not in SENTIMIENTOS_TURNO:
+        sentimiento, _ = clasificar_local(mensaje)
+        metrics.incrementar("turno.sentimiento_local")
+    metrics.incrementar(f"turno.sentimiento.{sentimiento}")
+    metrics.incrementar(f"turno.intencion.{intencion if intencion in INTENCIONES_TURNO else 'desconocida'}")
+
+def sin_meta_turno(mensajes: list) -> list:
+    """Quita la línea `[[meta {...}]]` de las respuestas del modelo antes de guardarlas en el historial."""
+    limpios = []
+    for mensaje in mensajes:
+        datos = mensaje.to_dict()
+        if datos.get("role") == "model":
+            for part in datos.get("parts", []):
+                if "text" in part:
+                    part["text"], _ = extraer_meta_turno(part["text"])
+        limpios.append(Content.from_dict(datos))
+    return limpios
 
 def tiene_permiso(rol: str, herramienta: str) -> bool:
     """Verifica si un rol tiene permiso para usar una herramienta."""
@@ -97,112 +140,172 @@ def tiene_permiso(rol: str, herramienta: str) -> bool:
     }
     return herramienta in permisos.get(rol, [])
 
+def _atender_turno(turno, user_message: str, user_email: str, user_display_name: str, inicio_turno: float):
+    """Resuelve un turno ya abierto; `handle_dex_logic` confirma el turno al terminar."""
+    if turno.state == 'AWAITING_FEEDBACK_COMMENT':
+        actualizar_feedback_comentario(turno.feedback_session_id, user_message)
+        turno.fijar_estado(None)
+        return "Muchas gracias por tus comentarios, los tomaré en cuenta para mejorar."
+
+    # Las consultas previas al LLM son independientes: se lanzan juntas y la espera
+    # total es la de la más lenta, no la suma de todas.
+    consultar_kb = len(user_message.split()) > 3 and "estado" not in user_message.lower()
+    futuro_kb = lanzar("kb", search_knowledge_base, user_message) if consultar_kb else None
+    futuro_rol = lanzar("rol", obtener_rol_usuario, user_email)
+    # En modo single_call el sentimiento lo reporta el modelo principal en la misma respuesta
+    # (con el clasificador local como respaldo, ver `registrar_contexto_turno`).
+    futuro_sentimiento = lanzar("sentimiento", analizar_sentimiento, user_message) if TURN_MODE != "single_call" else None
+
+    if futuro_kb:
+        kb_result = esperar_resultado("kb", futuro_kb, FANOUT_KB_TIMEOUT_SECONDS)
+        if kb_result:
+            cancelar(futuro_rol, futuro_sentimiento)
+            answer = kb_result['answer']
+            response_text = (
+                f"{answer}\n\n---\n"
+                f"ℹ️ _Fuente: Knowledge Base Data Connect_\n\n"
+                "¿Resolvió esto tu duda? Si no, por favor describe tu problema con más detalle para crear un tiquete."
+            )
+            return response_text
+
+    print("▶️ No se encontró respuesta en KB, procediendo con el análisis de IA...")
+    user_role, user_department = esperar_resultado("rol", futuro_rol, FANOUT_ROLE_TIMEOUT_SECONDS, ("user", None))
+
+    # Preguntas completas (las mismas que van a la KB) pueden responderse con una respuesta
+    # previa casi idéntica del mismo rol, sin pasar por Gemini. Solo al inicio de la sesión:
+    # con historial, la pregunta puede depender del contexto ("¿y el de ayer?") y la respuesta
+    # no sirve para otros usuarios.
+    vector_pregunta = None
+    if consultar_kb and not turno.tiene_historial:
+        try:
+            vector_pregunta = embedding_consulta(user_message)
+            respuesta_cacheada = buscar_respuesta(vector_pregunta, user_role, user_display_name)
+        except Exception as e:
+            print(f"⚠️  No se pudo consultar la caché de respuestas: {e}")
+            respuesta_cacheada = None
+        if respuesta_cacheada:
+            cancelar(futuro_sentimiento)
+            turno.agregar_mensajes([
+                Content(role="user", parts=[Part.from_text(f"[Mi nombre es {user_display_name}] {user_message}")]),
+                Content(role="model", parts=[Part.from_text(respuesta_cacheada)])
+            ])
+            return respuesta_cacheada
+
+    history = turno.history
+    num_initial_messages = len(history)
+
+    chat = model.start_chat(history=history)
+
+    metrics.incrementar(f"turnos.{TURN_MODE}")
+    if futuro_sentimiento:
+        sentimiento = esperar_resultado("sentimiento", futuro_sentimiento, FANOUT_SENTIMENT_TIMEOUT_SECONDS, "neutro")
+        mensaje_con_contexto = f"[Mi nombre es {user_display_name} y mi sentimiento actual es '{sentimiento}'] {user_message}"
+    else:
+        mensaje_con_contexto = f"[Mi nombre es {user_display_name}] {user_message}"
+    response = chat.send_message(mensaje_con_contexto)
+    metrics.registrar_uso_vertex(response, f"{TURN_MODE}.principal")
+
+    function_call = None
+    for part in response.candidates[0].content.parts:
+        if part.function_call and part.function_call.name:
+            function_call = part.function_call
+            break
+
+    if function_call:
+        tool_name = function_call.name
+
+        if not tiene_permiso(user_role, tool_name):
+            return f"Lo siento, {user_display_name.split(' ')[0]}, tu rol de '{user_role}' no te permite realizar esta acción."
+
+        tool_to_call = available_tools.get(tool_name)
+        if not tool_to_call: raise ValueError(f"Herramienta desconocida: {tool_name}")
+
+        tool_args = {key: value for key, value in function_call.args.items()}
+        if TURN_MODE == "single_call":
+            registrar_contexto_turno(tool_args.get("sentimiento_usuario"), tool_args.get("intencion_usuario"), user_message)
+            for campo in CAMPOS_CONTEXTO_TURNO:
+                tool_args.pop(campo, None)
+
+        tool_args["solicitante_email"] = user_email
+        tool_args["solicitante_nombre"] = user_display_name
+        tool_args["solicitante_rol"] = user_role
+        tool_args["solicitante_departamento"] = user_department
+
+        if tool_name == "crear_tiquete_helpdesk":
+             tool_args.pop("solicitante", None)
+             tool_args.pop("nombre_solicitante", None)
+             tool_args["solicitante"] = user_email
+             tool_args["nombre_solicitante"] = user_display_name
+
+        tool_response_text = tool_to_call(**tool_args)
+
+        if tool_name == "visualizar_flujo_tiquete":
+            try:
+                data = json.loads(tool_response_text)
+                if "error" in data: return data["error"]
+
+                return {
+                    "cardsV2": [{
+                        "cardId": f"flow_card_{data['ticketId']}", "card": { "header": { "title": f"Línea de Tiempo del Tiquete {data['ticketId']}", "subtitle": "Aquí tienes el historial visual de tu solicitud.", "imageUrl": "https://i.ibb.co/L1J50f1/timeline-icon.png", "imageType": "CIRCLE" }, "sections": [{"widgets": [{"image": { "imageUrl": data['imageUrl'] }}]}] }
+                    }]
+                }
+            except (json.JSONDecodeError, KeyError) as e:
+                print(f"🔴 Error al procesar la respuesta de la imagen: {e}")
+                return "Hubo un error inesperado al procesar la visualización del tiquete."
+
+        if tool_name == "agendar_reunion_gcalendar":
+            try:
+                data = json.loads(tool_response_text)
+                if "error" in data: return data["error"]
+
+                return {
+                    "cardsV2": [{
+                        "cardId": "calendar_card", "card": { "header": { "title": "Agendar Reunión de Seguimiento", "subtitle": f"Para: {', '.join(data['invitados'])}", "imageType": "CIRCLE", "imageUrl": "https://i.ibb.co/VvfTff5/calendar-icon.png" }, "sections": [{"widgets": [{"buttonList": {"buttons": [{"text": "Buscar Horario en G-Calendar", "onClick": {"openLink": { "url": data['url'] }}}]}}]}] }
+                    }]
+                }
+            except (json.JSONDecodeError, KeyError) as e:
+                print(f"🔴 Error al procesar el enlace de calendario: {e}")
+                return "Hubo un error inesperado al generar el enlace de la reunión."
+
+        final_response = chat.send_message(
+            Part.from_function_response(name=tool_name, response={"content": tool_response_text})
+        )
+        metrics.registrar_uso_vertex(final_response, f"{TURN_MODE}.respuesta_herramienta")
+        final_text = final_response.text
+    else:
+        final_text = response.text
+
+    if TURN_MODE == "single_call":
+        final_text, meta = extraer_meta_turno(final_text)
+        if not function_call:
+            registrar_contexto_turno(meta.get("sentimiento"), meta.get("intencion"), user_message)
+
+    if vector_pregunta is not None and not function_call:
+        guardar_respuesta(vector_pregunta, user_role, user_display_name, final_text, (time.perf_counter() - inicio_turno) * 1000)
+
+    # El historial guarda el mismo texto que ve el usuario, sin la línea `[[meta ...]]`, igual que
+    # los turnos respondidos desde la caché.
+    turno.agregar_mensajes(sin_meta_turno(chat.history[num_initial_messages:]))
+    return final_text
+
 def handle_dex_logic(user_message: str, user_email: str, user_display_name: str, user_id: str):
     """
     Maneja la lógica de la conversación, con análisis de sentimiento y estado de feedback.
     """
     try:
+        inicio_turno = time.perf_counter()
         initialize_ai()
+        iniciar_memo_snapshots()
         
-        session_id, session_state = get_or_create_active_session(user_id)
-        if not session_id:
+        # Sesión e historial en una sola lectura; todas las escrituras del turno salen juntas en `confirmar()`,
+        # que se ejecuta al salir por cualquier camino (incluidas las tarjetas y los permisos denegados).
+        turno = abrir_turno(user_id)
+        if not turno:
             return "Lo siento, no pude iniciar una sesión de chat para ti."
-
-        if session_state == 'AWAITING_FEEDBACK_COMMENT':
-            actualizar_feedback_comentario(session_id, user_message)
-            set_session_state(user_id, None)
-            return "Muchas gracias por tus comentarios, los tomaré en cuenta para mejorar."
-
-        if len(user_message.split()) > 3 and "estado" not in user_message.lower():
-            kb_result = search_knowledge_base(user_message)
-            if kb_result:
-                answer = kb_result['answer']
-                response_text = (
-                    f"{answer}\n\n---\n"
-                    f"ℹ️ _Fuente: Knowledge Base Data Connect_\n\n"
-                    "¿Resolvió esto tu duda? Si no, por favor describe tu problema con más detalle para crear un tiquete."
-                )
-                return response_text
-
-        print("▶️ No se encontró respuesta en KB, procediendo con el análisis de IA...")
-        user_role, user_department = obtener_rol_usuario(user_email)
-        
-        history = get_chat_history(session_id)
-        num_initial_messages = len(history)
-        
-        chat = model.start_chat(history=history)
-        
-        sentimiento = analizar_sentimiento(user_message)
-        mensaje_con_contexto = f"[Mi nombre es {user_display_name} y mi sentimiento actual es '{sentimiento}'] {user_message}"
-        response = chat.send_message(mensaje_con_contexto)
-        
-        function_call = None
-        for part in response.candidates[0].content.parts:
-            if part.function_call and part.function_call.name:
-                function_call = part.function_call
-                break
-        
-        if function_call:
-            tool_name = function_call.name
-            
-            if not tiene_permiso(user_role, tool_name):
-                return f"Lo siento, {user_display_name.split(' ')[0]}, tu rol de '{user_role}' no te permite realizar esta acción."
-
-            tool_to_call = available_tools.get(tool_name)
-            if not tool_to_call: raise ValueError(f"Herramienta desconocida: {tool_name}")
-
-            tool_args = {key: value for key, value in function_call.args.items()}
-            
-            tool_args["solicitante_email"] = user_email
-            tool_args["solicitante_nombre"] = user_display_name
-            tool_args["solicitante_rol"] = user_role
-            tool_args["solicitante_departamento"] = user_department
-            
-            if tool_name == "crear_tiquete_helpdesk":
-                 tool_args.pop("solicitante", None)
-                 tool_args.pop("nombre_solicitante", None)
-                 tool_args["solicitante"] = user_email
-                 tool_args["nombre_solicitante"] = user_display_name
-
-            tool_response_text = tool_to_call(**tool_args)
-            
-            if tool_name == "visualizar_flujo_tiquete":
-                try:
-                    data = json.loads(tool_response_text)
-                    if "error" in data: return data["error"]
-                    
-                    return {
-                        "cardsV2": [{
-                            "cardId": f"flow_card_{data['ticketId']}", "card": { "header": { "title": f"Línea de Tiempo del Tiquete {data['ticketId']}", "subtitle": "Aquí tienes el historial visual de tu solicitud.", "imageUrl": "https://i.ibb.co/L1J50f1/timeline-icon.png", "imageType": "CIRCLE" }, "sections": [{"widgets": [{"image": { "imageUrl": data['imageUrl'] }}]}] }
-                        }]
-                    }
-                except (json.JSONDecodeError, KeyError) as e:
-                    print(f"🔴 Error al procesar la respuesta de la imagen: {e}")
-                    return "Hubo un error inesperado al procesar la visualización del tiquete."
-
-            if tool_name == "agendar_reunion_gcalendar":
-                try:
-                    data = json.loads(tool_response_text)
-                    if "error" in data: return data["error"]
-
-                    return {
-                        "cardsV2": [{
-                            "cardId": "calendar_card", "card": { "header": { "title": "Agendar Reunión de Seguimiento", "subtitle": f"Para: {', '.join(data['invitados'])}", "imageType": "CIRCLE", "imageUrl": "https://i.ibb.co/VvfTff5/calendar-icon.png" }, "sections": [{"widgets": [{"buttonList": {"buttons": [{"text": "Buscar Horario en G-Calendar", "onClick": {"openLink": { "url": data['url'] }}}]}}]}] }
-                        }]
-                    }
-                except (json.JSONDecodeError, KeyError) as e:
-                    print(f"🔴 Error al procesar el enlace de calendario: {e}")
-                    return "Hubo un error inesperado al generar el enlace de la reunión."
-
-            final_response = chat.send_message(
-                Part.from_function_response(name=tool_name, response={"content": tool_response_text})
-            )
-            final_text = final_response.text
-        else:
-            final_text = response.text
-        
-        save_chat_history(session_id, user_id, chat.history, num_initial_messages)
-        return final_text
+        try:
+            return _atender_turno(turno, user_message, user_email, user_display_name, inicio_turno)
+        finally:
+            turno.confirmar()
 
     except Exception as e:
         print(json.dumps({"log_name": "HandleDexLogic_Error", "error": str(e), "traceback": traceback.format_exc()}))
@@ -1,9 +1,17 @@
 import os
+import threading
 import vertexai
 from vertexai.language_models import TextEmbeddingModel
 from google.cloud import aiplatform
 from google.cloud import storage
 from dotenv import load_dotenv
+from src.config import (
+    KB_DOC_CACHE_MAX_BYTES, KB_DOC_REVALIDATE_SECONDS,
+    KB_SEARCH_BACKEND, KB_VECTOR_INDEX_PATH, KB_VECTOR_HNSW_MIN_DOCS
+)
+from src.utils.embedding_cache import obtener_embedding
+from src.utils.document_cache import DocumentCache
+from src.utils.vector_index import IndiceVectorial, ARCHIVO_EMBEDDINGS, ARCHIVO_IDS
 
 load_dotenv()
 
@@ -13,6 +21,9 @@ KB_BUCKET_NAME = os.getenv("KNOWLEDGE_BASE_BUCKET")
 VECTOR_SEARCH_ENDPOINT_ID = os.getenv("VECTOR_SEARCH_ENDPOINT_ID")
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME")
 DEPLOYED_INDEX_ID = os.getenv("DEPLOYED_INDEX_ID")
+KB_PREFIX = "fuentes/"
+UMBRAL_SIMILITUD = 0.75
+DIRECTORIO_INDICE_DESCARGADO = "/tmp/kb_index_descargado"
 
 try:
     vertexai.init(project=GCP_PROJECT_ID, location=LOCATION)
@@ -26,40 +37,102 @@ try:
         index_endpoint = None
 except Exception as e:
     print(f"⚠️  Advertencia al inicializar los servicios de IA: {e}")
-    index_endpoint = None
+    embedding_model = storage_client = index_endpoint = None
+
+documentos_kb = DocumentCache(
+    "kb_documentos", lambda: storage_client.bucket(KB_BUCKET_NAME),
+    max_bytes=KB_DOC_CACHE_MAX_BYTES, revalidar_segundos=KB_DOC_REVALIDATE_SECONDS
+)
+
+
+def precargar_documentos_kb(en_segundo_plano: bool = True):
+    """Carga en memoria todos los documentos de `fuentes/` para que las respuestas de la KB no toquen GCS."""
+    if not KB_BUCKET_NAME:
+        return
+
+    def precargar():
+        try:
+            total = documentos_kb.precargar(KB_PREFIX)
+            print(f"✅ {total} documentos de la base de conocimiento precargados en memoria.")
+        except Exception as e:
+            print(f"⚠️  No se pudieron precargar los documentos de la base de conocimiento: {e}")
+
+    if en_segundo_plano:
+        threading.Thread(target=precargar, name="precarga-kb", daemon=True).start()
+    else:
+        precargar()
+
+
+_indice_local = None
+_indice_lock = threading.Lock()
+
+
+def cargar_indice_local(forzar: bool = False) -> IndiceVectorial:
+    """
+    Carga el snapshot de embeddings de la KB (KB_VECTOR_INDEX_PATH, local o gs://bucket/ruta)
+    para el modo KB_SEARCH_BACKEND=local. Se carga una vez por proceso.
+    """
+    global _indice_local
+    with _indice_lock:
+        if _indice_local is not None and not forzar:
+            return _indice_local
+        directorio = KB_VECTOR_INDEX_PATH
+        if directorio.startswith("gs://"):
+            bucket_nombre, _, prefijo = directorio[len("gs://"):].partition("/")
+            bucket = storage_client.bucket(bucket_nombre)
+            os.makedirs(DIRECTORIO_INDICE_DESCARGADO, exist_ok=True)
+            for archivo in (ARCHIVO_EMBEDDINGS, ARCHIVO_IDS):
+                bucket.blob(f"{prefijo.rstrip('/')}/{archivo}").download_to_filename(os.path.join(DIRECTORIO_INDICE_DESCARGADO, archivo))
+            directorio = DIRECTORIO_INDICE_DESCARGADO
+        _indice_local = IndiceVectorial.cargar(directorio, min_docs_hnsw=KB_VECTOR_HNSW_MIN_DOCS)
+        print(f"✅ Índice vectorial local cargado: {len(_indice_local)} documentos.")
+        return _indice_local
+
+
+def _buscar_vecino(query_embedding: list) -> tuple[str, float] | None:
+    """Devuelve (nombre de archivo, similitud coseno) del documento más cercano."""
+    if KB_SEARCH_BACKEND == "local":
+        resultados = cargar_indice_local().buscar(query_embedding, k=1)
+        return resultados[0] if resultados else None
+
+    response = index_endpoint.find_neighbors(
+        deployed_index_id=DEPLOYED_INDEX_ID,
+        queries=[query_embedding],
+        num_neighbors=1
+    )
+    if response and response[0]:
+        match = response[0][0]
+        return match.id, 1 - match.distance
+    return None
+
+
+def embedding_consulta(texto: str):
+    """Embedding (float32) de una consulta del usuario, a través de la caché de embeddings."""
+    return obtener_embedding(texto, EMBEDDING_MODEL_NAME, lambda t: embedding_model.get_embeddings([t])[0].values)
 
 
 def search_knowledge_base(user_query: str) -> dict | None:
     """
     Busca en la base de conocimiento usando búsqueda semántica para encontrar una respuesta relevante.
     """
-    if not all([KB_BUCKET_NAME, index_endpoint, DEPLOYED_INDEX_ID]):
+    requeridos = [KB_BUCKET_NAME] if KB_SEARCH_BACKEND == "local" else [KB_BUCKET_NAME, index_endpoint, DEPLOYED_INDEX_ID]
+    if not all(requeridos):
         print("⚠️ Advertencia: Faltan variables de configuración para la base de conocimiento. Saltando búsqueda.")
         return None
 
     try:
         print(f"▶️  Buscando en la base de conocimiento para: '{user_query}'")
-        query_embedding = embedding_model.get_embeddings([user_query])[0].values
-        
-        response = index_endpoint.find_neighbors(
-            deployed_index_id=DEPLOYED_INDEX_ID,
-            queries=[query_embedding],
-            num_neighbors=1
-        )
+        query_embedding = embedding_consulta(user_query).tolist()
         
-        if response and response[0]:
-            match = response[0][0]
-            file_name = match.id
-            similarity_score = 1 - match.distance
+        vecino = _buscar_vecino(query_embedding)
+        if vecino:
+            file_name, similarity_score = vecino
             
             print(f"✅ Coincidencia encontrada: '{file_name}' con una similitud de {similarity_score:.2%}")
 
-            if similarity_score > 0.75:
-                bucket = storage_client.bucket(KB_BUCKET_NAME)
-                blob = bucket.blob(f"fuentes/{file_name}")
-                
-                if blob.exists():
-                    answer_content = blob.download_as_text()
+            if similarity_score > UMBRAL_SIMILITUD:
+                answer_content = documentos_kb.obtener(f"{KB_PREFIX}{file_name}")
+                if answer_content is not None:
                     return {"answer": answer_content, "source": "Knowledge Base - Data Engineering Connect"}
 
         print("ℹ️  No se encontraron resultados suficientemente relevantes en la base de conocimiento.")
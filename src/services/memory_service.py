@@ -1,11 +1,41 @@
+import os
+import json
+import threading
+from contextvars import ContextVar
 from google.cloud import firestore
-from vertexai.generative_models import Content
+from vertexai.generative_models import Content, GenerativeModel, Part
 from datetime import datetime, timedelta, timezone
 import uuid
+from src.config import (
+    HISTORY_RECENT_TURNS, HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_MIN_PENDING, HISTORY_TAIL_MESSAGES,
+    SESSION_CACHE_MAX_ENTRIES
+)
+from src.utils import metrics
+from src.utils.fan_out import lanzar
+from src.utils.cache import TTLCache
 
 db = firestore.Client()
 HISTORY_COLLECTION = "chat_histories"
+MESSAGES_SUBCOLLECTION = "mensajes"
 SESSION_COLLECTION = "active_sessions"
+FORMATO_HISTORIAL = "mensajes_v2"
+GEMINI_CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL")
+PREFIJO_RESUMEN = "[Resumen de la conversación anterior]"
+
+_resumenes_en_curso = set()
+_resumenes_lock = threading.Lock()
+
+# Última sesión conocida de cada usuario en esta instancia: permite leer sesión e historial
+# en una sola llamada `get_all` sin esperar primero al documento de sesión.
+_sesiones_conocidas = TTLCache("sesiones_conocidas", 24 * 3600, SESSION_CACHE_MAX_ENTRIES)
+
+# Turno atendido por la solicitud en curso; main.py lo usa para armar la tarjeta de valoración.
+_turno_solicitud = ContextVar("turno_chat", default=None)
+
+def _round_trip(tipo: str):
+    """Cuenta un viaje de ida y vuelta a Firestore ('lectura' o 'escritura')."""
+    metrics.incrementar("firestore.round_trips")
+    metrics.incrementar(f"firestore.round_trips.{tipo}")
 
 def _get_clean_user_id(user_id_full: str) -> str:
     """Extrae el ID numérico de la ruta 'users/12345'."""
@@ -13,85 +43,261 @@ def _get_clean_user_id(user_id_full: str) -> str:
         return None
     return user_id_full.split('/')[-1]
 
-def get_or_create_active_session(user_id_full: str) -> (str, str):
+def set_session_state(user_id_full: str, state: str | None, feedback_session_id: str = None):
     """
-    Obtiene la sesión activa de un usuario o crea una nueva si la anterior ha expirado (más de 24h).
+    Actualiza el estado de la sesión activa de un usuario con una sola escritura, sin leerla.
+    `feedback_session_id` indica a qué sesión pertenece la valoración que espera comentario.
     """
     user_id = _get_clean_user_id(user_id_full)
-    if not user_id: return None
+    if not user_id: return
 
+    datos = {"state": state, "last_activity": datetime.now(timezone.utc)}
+    if feedback_session_id:
+        datos["feedback_session_id"] = feedback_session_id
     session_doc_ref = db.collection(SESSION_COLLECTION).document(user_id)
-    session_doc = session_doc_ref.get()
-    now = datetime.now(timezone.utc)
+    _round_trip("escritura")
+    session_doc_ref.set(datos, merge=True)
+    print(f"▶️ Estado de la sesión para {user_id} actualizado a: {state}")
 
-    if session_doc.exists:
-        session_data = session_doc.to_dict()
-        last_activity = session_data.get("last_activity")
-        
-        if last_activity and (now - last_activity > timedelta(hours=24)):
-            print(f"▶️  La sesión para {user_id} ha expirado. Creando una nueva sesión.")
-            new_session_id = str(uuid.uuid4())
-            session_doc_ref.set({"active_session_id": new_session_id, "last_activity": now})
-            return new_session_id, None
-        else:
-            return session_data.get("active_session_id"), session_data.get("state")
-    else:
-        print(f"▶️  Creando primera sesión para el usuario {user_id}.")
-        new_session_id = str(uuid.uuid4())
-        session_doc_ref.set({"active_session_id": new_session_id, "last_activity": now})
-        return new_session_id, None
+def _id_mensaje(seq: int) -> str:
+    return f"{seq:08d}"
 
-def set_session_state(user_id_full: str, state: str | None):
-    """Actualiza el estado de la sesión activa de un usuario."""
-    user_id = _get_clean_user_id(user_id_full)
-    if not user_id: return
+def _estimar_tokens(item: dict) -> int:
+    """Estimación barata de tokens (~4 caracteres por token) de un mensaje guardado."""
+    return max(1, len(json.dumps(item.get("parts", []), ensure_ascii=False, default=str)) // 4)
 
-    session_doc_ref = db.collection(SESSION_COLLECTION).document(user_id)
-    session_doc_ref.set({"state": state, "last_activity": datetime.now(timezone.utc)}, merge=True)
-    print(f"▶️ Estado de la sesión para {user_id} actualizado a: {state}")
+def migrar_historial_sesion(session_id: str) -> int:
+    """
+    Pasa un historial del formato antiguo (arreglo `history` en un solo documento) a la
+    subcolección `mensajes`, un documento por mensaje con `seq` creciente. Es idempotente:
+    los IDs de documento se derivan de la posición. Devuelve cuántos mensajes migró.
+    """
+    doc_ref = db.collection(HISTORY_COLLECTION).document(session_id)
+    datos = doc_ref.get().to_dict() or {}
+    items = datos.get("history")
+    if items is None or datos.get("formato") == FORMATO_HISTORIAL:
+        return 0
+
+    mensajes_ref = doc_ref.collection(MESSAGES_SUBCOLLECTION)
+    for inicio in range(0, len(items), 400):
+        batch = db.batch()
+        for seq, item in enumerate(items[inicio:inicio + 400], start=inicio):
+            batch.set(mensajes_ref.document(_id_mensaje(seq)), {**item, "seq": seq})
+        batch.commit()
+    doc_ref.set({
+        "formato": FORMATO_HISTORIAL,
+        "total_mensajes": len(items),
+        "tokens_totales": sum(_estimar_tokens(item) for item in items),
+        "history": firestore.DELETE_FIELD
+    }, merge=True)
+    return len(items)
 
-def save_chat_history(session_id: str, user_id_full: str, history: list, num_existing: int):
+def _ventana_guardada(datos: dict) -> tuple[list, int] | None:
     """
-    Guarda los nuevos mensajes en Firestore usando el formato oficial de la librería
-    y añadiendo un timestamp.
+    Copia de la ventana de últimos turnos guardada en el documento padre y el `seq` de su primer
+    mensaje. Solo es válida si termina en `total_mensajes`; None si hay que consultar la subcolección.
     """
-    if not session_id: return
-    
-    history_doc_ref = db.collection(HISTORY_COLLECTION).document(session_id)
-    session_doc_ref = db.collection(SESSION_COLLECTION).document(_get_clean_user_id(user_id_full))
-    now = datetime.now(timezone.utc)
-    
-    new_messages = history[num_existing:]
-    if not new_messages: return
+    total = datos.get("total_mensajes", 0)
+    if total == 0:
+        return [], 0
+    ventana, desde = datos.get("ventana"), datos.get("ventana_desde")
+    if ventana is None or desde is None or desde + len(ventana) != total:
+        return None
+    return ventana, desde
+
+def _datos_padre(datos: dict, items_nuevos: list, user_id: str, cola: tuple[list, int] | None = None) -> dict:
+    """
+    Campos del documento padre tras añadir `items_nuevos`. `total_mensajes` es el puntero al final
+    de la subcolección y `ventana` una copia acotada (HISTORY_RECENT_TURNS turnos, HISTORY_TOKEN_BUDGET
+    tokens) de los últimos mensajes, para construir el historial sin consultar la subcolección.
+    `cola` son los últimos mensajes ya leídos, por si el padre aún no tiene una ventana válida.
+    """
+    total = datos.get("total_mensajes", 0)
+    padre = {
+        "user_id": user_id,
+        "formato": FORMATO_HISTORIAL,
+        "total_mensajes": total + len(items_nuevos),
+        "tokens_totales": datos.get("tokens_totales", 0) + sum(_estimar_tokens(item) for item in items_nuevos),
+    }
+    previa = _ventana_guardada(datos)
+    if previa is None and cola is not None and cola[1] + len(cola[0]) == total:
+        previa = cola
+    if previa is not None:
+        items, desde = previa[0] + items_nuevos, previa[1]
+        inicio = _inicio_ventana(items)
+        ventana = items[inicio:]
+        # Un mensaje que por sí solo excede el presupuesto no se copia: se consultará la subcolección.
+        if len(ventana) <= HISTORY_TAIL_MESSAGES and sum(_estimar_tokens(item) for item in ventana) <= HISTORY_TOKEN_BUDGET:
+            padre["ventana"], padre["ventana_desde"] = ventana, desde + inicio
+    if "ventana" in datos and "ventana" not in padre:
+        padre["ventana"] = padre["ventana_desde"] = firestore.DELETE_FIELD
+    if "cola" in datos:
+        # Historiales que aún guardan la copia de los últimos mensajes de la versión anterior.
+        padre["cola"] = firestore.DELETE_FIELD
+    return padre
 
+def _preparar_items(new_messages: list, now: datetime) -> list:
     items_to_save = [msg.to_dict() for msg in new_messages]
-    
     for item in items_to_save:
         item['timestamp'] = now
+    return items_to_save
+
+def _guardar_con_transaccion(session_id: str, user_id_full: str, items_to_save: list, actualizacion_sesion: dict) -> int:
+    """Añade los mensajes en una transacción que relee el historial. Devuelve el `seq` del primero."""
+    history_doc_ref = db.collection(HISTORY_COLLECTION).document(session_id)
+    session_doc_ref = db.collection(SESSION_COLLECTION).document(_get_clean_user_id(user_id_full))
 
     @firestore.transactional
     def update_in_transaction(transaction, history_ref, session_ref):
-        transaction.set(history_ref, {"history": firestore.ArrayUnion(items_to_save), "user_id": _get_clean_user_id(user_id_full)}, merge=True)
-        transaction.update(session_ref, {"last_activity": now})
+        datos = history_ref.get(transaction=transaction).to_dict() or {}
+        if "history" in datos and datos.get("formato") != FORMATO_HISTORIAL:
+            raise RuntimeError("historial en formato antiguo")
+        total = datos.get("total_mensajes", 0)
+        mensajes_ref = history_ref.collection(MESSAGES_SUBCOLLECTION)
+        for seq, item in enumerate(items_to_save, start=total):
+            transaction.set(mensajes_ref.document(_id_mensaje(seq)), {**item, "seq": seq})
+        transaction.set(history_ref, _datos_padre(datos, items_to_save, _get_clean_user_id(user_id_full)), merge=True)
+        transaction.set(session_ref, actualizacion_sesion, merge=True)
+        return total
+
+    try:
+        _round_trip("lectura")
+        _round_trip("escritura")
+        return update_in_transaction(db.transaction(), history_doc_ref, session_doc_ref)
+    except RuntimeError:
+        # Sesión anterior a la paginación: se migra y se reintenta.
+        migrar_historial_sesion(session_id)
+        _round_trip("lectura")
+        _round_trip("escritura")
+        return update_in_transaction(db.transaction(), history_doc_ref, session_doc_ref)
 
-    transaction = db.transaction()
-    update_in_transaction(transaction, history_doc_ref, session_doc_ref)
+def _leer_mensajes(history_ref, desde: int, hasta: int) -> list:
+    """Mensajes con `seq` en [desde, hasta), en orden."""
+    consulta = (history_ref.collection(MESSAGES_SUBCOLLECTION)
+                .where(filter=firestore.FieldFilter("seq", ">=", desde))
+                .where(filter=firestore.FieldFilter("seq", "<", hasta))
+                .order_by("seq"))
+    return [doc.to_dict() for doc in consulta.stream()]
 
-def get_chat_history(session_id: str) -> list:
+def _leer_cola(history_ref, datos: dict) -> (list, int):
     """
-    Recupera el historial y lo prepara para la librería, eliminando los campos extra.
+    Devuelve los últimos mensajes en orden y la posición (`seq`) del primero. Se usa la ventana
+    guardada en el documento padre si está al día; si no, se consultan los últimos
+    HISTORY_TAIL_MESSAGES en la subcolección a partir del puntero `total_mensajes`.
+    Los historiales aún no migrados se leen del arreglo `history`.
     """
-    if not session_id: return []
-    
-    doc_ref = db.collection(HISTORY_COLLECTION).document(session_id)
-    doc = doc_ref.get()
-    if not doc.exists:
-        return []
+    if datos.get("formato") != FORMATO_HISTORIAL:
+        items = datos.get("history", [])
+        desplazamiento = max(len(items) - HISTORY_TAIL_MESSAGES, 0)
+        return items[desplazamiento:], desplazamiento
+    guardada = _ventana_guardada(datos)
+    if guardada is not None:
+        metrics.incrementar("historial.ventana_guardada")
+        return guardada
+    total = datos.get("total_mensajes", 0)
+    desplazamiento = max(total - HISTORY_TAIL_MESSAGES, 0)
+    _round_trip("lectura")
+    return _leer_mensajes(history_ref, desplazamiento, total), desplazamiento
+
+def _es_inicio_de_turno(item: dict) -> bool:
+    """Un turno empieza con un mensaje de texto del usuario (no con la respuesta de una herramienta)."""
+    return item.get("role") == "user" and any("text" in part for part in item.get("parts", []))
+
+def _inicio_ventana(items: list) -> int:
+    """
+    Índice desde el que se conservan los mensajes literales: como máximo HISTORY_RECENT_TURNS
+    turnos y HISTORY_TOKEN_BUDGET tokens estimados, cortando siempre al inicio de un turno
+    para no separar una llamada a herramienta de su respuesta.
+    """
+    inicio, turnos, tokens = len(items), 0, 0
+    for i in range(len(items) - 1, -1, -1):
+        tokens += _estimar_tokens(items[i])
+        if tokens > HISTORY_TOKEN_BUDGET and inicio < len(items):
+            break
+        if _es_inicio_de_turno(items[i]):
+            turnos += 1
+            inicio = i
+            if turnos >= HISTORY_RECENT_TURNS:
+                break
+    return inicio
+
+def _texto_para_resumen(items: list) -> str:
+    lineas = []
+    for item in items:
+        for part in item.get("parts", []):
+            if "text" in part:
+                lineas.append(f"{item.get('role')}: {part['text']}")
+            elif "function_call" in part:
+                lineas.append(f"{item.get('role')}: [llamó a la herramienta {part['function_call'].get('name')} con {json.dumps(part['function_call'].get('args', {}), ensure_ascii=False)}]")
+            elif "function_response" in part:
+                respuesta = json.dumps(part["function_response"].get("response", {}), ensure_ascii=False, default=str)
+                lineas.append(f"herramienta: {respuesta[:500]}")
+    return "\n".join(lineas)
+
+def actualizar_resumen_historial(session_id: str):
+    """
+    Incorpora al resumen acumulado los mensajes que quedaron fuera de la ventana y lo guarda
+    junto al historial (`resumen`, `resumen_hasta`). Se ejecuta en segundo plano.
+    """
+    try:
+        doc_ref = db.collection(HISTORY_COLLECTION).document(session_id)
+        datos = doc_ref.get().to_dict() or {}
+        cola, desplazamiento = _leer_cola(doc_ref, datos)
+        resumen_hasta = datos.get("resumen_hasta", 0)
+        hasta = desplazamiento + _inicio_ventana(cola)
+        if hasta <= resumen_hasta:
+            return
+
+        if datos.get("formato") == FORMATO_HISTORIAL:
+            pendientes = _leer_mensajes(doc_ref, resumen_hasta, hasta)
+        else:
+            pendientes = datos.get("history", [])[resumen_hasta:hasta]
+        prompt = (
+            "Actualiza el resumen de una conversación de soporte entre un usuario y el asistente Dex. "
+            "Conserva IDs de tiquetes, decisiones, datos aportados por el usuario y pendientes; omite saludos. "
+            "Responde solo con el resumen, en español y en menos de 200 palabras.\n\n"
+            f"Resumen actual:\n{datos.get('resumen') or '(vacío)'}\n\n"
+            f"Mensajes nuevos:\n{_texto_para_resumen(pendientes)}"
+        )
+        response = GenerativeModel(GEMINI_CHAT_MODEL).generate_content(prompt)
+        metrics.registrar_uso_vertex(response, "resumen_historial")
+        doc_ref.set({"resumen": response.text.strip(), "resumen_hasta": hasta}, merge=True)
+        print(f"✅ Resumen del historial {session_id} actualizado hasta el mensaje {hasta}.")
+    except Exception as e:
+        print(f"⚠️  No se pudo actualizar el resumen del historial {session_id}: {e}")
+    finally:
+        with _resumenes_lock:
+            _resumenes_en_curso.discard(session_id)
+
+def _programar_resumen(session_id: str):
+    with _resumenes_lock:
+        if session_id in _resumenes_en_curso:
+            return
+        _resumenes_en_curso.add(session_id)
+    lanzar("resumen_historial", actualizar_resumen_historial, session_id)
+
+def _construir_historial(session_id: str, datos: dict, cola: list, desplazamiento: int) -> list:
+    inicio = _inicio_ventana(cola)
+    resumen, resumen_hasta = datos.get("resumen"), datos.get("resumen_hasta", 0)
 
-    history_from_db = doc.to_dict().get("history", [])
+    if desplazamiento + inicio - resumen_hasta >= HISTORY_SUMMARY_MIN_PENDING:
+        _programar_resumen(session_id)
+
+    if datos.get("formato") == FORMATO_HISTORIAL:
+        tokens_totales = datos.get("tokens_totales", 0)
+    else:
+        tokens_totales = sum(_estimar_tokens(item) for item in datos.get("history", []))
+    tokens_ventana = sum(_estimar_tokens(item) for item in cola[inicio:])
     reconstructed_history = []
+    if desplazamiento + inicio > 0 and resumen:
+        # Un par usuario/modelo mantiene la alternancia de roles que espera Gemini.
+        reconstructed_history.append(Content(role="user", parts=[Part.from_text(f"{PREFIJO_RESUMEN} {resumen}")]))
+        reconstructed_history.append(Content(role="model", parts=[Part.from_text("Entendido, tengo en cuenta ese contexto.")]))
+        tokens_ventana += len(resumen) // 4
+    metrics.incrementar("historial.tokens_enviados", tokens_ventana)
+    metrics.incrementar("historial.tokens_ahorrados", max(tokens_totales - tokens_ventana, 0))
     
-    for item in history_from_db:
+    for item in cola[inicio:]:
         clean_item = {
             "role": item.get("role"),
             "parts": item.get("parts", [])
@@ -100,4 +306,146 @@ def get_chat_history(session_id: str) -> list:
         if clean_item["parts"]:
             reconstructed_history.append(Content.from_dict(clean_item))
             
-    return reconstructed_history
\ No newline at end of file
+    return reconstructed_history
+
+class TurnoMemoria:
+    """
+    Acceso a Firestore de un turno de chat: `abrir_turno` lee sesión y documento del historial
+    en una sola llamada (el documento trae la ventana de últimos turnos) y `confirmar()` escribe en un solo lote los mensajes nuevos junto con los cambios
+    de la sesión (creación, estado y última actividad).
+    """
+
+    def __init__(self, user_id_full: str, session_id: str, state: str | None, datos_historial: dict | None,
+                 actualizacion_sesion: dict, feedback_session_id: str = None):
+        self.user_id_full = user_id_full
+        self.session_id = session_id
+        self.state = state
+        self.feedback_session_id = feedback_session_id or session_id
+        self._datos_historial = datos_historial
+        self._actualizacion_sesion = actualizacion_sesion
+        self._items_nuevos = []
+        self._historial = None
+        self._cola = None
+        # ID (en la subcolección `mensajes`) del último mensaje guardado por `confirmar()`.
+        self.id_ultimo_mensaje = None
+
+    @property
+    def history(self) -> list:
+        """Historial listo para `model.start_chat` (ventana de últimos turnos + resumen)."""
+        if self._historial is None:
+            if self._datos_historial is None:
+                self._historial = []
+            else:
+                history_ref = db.collection(HISTORY_COLLECTION).document(self.session_id)
+                self._cola = _leer_cola(history_ref, self._datos_historial)
+                self._historial = _construir_historial(self.session_id, self._datos_historial, *self._cola)
+        return self._historial
+
+    @property
+    def tiene_historial(self) -> bool:
+        """Si la sesión ya tiene mensajes guardados, sin leer la subcolección."""
+        datos = self._datos_historial or {}
+        return bool(datos.get("total_mensajes") or datos.get("history"))
+
+    def fijar_estado(self, state: str | None):
+        self.state = state
+        self._actualizacion_sesion["state"] = state
+
+    def agregar_mensajes(self, mensajes: list):
+        self._items_nuevos.extend(_preparar_items(mensajes, datetime.now(timezone.utc)))
+
+    def confirmar(self):
+        """Escribe lo pendiente del turno en un único commit. Sin cambios pendientes no escribe nada."""
+        if not self._items_nuevos and not self._actualizacion_sesion:
+            return
+        now = datetime.now(timezone.utc)
+        user_id = _get_clean_user_id(self.user_id_full)
+        actualizacion_sesion = {**self._actualizacion_sesion, "last_activity": now}
+        session_ref = db.collection(SESSION_COLLECTION).document(user_id)
+
+        datos = self._datos_historial or {}
+        inicio = None
+        if not self._items_nuevos:
+            _round_trip("escritura")
+            session_ref.set(actualizacion_sesion, merge=True)
+        elif "history" in datos and datos.get("formato") != FORMATO_HISTORIAL:
+            inicio = _guardar_con_transaccion(self.session_id, self.user_id_full, self._items_nuevos, actualizacion_sesion)
+        else:
+            from google.api_core.exceptions import AlreadyExists, Conflict, NotFound
+            history_ref = db.collection(HISTORY_COLLECTION).document(self.session_id)
+            mensajes_ref = history_ref.collection(MESSAGES_SUBCOLLECTION)
+            batch = db.batch()
+            for seq, item in enumerate(self._items_nuevos, start=datos.get("total_mensajes", 0)):
+                batch.create(mensajes_ref.document(_id_mensaje(seq)), {**item, "seq": seq})
+            padre = _datos_padre(datos, self._items_nuevos, user_id, cola=self._cola)
+            if self._datos_historial is None:
+                batch.create(history_ref, padre)
+            else:
+                # Sin precondición sobre el padre: un turno concurrente ya habría creado el mensaje
+                # con el mismo `seq` (AlreadyExists) y el resumen en segundo plano escribe otros campos.
+                batch.update(history_ref, padre)
+            batch.set(session_ref, actualizacion_sesion, merge=True)
+            try:
+                _round_trip("escritura")
+                batch.commit()
+                inicio = datos.get("total_mensajes", 0)
+            except (AlreadyExists, Conflict, NotFound):
+                metrics.incrementar("firestore.conflictos_historial")
+                inicio = _guardar_con_transaccion(self.session_id, self.user_id_full, self._items_nuevos, actualizacion_sesion)
+        if inicio is not None:
+            self.id_ultimo_mensaje = _id_mensaje(inicio + len(self._items_nuevos) - 1)
+        self._items_nuevos = []
+        self._actualizacion_sesion = {}
+
+
+def abrir_turno(user_id_full: str, con_historial: bool = True) -> TurnoMemoria | None:
+    """
+    Obtiene la sesión activa (o prepara una nueva si expiró, más de 24h) y su historial.
+    Con la sesión del usuario ya conocida en esta instancia, sesión y documento del historial
+    se leen con un único `get_all`; la creación de sesiones nuevas se difiere a `TurnoMemoria.confirmar()`.
+    """
+    _turno_solicitud.set(None)
+    user_id = _get_clean_user_id(user_id_full)
+    if not user_id: return None
+
+    session_ref = db.collection(SESSION_COLLECTION).document(user_id)
+    session_id_conocida = _sesiones_conocidas.obtener(user_id) if con_historial else None
+    referencias = [session_ref]
+    if session_id_conocida:
+        referencias.append(db.collection(HISTORY_COLLECTION).document(session_id_conocida))
+    _round_trip("lectura")
+    documentos = {doc.reference.path: doc for doc in db.get_all(referencias)}
+    session_doc = documentos[session_ref.path]
+    now = datetime.now(timezone.utc)
+
+    session_data = session_doc.to_dict() if session_doc.exists else None
+    last_activity = (session_data or {}).get("last_activity")
+    if session_data and not (last_activity and now - last_activity > timedelta(hours=24)):
+        session_id, state, actualizacion = session_data.get("active_session_id"), session_data.get("state"), {}
+    else:
+        print(f"▶️  {'La sesión para ' + user_id + ' ha expirado.' if session_data else 'Primera sesión para el usuario ' + user_id + '.'} Creando una nueva sesión.")
+        session_id, state = str(uuid.uuid4()), None
+        # La sesión nueva empieza sin el estado de la anterior.
+        actualizacion = {"active_session_id": session_id, "state": None}
+    _sesiones_conocidas.guardar(user_id, session_id)
+
+    datos_historial = None
+    if con_historial and not actualizacion:
+        history_ref = db.collection(HISTORY_COLLECTION).document(session_id)
+        history_doc = documentos.get(history_ref.path)
+        if history_doc is None:
+            # La sesión cambió en otra instancia o no se conocía: segunda lectura.
+            _round_trip("lectura")
+            history_doc = history_ref.get()
+        if history_doc.exists:
+            datos_historial = history_doc.to_dict()
+    feedback_session_id = (session_data or {}).get("feedback_session_id") if state else None
+    turno = TurnoMemoria(user_id_full, session_id, state, datos_historial, actualizacion, feedback_session_id)
+    _turno_solicitud.set(turno)
+    return turno
+
+
+
+def turno_actual() -> TurnoMemoria | None:
+    """Turno abierto con `abrir_turno` en la solicitud en curso (None si no se abrió ninguno)."""
+    return _turno_solicitud.get()
@@ -0,0 +1,83 @@
+import re
+from datetime import datetime, timedelta
+from src.config import METRICS_CUBE_ENABLED
+from src.utils import metrics
+from src.utils.storage_backend import obtener_backend
+from src.services.sql_template_cache import es_plantilla_fijada
+
+# Medidas del cubo que se reconocen en la forma de la pregunta (sin tildes). Abiertos y
+# vencidos sin rango de fechas se refieren al estado actual, no a lo ocurrido en un periodo,
+# así que solo se responden desde el cubo cuando la pregunta trae fechas.
+_MEDIDAS = [
+    (re.compile(r"\b(tiempo|horas?|promedio)\b.*\bresol"), ["HorasPromedioResolucion", "Cerrados"], False),
+    (re.compile(r"\b(cerrad|cerraron|resuelt|resolvieron)"), ["Cerrados"], False),
+    (re.compile(r"\b(vencid|fuera de(l)? sla|incumpl)"), ["CerradosVencidos"], True),
+    (re.compile(r"\b(cread|crearon|nuev|recibid|abiert|abrieron)"), ["Abiertos"], True),
+]
+_DIMENSIONES = [
+    (re.compile(r"\bpor (equipo|departamento|area)\b"), "Departamento"),
+    (re.compile(r"\bpor (responsable|agente|persona|analista|ingeniero)\b"), "Responsable"),
+    (re.compile(r"\bpor prioridad\b"), "Prioridad"),
+    (re.compile(r"\bpor (dia|fecha)\b|\bdiari"), "Fecha"),
+]
+# Lo que el cubo no sabe responder: se deja al SQL generado.
+_NO_SOPORTADO = re.compile(
+    r"solicitante|mediana|percentil|maxim|minim|\btop\b|ranking|por (semana|mes|ano)|semanal|mensual"
+    r"|descripcion|dex-|\bcuales\b|\blista|\bdetalle|\bsla de\b"
+)
+
+
+def _rango_en_dias(parametros: dict) -> (datetime, datetime):
+    """Convierte [fecha_inicio, fecha_fin) a días completos, la granularidad del cubo."""
+    inicio, fin = parametros.get("fecha_inicio"), parametros.get("fecha_fin")
+    if inicio is None:
+        return None, None
+    desde = inicio.date()
+    hasta = fin.date() if fin.time() == datetime.min.time() else fin.date() + timedelta(days=1)
+    return desde, hasta
+
+
+def planificar(forma: str, parametros: dict) -> dict | None:
+    """
+    Decide si una pregunta (forma + parámetros de `extraer_parametros`) se responde desde
+    `metricas_diarias`. Devuelve `{"medidas", "dimensiones", "filtros"}` o None.
+    Las formas con plantilla fijada (METRICS_SQL_TEMPLATES_PATH) se responden con su plantilla.
+    """
+    if not METRICS_CUBE_ENABLED or _NO_SOPORTADO.search(forma) or es_plantilla_fijada(forma):
+        return None
+    medidas = []
+    for patron, columnas, requiere_fechas in _MEDIDAS:
+        if patron.search(forma) and (not requiere_fechas or "fecha_inicio" in parametros):
+            medidas.extend(columna for columna in columnas if columna not in medidas)
+    if not medidas:
+        return None
+    filtros = {}
+    if "departamento" in parametros:
+        filtros["Departamento"] = parametros["departamento"]
+    if "responsable" in parametros:
+        filtros["Responsable"] = parametros["responsable"]
+    dimensiones = [dimension for patron, dimension in _DIMENSIONES if patron.search(forma)]
+    return {"medidas": medidas, "dimensiones": dimensiones, "filtros": filtros}
+
+
+def responder_desde_cubo(forma: str, parametros: dict) -> list | None:
+    """
+    Responde la pregunta agregando `metricas_diarias` si `planificar` la reconoce, sin leer
+    el log de eventos. Devuelve las filas (dimensiones + medidas pedidas) o None si hay que
+    generar SQL.
+    """
+    plan = planificar(forma, parametros)
+    if plan is None:
+        metrics.incrementar("metricas_cubo.no_aplica")
+        return None
+    desde, hasta = _rango_en_dias(parametros)
+    try:
+        filas = obtener_backend().consultar_metricas_diarias(plan["dimensiones"], desde, hasta, plan["filtros"])
+    except Exception as e:
+        metrics.incrementar("metricas_cubo.errores")
+        print(f"⚠️  No se pudo consultar metricas_diarias, se usará SQL generado: {e}")
+        return None
+    metrics.incrementar("metricas_cubo.respondidas")
+    columnas = plan["dimensiones"] + plan["medidas"]
+    # Sin dimensiones y sin filas en el rango, SUM devuelve una única fila de NULLs.
+    return [{columna: fila.get(columna) for columna in columnas} for fila in filas if fila.get("Abiertos") is not None]
@@ -1,7 +1,17 @@
 import os
 import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from src.config import (
+    NOTIFICATION_MODE, NOTIFICATION_WORKERS, NOTIFICATION_QUEUE_SIZE,
+    NOTIFICATION_MAX_RETRIES, NOTIFICATION_SPILL_PATH,
+    BREVO_BATCH_SIZE, BREVO_BATCH_CONCURRENCY, BREVO_MAX_REQUESTS_PER_SECOND
+)
+from src.utils import metrics
+from src.utils.outbox import Outbox, ErrorReintentable
+from src.utils.rate_limiter import LimitadorTasa
 
 load_dotenv()
 
@@ -10,9 +20,39 @@ BREVO_API_KEY = os.getenv("BREVO_API_KEY")
 BREVO_API_URL = "https://api.brevo.com/v3/smtp/email"
 SENDER_EMAIL = "jose.solano@connect.inc"
 SENDER_NAME = "Dex Helpdesk AI"
+HTTP_TIMEOUT_SECONDS = 10
 
+# Sesión compartida: reutiliza conexiones keep-alive (y su handshake TLS) entre envíos.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(NOTIFICATION_WORKERS, BREVO_BATCH_CONCURRENCY, 4)))
+_limitador_brevo = LimitadorTasa(BREVO_MAX_REQUESTS_PER_SECOND, rafaga=BREVO_BATCH_CONCURRENCY)
 
-def enviar_notificacion_email(destinatario: str, asunto: str, cuerpo_html: str):
+
+def _post(url: str, headers: dict, payload: dict, destino: str):
+    """POST con la sesión compartida; 429/5xx y errores de red se marcan como reintentables."""
+    try:
+        response = _session.post(url, headers=headers, data=json.dumps(payload), timeout=HTTP_TIMEOUT_SECONDS)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        raise ErrorReintentable(f"{destino}: {e}")
+    if response.status_code == 429 or response.status_code >= 500:
+        reintentar_en = response.headers.get("Retry-After")
+        raise ErrorReintentable(
+            f"{destino} respondió {response.status_code}",
+            float(reintentar_en) if reintentar_en and reintentar_en.isdigit() else None
+        )
+    response.raise_for_status()
+    return response
+
+
+def _headers_brevo() -> dict:
+    return {
+        "accept": "application/json",
+        "api-key": BREVO_API_KEY,
+        "content-type": "application/json"
+    }
+
+
+def _enviar_email(destinatario: str, asunto: str, cuerpo_html: str):
     """
     Crea y envía un correo electrónico usando la API de Brevo.
     """
@@ -20,11 +60,7 @@ def enviar_notificacion_email(destinatario: str, asunto: str, cuerpo_html: str):
         print("🔴 Error Crítico: La variable de entorno BREVO_API_KEY no está configurada.")
         return False
 
-    headers = {
-        "accept": "application/json",
-        "api-key": BREVO_API_KEY,
-        "content-type": "application/json"
-    }
+    headers = _headers_brevo()
     
     payload = {
         "sender": {"name": SENDER_NAME, "email": SENDER_EMAIL},
@@ -34,19 +70,55 @@ def enviar_notificacion_email(destinatario: str, asunto: str, cuerpo_html: str):
     }
 
     try:
-        response = requests.post(BREVO_API_URL, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
+        _limitador_brevo.adquirir()
+        _post(BREVO_API_URL, headers, payload, "Brevo")
         print(f"✅ Correo de notificación enviado a {destinatario} a través de Brevo.")
         return True
+    except ErrorReintentable:
+        raise
     except requests.exceptions.HTTPError as http_err:
-        print(f"🔴 Error HTTP al enviar correo con Brevo: {http_err} - {response.text}")
+        print(f"🔴 Error HTTP al enviar correo con Brevo: {http_err} - {http_err.response.text}")
         return False
     except Exception as e:
         print(f"🔴 Error inesperado en el envío de correo con Brevo: {e}")
         return False
 
 
-def enviar_notificacion_chat(mensaje: str):
+def _enviar_lote_emails(correos: list):
+    """
+    Envía varios correos personalizados en una sola llamada a Brevo usando `messageVersions`.
+    Cada elemento de `correos` tiene 'destinatario', 'asunto' y 'cuerpo_html'.
+    """
+    if not BREVO_API_KEY:
+        print("🔴 Error Crítico: La variable de entorno BREVO_API_KEY no está configurada.")
+        return False
+
+    payload = {
+        "sender": {"name": SENDER_NAME, "email": SENDER_EMAIL},
+        "subject": correos[0]["asunto"],
+        "htmlContent": correos[0]["cuerpo_html"],
+        "messageVersions": [
+            {"to": [{"email": correo["destinatario"]}], "subject": correo["asunto"], "htmlContent": correo["cuerpo_html"]}
+            for correo in correos
+        ]
+    }
+
+    try:
+        _limitador_brevo.adquirir()
+        _post(BREVO_API_URL, _headers_brevo(), payload, "Brevo")
+        print(f"✅ Lote de {len(correos)} correos enviado a través de Brevo.")
+        return True
+    except ErrorReintentable:
+        raise
+    except requests.exceptions.HTTPError as http_err:
+        print(f"🔴 Error HTTP al enviar lote de correos con Brevo: {http_err} - {http_err.response.text}")
+        return False
+    except Exception as e:
+        print(f"🔴 Error inesperado en el envío del lote de correos con Brevo: {e}")
+        return False
+
+
+def _enviar_chat(mensaje: str):
     """
     Envía un mensaje a un espacio de Google Chat usando un webhook.
     """
@@ -57,13 +129,96 @@ def enviar_notificacion_chat(mensaje: str):
     try:
         mensaje_json = {"text": mensaje}
         headers = {'Content-Type': 'application/json; charset=UTF-8'}
-        response = requests.post(GOOGLE_CHAT_WEBHOOK_URL, headers=headers, data=json.dumps(mensaje_json))
-        response.raise_for_status()
+        _post(GOOGLE_CHAT_WEBHOOK_URL, headers, mensaje_json, "Google Chat")
         print("✅ Notificación enviada a Google Chat.")
         return True
+    except ErrorReintentable:
+        raise
     except requests.exceptions.HTTPError as http_err:
-        print(f"🔴 Error HTTP al enviar notificación a Google Chat: {http_err} - {response.text}")
+        print(f"🔴 Error HTTP al enviar notificación a Google Chat: {http_err} - {http_err.response.text}")
         return False
     except Exception as e:
         print(f"🔴 Error inesperado en el envío de mensaje de Chat: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+def _despachar(notificacion: dict):
+    if notificacion["tipo"] == "email":
+        return _enviar_email(notificacion["destinatario"], notificacion["asunto"], notificacion["cuerpo_html"])
+    if notificacion["tipo"] == "email_lote":
+        return _enviar_lote_emails(notificacion["correos"])
+    return _enviar_chat(notificacion["mensaje"])
+
+
+outbox_notificaciones = Outbox(
+    "notificaciones", _despachar,
+    workers=NOTIFICATION_WORKERS,
+    tamano_maximo=NOTIFICATION_QUEUE_SIZE,
+    max_reintentos=NOTIFICATION_MAX_RETRIES,
+    ruta_spill=NOTIFICATION_SPILL_PATH or None
+)
+
+
+def iniciar_outbox_notificaciones():
+    """
+    Arranca el outbox de notificaciones y reenvía lo que quedó en el spill. En Cloud Run
+    (K_SERVICE definido) exige un spill en GCS: el disco local se pierde con la instancia.
+    """
+    if os.getenv("K_SERVICE") and not (NOTIFICATION_SPILL_PATH or "").startswith("gs://"):
+        raise RuntimeError(
+            "NOTIFICATION_SPILL_PATH debe ser un prefijo gs://bucket/ruta en Cloud Run "
+            f"(valor actual: {NOTIFICATION_SPILL_PATH!r}); define también GCS_BUCKET_NAME para usar gs://<bucket>/outbox."
+        )
+    if not NOTIFICATION_SPILL_PATH:
+        print("⚠️  NOTIFICATION_SPILL_PATH no está definido: las notificaciones no entregadas solo quedarán en los logs.")
+    outbox_notificaciones.iniciar()
+
+
+def _enviar(notificacion: dict, sincronico: bool) -> bool:
+    if sincronico or NOTIFICATION_MODE == "sync":
+        return outbox_notificaciones.enviar_ahora(notificacion)
+    return outbox_notificaciones.encolar(notificacion)
+
+
+def enviar_notificacion_email(destinatario: str, asunto: str, cuerpo_html: str, sincronico: bool = False):
+    """
+    Encola un correo para enviarlo con Brevo fuera de la solicitud de chat.
+    Con `sincronico=True` (o NOTIFICATION_MODE=sync) se envía en el hilo actual.
+    """
+    return _enviar({"tipo": "email", "destinatario": destinatario, "asunto": asunto, "cuerpo_html": cuerpo_html}, sincronico)
+
+
+def enviar_notificacion_chat(mensaje: str, sincronico: bool = False):
+    """Encola un mensaje para el webhook de Google Chat (ver `enviar_notificacion_email`)."""
+    return _enviar({"tipo": "chat", "mensaje": mensaje}, sincronico)
+
+
+def enviar_emails_en_lote(correos: list) -> dict:
+    """
+    Envía muchos correos personalizados agrupándolos en lotes de BREVO_BATCH_SIZE
+    (`messageVersions`), con hasta BREVO_BATCH_CONCURRENCY lotes en paralelo y un máximo de
+    BREVO_MAX_REQUESTS_PER_SECOND llamadas por segundo. Cada lote tiene los reintentos del
+    outbox; los lotes que fallan definitivamente quedan guardados en el spill.
+    Devuelve un diccionario destinatario -> True/False con el resultado de cada envío.
+    """
+    if not correos:
+        return {}
+    lotes = [correos[i:i + BREVO_BATCH_SIZE] for i in range(0, len(correos), BREVO_BATCH_SIZE)]
+
+    def enviar_lote(lote):
+        return lote, outbox_notificaciones.enviar_ahora({"tipo": "email_lote", "correos": lote})
+
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=min(BREVO_BATCH_CONCURRENCY, len(lotes))) as executor:
+        for lote, enviado in executor.map(enviar_lote, lotes):
+            for correo in lote:
+                resultados[correo["destinatario"]] = enviado
+    enviados = sum(1 for enviado in resultados.values() if enviado)
+    metrics.incrementar("notificaciones.emails_lote_enviados", enviados)
+    metrics.incrementar("notificaciones.emails_lote_fallidos", len(resultados) - enviados)
+    return resultados
+
+
+def esperar_notificaciones(timeout_segundos: float = 30.0) -> bool:
+    """Espera a que se entreguen las notificaciones encoladas (p. ej. al final de una tarea programada)."""
+    return outbox_notificaciones.esperar(timeout_segundos)
@@ -0,0 +1,112 @@
+import re
+import time
+import threading
+import numpy as np
+from src.config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES
+)
+from src.utils import metrics
+from src.utils.vector_index import normalizar_filas
+
+MARCADOR_NOMBRE_COMPLETO = "{{nombre_completo}}"
+MARCADOR_PRIMER_NOMBRE = "{{primer_nombre}}"
+
+
+class _EntradasRol:
+    """Respuestas cacheadas de un rol: matriz de embeddings normalizados + metadatos en paralelo."""
+
+    def __init__(self, dimension: int):
+        self.matriz = np.empty((0, dimension), dtype=np.float32)
+        self.respuestas, self.expiraciones, self.costos_ms, self.usos = [], [], [], []
+
+    def purgar(self, ahora: float):
+        vigentes = [i for i, expira in enumerate(self.expiraciones) if expira > ahora]
+        if len(vigentes) != len(self.expiraciones):
+            self._conservar(vigentes)
+
+    def _conservar(self, indices: list):
+        self.matriz = self.matriz[indices]
+        self.respuestas = [self.respuestas[i] for i in indices]
+        self.expiraciones = [self.expiraciones[i] for i in indices]
+        self.costos_ms = [self.costos_ms[i] for i in indices]
+        self.usos = [self.usos[i] for i in indices]
+
+    def agregar(self, vector: np.ndarray, respuesta: str, expira: float, costo_ms: float, ahora: float):
+        if len(self.respuestas) >= RESPONSE_CACHE_MAX_ENTRIES:
+            # Se descarta la entrada usada hace más tiempo.
+            self._conservar(sorted(range(len(self.usos)), key=lambda i: self.usos[i])[1:])
+        self.matriz = np.vstack([self.matriz, vector[None, :]])
+        self.respuestas.append(respuesta)
+        self.expiraciones.append(expira)
+        self.costos_ms.append(costo_ms)
+        self.usos.append(ahora)
+
+
+_entradas_por_rol = {}
+_lock = threading.Lock()
+
+
+def _personalizar(respuesta: str, nombre_usuario: str) -> str:
+    respuesta = respuesta.replace(MARCADOR_NOMBRE_COMPLETO, nombre_usuario)
+    return respuesta.replace(MARCADOR_PRIMER_NOMBRE, nombre_usuario.split(" ")[0])
+
+
+def _despersonalizar(respuesta: str, nombre_usuario: str) -> str:
+    if not nombre_usuario:
+        return respuesta
+    # Primero el nombre completo y luego el primer nombre, que es como suele saludar el modelo.
+    # Solo palabras completas: "Ana" no debe tocar "Analiza".
+    respuesta = re.sub(rf"\b{re.escape(nombre_usuario)}\b", MARCADOR_NOMBRE_COMPLETO, respuesta)
+    return re.sub(rf"\b{re.escape(nombre_usuario.split(' ')[0])}\b", MARCADOR_PRIMER_NOMBRE, respuesta)
+
+
+def buscar_respuesta(vector, rol: str, nombre_usuario: str) -> str | None:
+    """
+    Devuelve una respuesta previa del mismo rol cuya pregunta tenga similitud coseno de al menos
+    RESPONSE_CACHE_SIMILARITY con `vector`, personalizada con `nombre_usuario`, o None.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    consulta = normalizar_filas(vector)
+    ahora = time.monotonic()
+    with _lock:
+        entradas = _entradas_por_rol.get(rol)
+        if entradas is not None:
+            entradas.purgar(ahora)
+        if entradas is None or not entradas.respuestas or entradas.matriz.shape[1] != consulta.shape[0]:
+            metrics.incrementar("respuesta_cache.miss")
+            return None
+        similitudes = entradas.matriz @ consulta
+        mejor = int(np.argmax(similitudes))
+        if similitudes[mejor] < RESPONSE_CACHE_SIMILARITY:
+            metrics.incrementar("respuesta_cache.miss")
+            return None
+        entradas.usos[mejor] = ahora
+        respuesta, costo_ms = entradas.respuestas[mejor], entradas.costos_ms[mejor]
+    metrics.incrementar("respuesta_cache.hit")
+    metrics.incrementar("respuesta_cache.ms_ahorrados", int(costo_ms))
+    return _personalizar(respuesta, nombre_usuario)
+
+
+def guardar_respuesta(vector, rol: str, nombre_usuario: str, respuesta: str, costo_ms: float):
+    """Guarda una respuesta de texto (sin herramientas) para el rol, con el nombre del usuario reemplazado por un marcador."""
+    if not RESPONSE_CACHE_ENABLED or not respuesta:
+        return
+    vector = normalizar_filas(vector)
+    ahora = time.monotonic()
+    with _lock:
+        entradas = _entradas_por_rol.get(rol)
+        if entradas is None or entradas.matriz.shape[1] != vector.shape[0]:
+            entradas = _entradas_por_rol[rol] = _EntradasRol(vector.shape[0])
+        entradas.purgar(ahora)
+        entradas.agregar(vector, _despersonalizar(respuesta, nombre_usuario), ahora + RESPONSE_CACHE_TTL_SECONDS, costo_ms, ahora)
+        metrics.fijar("respuesta_cache.entradas", sum(len(e.respuestas) for e in _entradas_por_rol.values()))
+
+
+def invalidar_respuestas(rol: str = None):
+    """Vacía la caché de respuestas de un rol, o de todos."""
+    with _lock:
+        if rol is None:
+            _entradas_por_rol.clear()
+        else:
+            _entradas_por_rol.pop(rol, None)
@@ -0,0 +1,66 @@
+import sys
+import json
+from src.config import METRICS_RESULT_PROMPT_ROWS, METRICS_RESULT_PROMPT_CHARS
+from src.utils import metrics
+
+
+def _es_numero(valor) -> bool:
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def _bytes_aproximados(filas: list) -> int:
+    """Tamaño aproximado en memoria de las filas leídas (listas, dicts y valores)."""
+    total = sys.getsizeof(filas)
+    for fila in filas:
+        total += sys.getsizeof(fila) + sum(sys.getsizeof(valor) for valor in fila.values())
+    return total
+
+
+def resumir_resultado(filas: list, total_filas: int = None, limite: int = None) -> str:
+    """
+    Convierte el resultado de una consulta de métricas en el texto que vuelve al modelo.
+    Si las filas caben en METRICS_RESULT_PROMPT_CHARS y no se omitió ninguna, se devuelven
+    tal cual. Si no, se devuelve un resumen en columnas: las primeras filas en el orden de la
+    consulta (sus primeras N si trae ORDER BY), el total de filas, cuántas se omitieron y los
+    totales de las columnas numéricas sobre las filas leídas.
+    `limite` es el LIMIT aplicado a la consulta; si el total lo alcanza, hay más filas.
+    """
+    total_filas = len(filas) if total_filas is None else total_filas
+    metrics.incrementar("metricas_sql.filas_leidas", len(filas))
+    metrics.fijar("metricas_sql.memoria_bytes", _bytes_aproximados(filas))
+    if not filas:
+        return "La consulta no arrojó resultados."
+
+    texto = json.dumps(filas, default=str)
+    if total_filas == len(filas) and len(texto) <= METRICS_RESULT_PROMPT_CHARS:
+        metrics.incrementar("metricas_sql.caracteres_resultado", len(texto))
+        return texto
+
+    columnas = list(filas[0])
+    numericas = [
+        columna for columna in columnas
+        if any(_es_numero(fila.get(columna)) for fila in filas)
+        and all(fila.get(columna) is None or _es_numero(fila.get(columna)) for fila in filas)
+    ]
+    resumen = {
+        "columnas": columnas,
+        "filas": [],
+        "total_filas": total_filas,
+        "filas_omitidas": 0,
+        "totales": {columna: sum(fila.get(columna) or 0 for fila in filas) for columna in numericas},
+        "totales_parciales": len(filas) < total_filas,
+    }
+    if limite and total_filas >= limite:
+        resumen["nota"] = f"El resultado se cortó en {limite} filas; puede haber más."
+    muestra = min(METRICS_RESULT_PROMPT_ROWS, len(filas))
+    while True:
+        resumen["filas"] = [[fila.get(columna) for columna in columnas] for fila in filas[:muestra]]
+        resumen["filas_omitidas"] = total_filas - muestra
+        texto = json.dumps(resumen, default=str)
+        if len(texto) <= METRICS_RESULT_PROMPT_CHARS or muestra <= 1:
+            break
+        muestra //= 2
+
+    metrics.incrementar("metricas_sql.resumidas")
+    metrics.incrementar("metricas_sql.caracteres_resultado", len(texto))
+    return texto
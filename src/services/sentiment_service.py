@@ -0,0 +1,133 @@
+import os
+import re
+import hashlib
+import unicodedata
+from vertexai.generative_models import GenerativeModel
+from src.config import SENTIMENT_MODE, SENTIMENT_CONFIDENCE_THRESHOLD, SENTIMENT_CACHE_TTL_SECONDS
+from src.utils import metrics
+from src.utils.cache import TTLCache
+
+SENTIMIENTOS_VALIDOS = ("positivo", "negativo", "neutro")
+
+# Léxico en español orientado a mensajes de soporte. Los pesos son la polaridad de cada término.
+LEXICO = {
+    # Positivos
+    "gracias": 2.0, "agradezco": 2.0, "excelente": 2.5, "genial": 2.5, "perfecto": 2.5,
+    "bien": 1.0, "bueno": 1.0, "buena": 1.0, "super": 1.5, "feliz": 2.0, "contento": 2.0,
+    "contenta": 2.0, "encanta": 2.0, "funciona": 1.0, "funciono": 1.5, "resuelto": 2.0,
+    "solucionado": 2.0, "rapido": 1.0, "amable": 1.5, "increible": 2.0, "maravilla": 2.0,
+    "crack": 2.0, "top": 1.5, "chevere": 2.0, "util": 1.0, "ayudo": 1.5,
+    # Negativos
+    "error": -1.0, "falla": -1.5, "fallo": -1.5, "fallando": -1.5, "caido": -2.0, "caida": -2.0,
+    "roto": -2.0, "problema": -1.0, "problemas": -1.0, "urgente": -1.5, "urgencia": -1.5,
+    "molesto": -2.5, "molesta": -2.5, "frustrado": -3.0, "frustrada": -3.0, "frustrante": -3.0,
+    "harto": -3.0, "harta": -3.0, "terrible": -3.0, "pesimo": -3.0, "horrible": -3.0,
+    "malo": -1.5, "mala": -1.5, "mal": -1.5, "lento": -1.5, "lenta": -1.5, "imposible": -2.0,
+    "inaceptable": -3.0, "otra": -0.5, "nuevamente": -1.0, "siempre": -0.5, "nunca": -1.0,
+    "bloqueado": -2.0, "bloqueada": -2.0, "perdida": -2.0, "perdidos": -2.0, "queja": -2.5,
+    "decepcionado": -3.0, "decepcionada": -3.0, "enojado": -3.0, "enojada": -3.0, "grave": -2.0,
+}
+NEGACIONES = {"no", "ni", "nada", "sin", "tampoco", "jamas"}
+INTENSIFICADORES = {"muy": 1.5, "super": 1.5, "demasiado": 1.5, "bastante": 1.3, "tan": 1.3, "realmente": 1.3, "totalmente": 1.5}
+EMOJIS = {"🙂": 1.5, "😀": 2.0, "😊": 2.0, "👍": 1.5, "🙏": 1.5, "🎉": 2.0, "😡": -3.0, "😠": -3.0, "😤": -2.5, "😞": -2.0, "😢": -2.0, "👎": -2.0}
+
+GEMINI_CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL")
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_cache_sentimientos = TTLCache("sentimiento_cache", SENTIMENT_CACHE_TTL_SECONDS, max_entradas=5000)
+_modelo_sentimiento = None
+
+
+def _normalizar(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def clasificar_local(mensaje: str) -> (str, float):
+    """
+    Clasifica el mensaje con el léxico local. Devuelve (sentimiento, confianza en [0, 1]).
+    La confianza es baja cuando hay poca evidencia o cuando se mezclan términos de
+    polaridad opuesta; en esos casos conviene consultar al LLM.
+    """
+    tokens = _TOKEN.findall(_normalizar(mensaje))
+    puntaje, positivos, negativos = 0.0, 0.0, 0.0
+    for i, token in enumerate(tokens):
+        peso = LEXICO.get(token)
+        if peso is None:
+            continue
+        anteriores = tokens[max(0, i - 3):i]
+        if any(t in NEGACIONES for t in anteriores):
+            peso = -peso * 0.8
+        if i > 0 and tokens[i - 1] in INTENSIFICADORES:
+            peso *= INTENSIFICADORES[tokens[i - 1]]
+        puntaje += peso
+        if peso > 0:
+            positivos += peso
+        else:
+            negativos -= peso
+    for emoji, peso in EMOJIS.items():
+        peso *= mensaje.count(emoji)
+        puntaje += peso
+        if peso > 0:
+            positivos += peso
+        else:
+            negativos -= peso
+    if "!!" in mensaje and puntaje < 0:
+        puntaje -= 1.0
+        negativos += 1.0
+
+    evidencia = positivos + negativos
+    if evidencia == 0:
+        # Sin términos con carga emocional: mensaje informativo. Los muy largos se escalan.
+        return "neutro", 0.9 if len(tokens) <= 40 else 0.5
+    mezcla = min(positivos, negativos) / max(positivos, negativos)
+    confianza = min(1.0, abs(puntaje) / 3.0) * (1.0 - mezcla)
+    if abs(puntaje) < 1.0:
+        return "neutro", max(confianza, 0.3) * (1.0 - mezcla)
+    return ("positivo" if puntaje > 0 else "negativo"), confianza
+
+
+def clasificar_con_llm(mensaje: str) -> str:
+    """Clasifica el sentimiento de un mensaje usando el modelo de chat principal."""
+    global _modelo_sentimiento
+    try:
+        if _modelo_sentimiento is None:
+            _modelo_sentimiento = GenerativeModel(GEMINI_CHAT_MODEL)
+        prompt = f"""
+        Analiza el sentimiento del siguiente texto y clasifícalo estrictamente como 'positivo', 'negativo' o 'neutro'.
+        Responde únicamente con una de esas tres palabras.
+        Texto: "{mensaje}"
+        """
+        response = _modelo_sentimiento.generate_content(prompt)
+        metrics.registrar_uso_vertex(response, "sentimiento")
+        sentimiento = response.text.strip().lower()
+        return sentimiento if sentimiento in SENTIMIENTOS_VALIDOS else "neutro"
+    except Exception as e:
+        print(f"⚠️  Advertencia: No se pudo analizar el sentimiento. {e}")
+        return "neutro"
+
+
+def analizar_sentimiento(mensaje: str) -> str:
+    """
+    Devuelve 'positivo', 'negativo' o 'neutro' según SENTIMENT_MODE:
+    'local' usa solo el léxico, 'llm' usa solo Gemini y 'hybrid' (por defecto) usa el léxico
+    y recurre a Gemini cuando la confianza es menor a SENTIMENT_CONFIDENCE_THRESHOLD.
+    Los resultados se guardan en caché por hash del mensaje normalizado.
+    """
+    clave = hashlib.sha256(" ".join(_normalizar(mensaje).split()).encode("utf-8")).hexdigest()
+    en_cache = _cache_sentimientos.obtener(clave)
+    if en_cache:
+        return en_cache
+
+    if SENTIMENT_MODE == "llm":
+        sentimiento = clasificar_con_llm(mensaje)
+        metrics.incrementar("sentimiento.llm")
+    else:
+        sentimiento, confianza = clasificar_local(mensaje)
+        if SENTIMENT_MODE == "hybrid" and confianza < SENTIMENT_CONFIDENCE_THRESHOLD:
+            sentimiento = clasificar_con_llm(mensaje)
+            metrics.incrementar("sentimiento.fallback_llm")
+        else:
+            metrics.incrementar("sentimiento.local")
+    _cache_sentimientos.guardar(clave, sentimiento)
+    return sentimiento
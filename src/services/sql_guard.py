@@ -0,0 +1,133 @@
+import re
+from src.config import METRICS_SQL_MAX_BYTES
+from src.utils import metrics
+from src.utils.bigquery_client import TICKETS_TABLE_ID, EVENTOS_TABLE_ID
+from src.utils.storage_backend import obtener_backend
+
+# Únicas tablas que puede leer el SQL generado para `consultar_metricas`.
+TABLAS_PERMITIDAS = {TICKETS_TABLE_ID, EVENTOS_TABLE_ID}
+# También se aceptan como `dataset.tabla` (proyecto por defecto de la consulta).
+_NOMBRES_PERMITIDOS = TABLAS_PERMITIDAS | {tabla.split(".", 1)[1] for tabla in TABLAS_PERMITIDAS}
+
+_LITERALES_Y_COMENTARIOS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|--[^\n]*|#[^\n]*|/\*.*?\*/", re.DOTALL)
+_PALABRAS_PROHIBIDAS = re.compile(
+    r"\b(insert|update|delete|merge|create|drop|alter|truncate|grant|revoke|call|execute|declare|set"
+    r"|begin|commit|rollback|export|load)\b", re.IGNORECASE
+)
+_CTE = re.compile(r"(?:\bwith\b(?:\s+recursive)?|,)\s*(\w+)\s+as\s*\(", re.IGNORECASE)
+# Nombre de tabla en cualquiera de sus formas: `p.d.t`, `p`.`d`.`t`, p.d.t, d.t o t.
+_REFERENCIA = r"(?:`[^`]+`|[\w-]+)(?:\s*\.\s*(?:`[^`]+`|[\w-]+))*"
+_TOKENS_ORIGEN = re.compile(rf"(\()|(\))|\b(select)\b|\b(from|join)\s+({_REFERENCIA})", re.IGNORECASE)
+_REFERENCIA_CITADA = re.compile(_REFERENCIA)
+_PARTE_NOMBRE = re.compile(r"`([^`]+)`|([\w-]+)")
+_PARAMETRO_SQL = re.compile(r"@(\w+)")
+_LIMIT_FINAL = re.compile(r"\blimit\s+(\d+)(\s+offset\s+\d+)?\s*$", re.IGNORECASE)
+
+
+class ConsultaNoPermitida(ValueError):
+    """El SQL generado no pasa las restricciones de solo lectura, tablas o parámetros."""
+
+
+class ConsultaDemasiadoCostosa(ConsultaNoPermitida):
+    def __init__(self, bytes_estimados: int, limite: int):
+        super().__init__(f"La consulta procesaría {bytes_estimados / 1e6:.1f} MB; el límite es {limite / 1e6:.1f} MB.")
+        self.bytes_estimados = bytes_estimados
+        self.limite = limite
+
+
+def _normalizar_tabla(referencia: str) -> str:
+    """`proyecto`.`dataset`.`tabla`, `proyecto.dataset.tabla` y proyecto.dataset.tabla -> proyecto.dataset.tabla"""
+    partes = []
+    for citado, simple in _PARTE_NOMBRE.findall(referencia):
+        partes.extend(citado.split(".") if citado else [simple])
+    return ".".join(parte.strip() for parte in partes)
+
+
+def _tablas_leidas(sql: str) -> set:
+    """
+    Tablas que aparecen después de FROM o JOIN. Un FROM solo introduce tablas si en su nivel
+    de paréntesis ya hubo un SELECT: así se ignoran EXTRACT(MONTH FROM x) y similares.
+    """
+    tablas, con_select = set(), [False]
+    for abre, cierra, select, palabra, referencia in _TOKENS_ORIGEN.findall(sql):
+        if abre:
+            con_select.append(False)
+        elif cierra:
+            if len(con_select) > 1:
+                con_select.pop()
+        elif select:
+            con_select[-1] = True
+        elif palabra.lower() == "join" or con_select[-1]:
+            tablas.add(_normalizar_tabla(referencia))
+    # Nombres completos citados con backticks en cualquier otra parte (p. ej. tras una coma en el FROM).
+    for referencia in _REFERENCIA_CITADA.findall(sql):
+        if "`" in referencia and _normalizar_tabla(referencia).count(".") >= 2:
+            tablas.add(_normalizar_tabla(referencia))
+    return tablas
+
+
+def validar_sql(sql: str, parametros_disponibles) -> set:
+    """
+    Verifica que `sql` sea una sola consulta de lectura (SELECT o WITH), que solo lea de
+    TABLAS_PERMITIDAS (o de sus propias CTE) y que solo use parámetros disponibles.
+    Devuelve los nombres de los parámetros que usa. Es una revisión textual previa: en
+    BigQuery, `verificar_costo` confirma las tablas con las que reporta el dry run.
+    """
+    limpio = _LITERALES_Y_COMENTARIOS.sub(" ", sql).strip().rstrip(";").strip()
+    if not re.match(r"^(select|with)\b", limpio, re.IGNORECASE):
+        raise ConsultaNoPermitida("La consulta generada no es un SELECT.")
+    if ";" in limpio:
+        raise ConsultaNoPermitida("La consulta generada contiene más de una sentencia.")
+    prohibida = _PALABRAS_PROHIBIDAS.search(limpio)
+    if prohibida:
+        raise ConsultaNoPermitida(f"La consulta generada contiene '{prohibida.group(1).upper()}'; solo se permiten lecturas.")
+
+    ctes = {nombre.lower() for nombre in _CTE.findall(limpio)}
+    no_permitidas = {
+        tabla for tabla in _tablas_leidas(limpio)
+        if tabla not in _NOMBRES_PERMITIDOS and tabla.lower() not in ctes | {"unnest"}
+    }
+    if no_permitidas:
+        raise ConsultaNoPermitida(f"La consulta lee tablas no permitidas: {', '.join(sorted(no_permitidas))}")
+
+    usados = set(_PARAMETRO_SQL.findall(limpio))
+    desconocidos = usados - set(parametros_disponibles)
+    if desconocidos:
+        raise ConsultaNoPermitida(f"La consulta usa parámetros no disponibles: {', '.join(sorted(desconocidos))}")
+    return usados
+
+
+def verificar_costo(sql: str, parametros: dict, limite: int = METRICS_SQL_MAX_BYTES) -> int | None:
+    """
+    Analiza la consulta con un dry run. Lanza ConsultaNoPermitida si lee alguna tabla fuera de
+    TABLAS_PERMITIDAS (según las tablas que resuelve BigQuery, no el texto) y
+    ConsultaDemasiadoCostosa si los bytes estimados superan `limite`. Devuelve la estimación
+    (None si el backend no sabe analizar consultas).
+    """
+    analisis = obtener_backend().analizar_consulta(sql, parametros)
+    if analisis is None:
+        return None
+    no_permitidas = analisis["tablas"] - TABLAS_PERMITIDAS
+    if no_permitidas:
+        metrics.incrementar("metricas_sql.tablas_rechazadas_dry_run")
+        raise ConsultaNoPermitida(f"La consulta lee tablas no permitidas: {', '.join(sorted(no_permitidas))}")
+    bytes_estimados = analisis["bytes"]
+    metrics.incrementar("metricas_sql.bytes_estimados", bytes_estimados)
+    if bytes_estimados > limite:
+        metrics.incrementar("metricas_sql.sobre_presupuesto")
+        raise ConsultaDemasiadoCostosa(bytes_estimados, limite)
+    return bytes_estimados
+
+
+def aplicar_limite(sql: str, limite: int) -> str:
+    """
+    Asegura que la consulta devuelva como máximo `limite` filas: agrega `LIMIT` al final o
+    reduce el que ya tenga si es mayor. Un LIMIT al final de la consulta siempre es el externo.
+    """
+    sql = sql.strip().rstrip(";").rstrip()
+    existente = _LIMIT_FINAL.search(sql)
+    if existente is None:
+        return f"{sql}\nLIMIT {limite}"
+    if int(existente.group(1)) <= limite:
+        return sql
+    return f"{sql[:existente.start()]}LIMIT {limite}{existente.group(2) or ''}"
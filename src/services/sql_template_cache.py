@@ -0,0 +1,188 @@
+import re
+import json
+import unicodedata
+import threading
+from datetime import datetime, timedelta
+from src.config import METRICS_SQL_CACHE_TTL_SECONDS, METRICS_SQL_CACHE_MAX_ENTRIES, METRICS_SQL_TEMPLATES_PATH
+from src.utils import metrics
+from src.utils.cache import TTLCache
+from src.utils.embedding_cache import normalizar_consulta
+from src.services.sql_guard import validar_sql
+from src.utils.bigquery_client import TICKETS_TABLE_ID, EVENTOS_TABLE_ID, listar_departamentos
+
+# Parámetros que se extraen de la pregunta y que el SQL generado recibe como @nombre.
+PARAMETROS_SQL = {
+    "fecha_inicio": "TIMESTAMP (inclusive)",
+    "fecha_fin": "TIMESTAMP (exclusivo)",
+    "departamento": "STRING, equipo asignado",
+    "responsable": "STRING, correo del responsable",
+}
+
+MESES = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio",
+         "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
+
+# La preposición y el artículo forman parte del fragmento reemplazado, así
+# "en marzo", "durante el mes pasado" y "de la última semana" comparten forma.
+_PREFIJO = r"(?:\b(?:en|durante|de|del|desde|entre|para|a)\s+)?(?:\b(?:el|la|los|las)\s+)?"
+_FECHAS_ISO = re.compile(_PREFIJO + r"\b(\d{4}-\d{2}-\d{2})\b(?:\s+(?:y|al|hasta|a)\s+(?:el\s+)?(\d{4}-\d{2}-\d{2})\b)?")
+_ULTIMOS_N = re.compile(_PREFIJO + r"\b[uú]ltim[oa]s\s+(\d+)\s+(d[ií]as?|semanas?|mes(?:es)?)\b")
+_RELATIVAS = re.compile(_PREFIJO + r"\b(hoy|ayer|esta semana|semana pasada|[uú]ltima semana|este mes|mes pasado|[uú]ltimo mes|este año|año pasado|[uú]ltimo año)\b")
+_MES = re.compile(_PREFIJO + r"\b(" + "|".join(MESES) + r")\b(?:\s+(?:de\s+|del\s+)?(\d{4})\b)?")
+_CORREO = re.compile(r"(?:\b(?:de|a|para|por)\s+)?\b([\w.+-]+@[\w-]+\.[\w.-]+)")
+
+_plantillas = TTLCache("metricas_sql.plantillas", METRICS_SQL_CACHE_TTL_SECONDS, METRICS_SQL_CACHE_MAX_ENTRIES)
+_fijadas = {}
+_lock = threading.Lock()
+
+
+def _inicio_mes(anio: int, mes: int) -> datetime:
+    return datetime(anio + (mes - 1) // 12, (mes - 1) % 12 + 1, 1)
+
+
+def _rango_relativo(expresion: str, ahora: datetime) -> (datetime, datetime):
+    hoy = datetime(ahora.year, ahora.month, ahora.day)
+    lunes = hoy - timedelta(days=hoy.weekday())
+    expresion = expresion.replace("ú", "u")
+    if expresion == "hoy":
+        return hoy, hoy + timedelta(days=1)
+    if expresion == "ayer":
+        return hoy - timedelta(days=1), hoy
+    if expresion == "esta semana":
+        return lunes, lunes + timedelta(days=7)
+    if expresion == "semana pasada":
+        return lunes - timedelta(days=7), lunes
+    if expresion == "ultima semana":
+        return ahora - timedelta(days=7), ahora
+    if expresion == "este mes":
+        return _inicio_mes(ahora.year, ahora.month), _inicio_mes(ahora.year, ahora.month + 1)
+    if expresion == "mes pasado":
+        return _inicio_mes(ahora.year, ahora.month - 1), _inicio_mes(ahora.year, ahora.month)
+    if expresion == "ultimo mes":
+        return ahora - timedelta(days=30), ahora
+    if expresion == "este año":
+        return datetime(ahora.year, 1, 1), datetime(ahora.year + 1, 1, 1)
+    if expresion == "año pasado":
+        return datetime(ahora.year - 1, 1, 1), datetime(ahora.year, 1, 1)
+    return ahora - timedelta(days=365), ahora
+
+
+def _extraer_fechas(texto: str, ahora: datetime) -> (str, dict):
+    coincidencia = _FECHAS_ISO.search(texto)
+    if coincidencia:
+        inicio = datetime.fromisoformat(coincidencia.group(1))
+        fin = datetime.fromisoformat(coincidencia.group(2)) + timedelta(days=1) if coincidencia.group(2) else ahora
+    elif (coincidencia := _ULTIMOS_N.search(texto)):
+        cantidad, unidad = int(coincidencia.group(1)), coincidencia.group(2)
+        dias = cantidad * (7 if unidad.startswith("semana") else 30 if unidad.startswith("mes") else 1)
+        inicio, fin = ahora - timedelta(days=dias), ahora
+    elif (coincidencia := _RELATIVAS.search(texto)):
+        inicio, fin = _rango_relativo(coincidencia.group(1), ahora)
+    elif (coincidencia := _MES.search(texto)):
+        mes = MESES.index(coincidencia.group(1)) + 1
+        # Sin año explícito se toma la última ocurrencia de ese mes.
+        anio = int(coincidencia.group(2)) if coincidencia.group(2) else ahora.year - (mes > ahora.month)
+        inicio, fin = _inicio_mes(anio, mes), _inicio_mes(anio, mes + 1)
+    else:
+        return texto, {}
+    texto = texto[:coincidencia.start()] + " param_fechas " + texto[coincidencia.end():]
+    return texto, {"fecha_inicio": inicio, "fecha_fin": fin}
+
+
+def extraer_parametros(pregunta: str, ahora: datetime = None) -> (str, dict):
+    """
+    Separa una pregunta de métricas en su forma (texto normalizado con marcadores
+    `param_fechas`, `param_equipo` y `param_responsable`) y los valores de sus parámetros.
+    Preguntas que solo difieren en fechas, equipo o responsable comparten forma.
+    """
+    ahora = ahora or datetime.utcnow()
+    texto = " ".join(pregunta.casefold().split())
+    parametros = {}
+
+    texto, fechas = _extraer_fechas(texto, ahora)
+    parametros.update(fechas)
+
+    coincidencia = _CORREO.search(texto)
+    if coincidencia:
+        parametros["responsable"] = coincidencia.group(1)
+        texto = texto[:coincidencia.start()] + " param_responsable " + texto[coincidencia.end():]
+
+    for departamento in sorted(listar_departamentos(), key=len, reverse=True):
+        patron = re.compile(r"(?:\b(?:(?:(?:del|de|el|al)\s+)?equipo(?:\s+de)?|del|de|para|en)\s+)?\b" + re.escape(departamento.casefold()) + r"\b")
+        coincidencia = patron.search(texto)
+        if coincidencia:
+            parametros["departamento"] = departamento
+            texto = texto[:coincidencia.start()] + " param_equipo " + texto[coincidencia.end():]
+            break
+
+    # Sin tildes, para que "resolución" y "resolucion" compartan forma.
+    texto = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return normalizar_consulta(texto), parametros
+
+
+def _registrar_resultado(acierto: bool):
+    metrics.incrementar("metricas_sql.hit" if acierto else "metricas_sql.miss")
+    hits, misses = metrics.obtener_contador("metricas_sql.hit"), metrics.obtener_contador("metricas_sql.miss")
+    metrics.fijar("metricas_sql.tasa_acierto", round(hits / (hits + misses), 4))
+
+
+def obtener_plantilla(forma: str, parametros: dict) -> dict | None:
+    """
+    Devuelve la plantilla `{"sql", "parametros", "fijada"}` para la forma de la pregunta si
+    existe y todos sus parámetros tienen valor. Las plantillas fijadas tienen prioridad.
+    """
+    with _lock:
+        plantilla = _fijadas.get(forma)
+    if plantilla is None:
+        plantilla = _plantillas.obtener(forma)
+    if plantilla is None or not set(plantilla["parametros"]) <= set(parametros):
+        _registrar_resultado(False)
+        return None
+    if plantilla["fijada"]:
+        metrics.incrementar("metricas_sql.hit_fijada")
+    _registrar_resultado(True)
+    return plantilla
+
+
+def es_plantilla_fijada(forma: str) -> bool:
+    with _lock:
+        return forma in _fijadas
+
+
+def guardar_plantilla(forma: str, sql: str, parametros: dict) -> bool:
+    """
+    Guarda el SQL generado para la forma de la pregunta. Solo se guarda si todos los valores
+    extraídos de la pregunta llegan como parámetros (ningún valor quedó escrito en el SQL).
+    """
+    usados = validar_sql(sql, parametros)
+    if usados != set(parametros):
+        metrics.incrementar("metricas_sql.no_parametrizable")
+        return False
+    _plantillas.guardar(forma, {"sql": sql, "parametros": sorted(usados), "fijada": False})
+    return True
+
+
+def fijar_plantilla(pregunta: str, sql: str) -> str:
+    """Fija una plantilla revisada para la forma de `pregunta`; nunca expira. Devuelve la forma."""
+    forma, _ = extraer_parametros(pregunta)
+    usados = validar_sql(sql, PARAMETROS_SQL)
+    with _lock:
+        _fijadas[forma] = {"sql": sql, "parametros": sorted(usados), "fijada": True}
+    _plantillas.invalidar(forma)
+    return forma
+
+
+def cargar_plantillas_fijadas(ruta: str = METRICS_SQL_TEMPLATES_PATH) -> int:
+    """
+    Carga las plantillas curadas de un JSON (lista de `{"pregunta", "sql"}`). En el SQL,
+    `{tickets}` y `{eventos}` se reemplazan por los nombres completos de las tablas.
+    """
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            curadas = json.load(archivo)
+    except FileNotFoundError:
+        return 0
+    for curada in curadas:
+        sql = curada["sql"].replace("{tickets}", TICKETS_TABLE_ID).replace("{eventos}", EVENTOS_TABLE_ID)
+        fijar_plantilla(curada["pregunta"], sql)
+    metrics.fijar("metricas_sql.fijadas", len(_fijadas))
+    return len(curadas)
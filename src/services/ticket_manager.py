@@ -1,21 +1,19 @@
 import json
 import uuid
 from datetime import datetime, timedelta
-from google.cloud import bigquery
 from src.utils.bigquery_client import (
-    client, registrar_evento, TICKETS_TABLE_ID, validar_tiquete,
-    obtener_departamento_tiquete, obtener_sla_por_configuracion,
-    obtener_participantes_tiquete
+    registrar_evento, obtener_sla_por_configuracion,
+    obtener_participantes_tiquete, cargar_snapshot_tiquete
 )
+from src.utils.storage_backend import obtener_backend
 from src.config import DATA_ENGINEERING_LEAD, BI_ANALYST_LEAD
-from src.services.ticket_querier import consultar_estado_tiquete
 from src.services.notification_service import enviar_notificacion_email, enviar_notificacion_chat
 from urllib.parse import urlencode
 from src.services.asana_service import crear_tarea_asana
 
 def crear_tiquete(descripcion: str, equipo_asignado: str, prioridad: str, solicitante: str, nombre_solicitante: str, **kwargs) -> str:
     """
-    Crea un nuevo tiquete consultando dinámicamente el SLA desde BigQuery.
+    Crea un nuevo tiquete usando el SLA de la matriz de configuración precargada.
     """
     print(json.dumps({
         "log_name": "CrearTiquete_Inicio", "mensaje": "Iniciando la creación de un nuevo tiquete.",
@@ -24,7 +22,7 @@ def crear_tiquete(descripcion: str, equipo_asignado: str, prioridad: str, solici
     
     try:
         sla_horas = obtener_sla_por_configuracion(equipo_asignado, prioridad)
-        print(f"✅ SLA obtenido de BigQuery para {equipo_asignado}/{prioridad}: {sla_horas} horas.")
+        print(f"✅ SLA obtenido de la configuración para {equipo_asignado}/{prioridad}: {sla_horas} horas.")
         
         fecha_creacion = datetime.utcnow()
         fecha_vencimiento = fecha_creacion + timedelta(hours=sla_horas)
@@ -35,22 +33,15 @@ def crear_tiquete(descripcion: str, equipo_asignado: str, prioridad: str, solici
         
         responsable = DATA_ENGINEERING_LEAD if equipo_asignado == "Data Engineering" else BI_ANALYST_LEAD
         
-        insert_ticket_query = f"""
-            INSERT INTO `{TICKETS_TABLE_ID}` (TicketID, Solicitante, FechaCreacion, SLA_Horas, FechaVencimiento)
-            VALUES (@ticket_id, @solicitante, @fecha_creacion, @sla_horas, @fecha_vencimiento)
-        """
-        job_config_ticket = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("ticket_id", "STRING", ticket_id),
-                bigquery.ScalarQueryParameter("solicitante", "STRING", solicitante),
-                bigquery.ScalarQueryParameter("fecha_creacion", "TIMESTAMP", fecha_creacion),
-                bigquery.ScalarQueryParameter("sla_horas", "INTEGER", sla_horas),
-                bigquery.ScalarQueryParameter("fecha_vencimiento", "TIMESTAMP", fecha_vencimiento),
-            ]
-        )
-        client.query(insert_ticket_query, job_config=job_config_ticket).result()
+        obtener_backend().insertar_tiquete({
+            "TicketID": ticket_id,
+            "Solicitante": solicitante,
+            "FechaCreacion": fecha_creacion,
+            "SLA_Horas": sla_horas,
+            "FechaVencimiento": fecha_vencimiento,
+        })
         
-        detalles_creacion = {"descripcion": descripcion, "equipo_asignado": equipo_asignado, "responsable_inicial": responsable, "prioridad_asignada": prioridad, "sla_calculado_horas": sla_horas}
+        detalles_creacion = {"descripcion": descripcion, "equipo_asignado": equipo_asignado, "responsable_inicial": responsable, "prioridad_asignada": prioridad, "sla_calculado_horas": sla_horas, "fecha_creacion": fecha_creacion.isoformat(), "fecha_vencimiento": fecha_vencimiento.isoformat()}
         registrar_evento(ticket_id, "CREADO", solicitante, detalles_creacion)        
         
         primer_nombre = nombre_solicitante.split(" ")[0]
@@ -76,24 +67,22 @@ def crear_tiquete(descripcion: str, equipo_asignado: str, prioridad: str, solici
 
 def cerrar_tiquete(ticket_id: str, resolucion: str, solicitante_email: str, solicitante_rol: str, solicitante_departamento: str, **kwargs) -> str:
     """Cierra un tiquete y notifica a todas las partes involucradas."""
-    id_normalizado, existe = validar_tiquete(ticket_id.upper())
-    if not existe: return f"Error: El tiquete '{id_normalizado}' no fue encontrado."
+    tiquete = cargar_snapshot_tiquete(ticket_id)
+    id_normalizado = tiquete.ticket_id
+    if not tiquete.existe: return f"Error: El tiquete '{id_normalizado}' no fue encontrado."
 
     if solicitante_rol in ['lead', 'agent']:
-        departamento_tiquete = obtener_departamento_tiquete(id_normalizado)
-        if not departamento_tiquete:
+        if not tiquete.departamento:
             return f"Error: No se pudo determinar el departamento del tiquete {id_normalizado}."
-        if departamento_tiquete != solicitante_departamento:
+        if tiquete.departamento != solicitante_departamento:
             return f"Acción denegada. Tu rol solo permite gestionar tiquetes del departamento '{solicitante_departamento}'."
     if solicitante_rol == 'agent':
-        estado_actual = consultar_estado_tiquete(id_normalizado)
-        if solicitante_email not in estado_actual:
+        if tiquete.responsable != solicitante_email:
              return f"Acción denegada. Como 'agent', solo puedes cerrar tiquetes asignados a ti."
 
     try:
-        participantes = obtener_participantes_tiquete(id_normalizado)
-        email_solicitante_original = participantes.get("solicitante")
-        email_responsable_actual = participantes.get("responsable")
+        email_solicitante_original = tiquete.solicitante
+        email_responsable_actual = tiquete.responsable
 
         detalles_cierre = {"resolucion": resolucion, "cerrado_por": solicitante_email}
         registrar_evento(id_normalizado, "CERRADO", solicitante_email, detalles_cierre)
@@ -115,18 +104,18 @@ def cerrar_tiquete(ticket_id: str, resolucion: str, solicitante_email: str, soli
 
 def reasignar_tiquete(ticket_id: str, nuevo_responsable_email: str, solicitante_email: str, solicitante_rol: str, solicitante_departamento: str, **kwargs) -> str:
     """Reasigna un tiquete y notifica al nuevo responsable."""
-    id_normalizado, existe = validar_tiquete(ticket_id.upper())
-    if not existe: return f"Error: El tiquete '{id_normalizado}' no fue encontrado."
+    tiquete = cargar_snapshot_tiquete(ticket_id)
+    id_normalizado = tiquete.ticket_id
+    if not tiquete.existe: return f"Error: El tiquete '{id_normalizado}' no fue encontrado."
 
     if solicitante_rol == 'lead':
-        departamento_tiquete = obtener_departamento_tiquete(id_normalizado)
-        if not departamento_tiquete:
+        if not tiquete.departamento:
             return f"Error: No se pudo determinar el departamento del tiquete {id_normalizado}."
-        if departamento_tiquete != solicitante_departamento:
+        if tiquete.departamento != solicitante_departamento:
             return f"Acción denegada. Como 'lead', solo puedes reasignar tiquetes de tu departamento ('{solicitante_departamento}')."
     
     try:
-        estado_anterior = consultar_estado_tiquete(id_normalizado)
+        estado_anterior = tiquete.descripcion_estado()
         
         detalles = {"nuevo_responsable": nuevo_responsable_email, "estado_anterior": estado_anterior, "reasignado_por": solicitante_email}
         registrar_evento(id_normalizado, "REASIGNADO", solicitante_email, detalles)
@@ -144,37 +133,22 @@ def reasignar_tiquete(ticket_id: str, nuevo_responsable_email: str, solicitante_
 
 def modificar_sla_manual(ticket_id: str, nuevas_horas_sla: int, solicitante_email: str, solicitante_rol: str, solicitante_departamento: str, **kwargs) -> str:
     """Modifica el SLA con validación de departamento para el rol 'lead'."""
-    id_normalizado, existe = validar_tiquete(ticket_id.upper())
-    if not existe: return f"Error: El tiquete '{id_normalizado}' no fue encontrado."
+    tiquete = cargar_snapshot_tiquete(ticket_id)
+    id_normalizado = tiquete.ticket_id
+    if not tiquete.existe: return f"Error: El tiquete '{id_normalizado}' no fue encontrado."
 
     if solicitante_rol == 'lead':
-        departamento_tiquete = obtener_departamento_tiquete(id_normalizado)
-        if not departamento_tiquete:
+        if not tiquete.departamento:
             return f"Error: No se pudo determinar el departamento del tiquete {id_normalizado}."
-        if departamento_tiquete != solicitante_departamento:
+        if tiquete.departamento != solicitante_departamento:
             return f"Acción denegada. Como 'lead', solo puedes modificar el SLA de tiquetes de tu departamento ('{solicitante_departamento}')."
 
     try:
-        query_fecha = f"SELECT FechaCreacion FROM `{TICKETS_TABLE_ID}` WHERE TicketID = @ticket_id"
-        job_config_fecha = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("ticket_id", "STRING", id_normalizado)])
-        fecha_creacion = list(client.query(query_fecha, job_config=job_config_fecha).result())[0].FechaCreacion
-        nueva_fecha_vencimiento = fecha_creacion + timedelta(hours=nuevas_horas_sla)
+        nueva_fecha_vencimiento = tiquete.fecha_creacion + timedelta(hours=nuevas_horas_sla)
         
-        update_query = f"""
-            UPDATE `{TICKETS_TABLE_ID}`
-            SET SLA_Horas = @nuevas_horas, FechaVencimiento = @nueva_fecha
-            WHERE TicketID = @ticket_id
-        """
-        job_config_update = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("ticket_id", "STRING", id_normalizado),
-                bigquery.ScalarQueryParameter("nuevas_horas", "INTEGER", nuevas_horas_sla),
-                bigquery.ScalarQueryParameter("nueva_fecha", "TIMESTAMP", nueva_fecha_vencimiento),
-            ]
-        )
-        client.query(update_query, job_config=job_config_update).result()
+        obtener_backend().actualizar_sla_tiquete(id_normalizado, nuevas_horas_sla, nueva_fecha_vencimiento)
         
-        detalles = {"nuevo_sla_horas": nuevas_horas_sla, "modificado_por": solicitante_email}
+        detalles = {"nuevo_sla_horas": nuevas_horas_sla, "nueva_fecha_vencimiento": nueva_fecha_vencimiento.isoformat(), "modificado_por": solicitante_email}
         registrar_evento(id_normalizado, "SLA_MODIFICADO", solicitante_email, detalles)
         
         return f"El SLA del tiquete {id_normalizado} ha sido modificado a {nuevas_horas_sla} horas."
@@ -186,15 +160,12 @@ def convertir_incidencia_a_tarea(ticket_id: str, motivo: str, fecha_entrega: str
     """
     Convierte una incidencia existente en una tarea de Asana y lo registra en BigQuery.
     """
-    id_normalizado, existe = validar_tiquete(ticket_id.upper())
-    if not existe: return f"Error: El tiquete '{id_normalizado}' no fue encontrado."
+    tiquete = cargar_snapshot_tiquete(ticket_id)
+    id_normalizado = tiquete.ticket_id
+    if not tiquete.existe: return f"Error: El tiquete '{id_normalizado}' no fue encontrado."
 
     try:
-        estado_actual = consultar_estado_tiquete(id_normalizado)
-        
-        responsable_actual = ""
-        if "asignado a " in estado_actual:
-            responsable_actual = estado_actual.split(" a ")[-1].strip().replace('.','')
+        responsable_actual = tiquete.responsable
 
         if not responsable_actual:
             return "Error: No se pudo determinar el responsable actual del tiquete para asignarlo en Asana."
@@ -1,49 +1,52 @@
 import os
+import re
 import json
 from dotenv import load_dotenv
-from google.cloud import bigquery
 from vertexai.generative_models import GenerativeModel
-from src.utils.bigquery_client import client, TICKETS_TABLE_ID, EVENTOS_TABLE_ID, validar_tiquete
+from src.utils.bigquery_client import TICKETS_TABLE_ID, EVENTOS_TABLE_ID, cargar_snapshot_tiquete
+from src.utils.storage_backend import obtener_backend
+from src.utils import metrics
+from src.services.metrics_cube import responder_desde_cubo
+from src.services.sql_template_cache import PARAMETROS_SQL, extraer_parametros, obtener_plantilla, guardar_plantilla
+from src.services.sql_guard import ConsultaNoPermitida, ConsultaDemasiadoCostosa, validar_sql, verificar_costo, aplicar_limite
+from src.services.result_summary import resumir_resultado
+from src.config import (
+    METRICS_SQL_MAX_BYTES, METRICS_SQL_TIMEOUT_SECONDS, METRICS_SQL_MAX_ATTEMPTS,
+    METRICS_RESULT_LIMIT, METRICS_RESULT_MAX_ROWS
+)
 
 load_dotenv()
 GEMINI_TASK_MODEL = os.getenv("GEMINI_TASK_MODEL")
+_modelo_sql = None
 
 def consultar_estado_tiquete(ticket_id: str, **kwargs) -> str:
-    """Consulta el último evento para determinar el estado actual de un tiquete."""
-    ticket_id = ticket_id.upper()
-    query = f"""
-        SELECT TipoEvento, Detalles
-        FROM `{EVENTOS_TABLE_ID}`
-        WHERE TicketID = @ticket_id
-        ORDER BY FechaEvento DESC
-        LIMIT 1
-    """
-    job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("ticket_id", "STRING", ticket_id)])
+    """Consulta la proyección de estado para describir el estado actual de un tiquete."""
     try:
-        results = list(client.query(query, job_config=job_config).result())
-        if not results:
-            return f"No se encontró ningún tiquete o evento con el ID '{ticket_id}'."
-        
-        ultimo_evento = results[0]
-        detalles = json.loads(ultimo_evento.Detalles)
-        
-        if ultimo_evento.TipoEvento == "CREADO":
-            return f"El tiquete {ticket_id} está 'Abierto' y asignado a {detalles.get('responsable_inicial')}."
-        elif ultimo_evento.TipoEvento == "CERRADO":
-            return f"El tiquete {ticket_id} está 'Cerrado'. Resolución: {detalles.get('resolucion')}."
-        elif ultimo_evento.TipoEvento == "REASIGNADO":
-            return f"El tiquete {ticket_id} está 'Abierto' y ha sido reasignado a {detalles.get('nuevo_responsable')}."
-        else:
-            return f"El último evento para el tiquete {ticket_id} fue '{ultimo_evento.TipoEvento}'."
+        return cargar_snapshot_tiquete(ticket_id).descripcion_estado()
     except Exception as e:
         print(f"🔴 Error al consultar estado: {e}")
         return f"Ocurrió un error al consultar el estado del tiquete: {e}"
 
 
-def consultar_metricas(pregunta_del_usuario: str, **kwargs) -> str:
-    """Convierte una pregunta en lenguaje natural sobre métricas de tiquetes en una consulta SQL."""
-    model = GenerativeModel(GEMINI_TASK_MODEL)
-    
+def _generar_sql(pregunta_del_usuario: str, parametros: dict, correccion: str = "") -> str:
+    """
+    Pide a Gemini el SQL de la pregunta, con los valores de `parametros` como @nombre.
+    `correccion` explica por qué se rechazó el intento anterior.
+    """
+    global _modelo_sql
+    if _modelo_sql is None:
+        _modelo_sql = GenerativeModel(GEMINI_TASK_MODEL)
+
+    if parametros:
+        lineas = "\n".join(f"        -   `@{nombre}` ({PARAMETROS_SQL[nombre]}): {valor}" for nombre, valor in parametros.items())
+        regla_parametros = f"""
+    4.  **PARÁMETROS (OBLIGATORIO):**
+        -   Estos valores vienen de la pregunta. Úsalos SIEMPRE como parámetros con nombre; NUNCA escribas su valor literal en el SQL:
+{lineas}
+        -   Los rangos de fechas son `>= @fecha_inicio AND < @fecha_fin`."""
+    else:
+        regla_parametros = ""
+
     prompt_para_sql = f"""
     Tu tarea es actuar como un experto analista de datos y convertir una pregunta en una consulta SQL para Google BigQuery.
     **Esquema de Tablas:**
@@ -63,22 +66,89 @@ def consultar_metricas(pregunta_del_usuario: str, **kwargs) -> str:
         -   SIEMPRE haz un `JOIN` entre `tickets` y `eventos_tiquetes` por `TicketID`.
     3.  **REGLAS DE FORMATO SQL:**
         -   Usa los nombres completos de las tablas: `{TICKETS_TABLE_ID}` y `{EVENTOS_TABLE_ID}`.
-        -   Responde **ÚNICAMENTE con el código SQL**. No añadas explicaciones, ni la palabra "sql", ni ```.
-    Pregunta del usuario: "{pregunta_del_usuario}"
+        -   Responde **ÚNICAMENTE con el código SQL**. No añadas explicaciones, ni la palabra "sql", ni ```.{regla_parametros}
+    Pregunta del usuario: "{pregunta_del_usuario}"{correccion}
     Consulta SQL:
     """
+    print("▶️  Generando consulta SQL con IA...")
+    response = _modelo_sql.generate_content(prompt_para_sql)
+    metrics.registrar_uso_vertex(response, "consultar_metricas")
+    return re.sub(r"^```(?:sql)?\s*|\s*```$", "", response.text.strip(), flags=re.IGNORECASE).strip().rstrip(";")
+
+
+def _generar_sql_validado(pregunta_del_usuario: str, parametros: dict) -> (str, set):
+    """
+    Genera SQL hasta que pase `validar_sql` y el dry run quede dentro de METRICS_SQL_MAX_BYTES,
+    pidiendo al modelo una versión corregida o más barata tras cada rechazo.
+    Devuelve el SQL y los parámetros que usa.
+    """
+    correccion = ""
+    for intento in range(1, METRICS_SQL_MAX_ATTEMPTS + 1):
+        sql_query = _generar_sql(pregunta_del_usuario, parametros, correccion)
+        print(f"▶️  SQL Generado (intento {intento}): {sql_query}")
+        try:
+            usados = validar_sql(sql_query, parametros)
+            verificar_costo(sql_query, {nombre: parametros[nombre] for nombre in usados})
+            return sql_query, usados
+        except ConsultaDemasiadoCostosa as e:
+            rechazo = e
+            correccion = f"""
+    **CORRECCIÓN:** Esta consulta se rechazó porque es demasiado costosa. {e}
+    {sql_query}
+    Genera una consulta más barata: selecciona solo las columnas necesarias, filtra por fecha lo antes posible y no recorras el historial completo si la pregunta no lo requiere."""
+        except ConsultaNoPermitida as e:
+            rechazo = e
+            correccion = f"""
+    **CORRECCIÓN:** Esta consulta se rechazó: {e}
+    {sql_query}
+    Genera una consulta que cumpla todas las reglas."""
+        metrics.incrementar("metricas_sql.regeneradas")
+        print(f"⚠️  SQL rechazado (intento {intento}/{METRICS_SQL_MAX_ATTEMPTS}): {rechazo}")
+    raise rechazo
+
+
+def consultar_metricas(pregunta_del_usuario: str, **kwargs) -> str:
+    """
+    Convierte una pregunta en lenguaje natural sobre métricas de tiquetes en una consulta SQL.
+    Las preguntas frecuentes (conteos y tiempos de resolución por equipo, responsable,
+    prioridad o día) se responden desde el cubo `metricas_diarias`. Las demás preguntas con
+    la misma forma (ver `extraer_parametros`) reutilizan la plantilla SQL ya validada con los
+    nuevos valores de fechas, equipo o responsable, sin llamar a Gemini.
+    El SQL se ejecuta con un LIMIT de METRICS_RESULT_LIMIT filas y solo se leen las primeras
+    METRICS_RESULT_MAX_ROWS; los resultados grandes vuelven al modelo resumidos.
+    """
+    forma, parametros = extraer_parametros(pregunta_del_usuario)
     try:
-        print("▶️  Generando consulta SQL con IA...")
-        response = model.generate_content(prompt_para_sql)
-        sql_query = response.text.strip().replace("`", "").replace("sql", "", 1)
-        print(f"▶️  SQL Generado (limpio): {sql_query}")
+        rows = responder_desde_cubo(forma, parametros)
+        if rows is not None:
+            print(f"▶️  Respondiendo desde metricas_diarias: '{forma}'")
+            return resumir_resultado(rows)
+
+        plantilla = obtener_plantilla(forma, parametros)
+        if plantilla:
+            print(f"▶️  Usando plantilla SQL en caché para: '{forma}'")
+            sql_query = plantilla["sql"]
+            usados = plantilla["parametros"]
+        else:
+            sql_query, usados = _generar_sql_validado(pregunta_del_usuario, parametros)
         print("▶️  Ejecutando consulta en BigQuery...")
-        query_job = client.query(sql_query)
-        results = query_job.result()
-        rows = [dict(row) for row in results]
-        if not rows:
-            return "La consulta no arrojó resultados."
-        return json.dumps(rows)
+        rows, total_filas = obtener_backend().ejecutar_consulta_acotada(
+            aplicar_limite(sql_query, METRICS_RESULT_LIMIT), {nombre: parametros[nombre] for nombre in usados},
+            max_filas=METRICS_RESULT_MAX_ROWS, max_bytes=METRICS_SQL_MAX_BYTES,
+            timeout_segundos=METRICS_SQL_TIMEOUT_SECONDS
+        )
+        if not plantilla:
+            # Solo se guarda SQL que ya se ejecutó sin errores.
+            guardar_plantilla(forma, sql_query, parametros)
+        resultado = resumir_resultado(rows, total_filas, METRICS_RESULT_LIMIT)
+        print(json.dumps({
+            "log_name": "ConsultarMetricas_Resultado", "forma": forma, "filas_leidas": len(rows),
+            "total_filas": total_filas, "caracteres_resultado": len(resultado),
+        }))
+        return resultado
+    except ConsultaNoPermitida as e:
+        print(f"🔴 Consulta de métricas rechazada: {e}")
+        return f"No pude construir una consulta segura para esa pregunta: {e} Intenta acotarla, por ejemplo a un rango de fechas o a un equipo."
     except Exception as e:
         print(f"🔴 Error al consultar métricas: {e}")
-        return f"Ocurrió un error al procesar la consulta de métricas: {e}"
\ No newline at end of file
+        return f"Ocurrió un error al procesar la consulta de métricas: {e}"
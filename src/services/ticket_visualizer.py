@@ -1,21 +1,153 @@
 import os
 import json
 import io
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv
-from google.cloud import bigquery
 from google.cloud import storage
 from vertexai.preview.vision_models import ImageGenerationModel
-from src.utils.bigquery_client import client, EVENTOS_TABLE_ID, validar_tiquete
+from src.utils.bigquery_client import validar_tiquete, flush_eventos
+from src.utils.storage_backend import obtener_backend
+from src.utils import metrics
+from src.utils.cache import TTLCache
+from src.services.timeline_renderer import renderizar_linea_tiempo, RENDERER_VERSION
+from src.config import TIMELINE_CACHE_TTL_SECONDS, TIMELINE_CACHE_MAX_ENTRIES, TIMELINE_RENDER_WAIT_SECONDS
 
 load_dotenv()
 
 IMAGEN_MODEL = os.getenv("IMAGEN_MODEL")
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 
-def visualizar_flujo_tiquete(ticket_id: str, **kwargs) -> str:
+_storage_client = None
+_storage_lock = threading.Lock()
+# Claves cuyo blob ya se sabe que existe (evita consultar GCS en cada llamada).
+_urls_conocidas = TTLCache("visualizador.urls", TIMELINE_CACHE_TTL_SECONDS, TIMELINE_CACHE_MAX_ENTRIES)
+# Una sola generación por clave: las llamadas concurrentes esperan el Future de la primera.
+_en_vuelo = {}
+_en_vuelo_lock = threading.Lock()
+
+
+def _obtener_bucket():
+    global _storage_client
+    with _storage_lock:
+        if _storage_client is None:
+            _storage_client = storage.Client()
+    return _storage_client.bucket(GCS_BUCKET_NAME)
+
+
+def clave_linea_tiempo(ticket_id: str, eventos: list, version: str) -> str:
+    """
+    Hash del tiquete (su ID va en el título de la imagen), de la lista de eventos y de la versión
+    del dibujo: mientras no cambien, la imagen es la misma.
     """
-    Genera una infografía, la sube a Google Cloud Storage y devuelve un objeto JSON 
-    estructurado con la URL pública y el ID del tiquete.
+    contenido = json.dumps(
+        [ticket_id, version] + [[e["TipoEvento"], e["FechaEvento"], e.get("Detalles"), e.get("Autor")] for e in eventos],
+        default=str
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:24]
+
+def generar_con_imagen(ticket_id: str, eventos: list) -> bytes:
+    """Modo "estilizado": describe la línea de tiempo en un prompt y la dibuja Imagen. Devuelve el PNG."""
+    prompt_para_imagen = (
+        f"Crea una infografía de una **línea de tiempo horizontal** para el tiquete de soporte '{ticket_id}'. "
+        "El diseño debe ser **ultra moderno, limpio y minimalista**, similar a los componentes de UI de alta gama. "
+        "Usa una paleta de colores sofisticada con gradientes sutiles. Fondo blanco o gris muy claro (#F9FAFB).\n\n"
+        f"En la parte superior, agrega un título principal que diga 'Historial del Tiquete {ticket_id}'.\n\n"
+        "Dibuja una línea gris delgada que conecte los siguientes hitos en orden cronológico de izquierda a derecha:\n"
+    )
+
+    total_eventos = len(eventos)
+    for i, evento in enumerate(eventos):
+        tipo_evento = evento["TipoEvento"].replace("_", " ").title()
+        fecha_local = evento["FechaEvento"].astimezone().strftime('%d %b, %H:%M')
+        detalles = json.loads(evento["Detalles"])
+        es_el_ultimo_evento = (i == total_eventos - 1)
+
+        prompt_para_imagen += "\n- "
+        if es_el_ultimo_evento and tipo_evento.lower() != "cerrado":
+            prompt_para_imagen += f"Un círculo grande con un gradiente de azul a cian, con un sutil brillo exterior para indicar que es el estado actual. Dentro del círculo, el texto '{tipo_evento}' en negrita blanca. Debajo, la fecha '{fecha_local}' en gris claro. "
+        else:
+            prompt_para_imagen += f"Un círculo pequeño de color verde sólido con un ícono de checkmark blanco adentro. Arriba del círculo, el título del evento '{tipo_evento}' en negrita. Debajo del círculo, la fecha '{fecha_local}' en texto gris. "
+
+        if tipo_evento.lower() == "creado":
+            prompt_para_imagen += f"Añade un texto pequeño debajo de la fecha: 'Prioridad {detalles.get('prioridad_asignada', 'N/A')}'. "
+        elif tipo_evento.lower() == "reasignado":
+            prompt_para_imagen += f"Añade un texto pequeño debajo de la fecha: 'Asignado a {detalles.get('nuevo_responsable', 'N/A')}'. "
+
+    generation_model = ImageGenerationModel.from_pretrained(IMAGEN_MODEL)
+
+    print("▶️  Generando imagen con IA...")
+    with metrics.cronometrar("visualizador.render_imagen"):
+        images = generation_model.generate_images(
+            prompt=prompt_para_imagen, number_of_images=1, aspect_ratio="16:9"
+        )
+
+    buffer = io.BytesIO()
+    images[0]._pil_image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _subir_si_no_existe(nombre_blob: str, generar) -> str:
+    """Sube el PNG que devuelve `generar()` salvo que el blob ya exista. Devuelve la URL pública."""
+    from google.api_core.exceptions import PreconditionFailed
+
+    blob = _obtener_bucket().blob(nombre_blob)
+    if blob.exists():
+        metrics.incrementar("visualizador.blob_existente")
+        return blob.public_url
+    image_bytes = generar()
+    print(f"▶️  Subiendo imagen al bucket '{GCS_BUCKET_NAME}'...")
+    # El nombre depende del contenido: si otra instancia lo subió primero, vale su copia.
+    blob.cache_control = "public, max-age=31536000, immutable"
+    try:
+        blob.upload_from_string(image_bytes, content_type="image/png", if_generation_match=0)
+        metrics.incrementar("visualizador.generadas")
+    except PreconditionFailed:
+        metrics.incrementar("visualizador.blob_existente")
+    return blob.public_url
+
+
+def obtener_url_linea_tiempo(ticket_id: str, eventos: list, generar, version: str) -> str:
+    """
+    Devuelve la URL de la imagen de la línea de tiempo para estos eventos y esta versión del
+    dibujo. El blob `flujos/{ticket_id}_{clave}.png` se nombra por contenido: si ya existe se
+    reutiliza; si no, se genera con `generar()` y se sube una sola vez, aunque lleguen varias
+    solicitudes del mismo tiquete al mismo tiempo.
+    """
+    clave = clave_linea_tiempo(ticket_id, eventos, version)
+    url = _urls_conocidas.obtener(clave)
+    if url:
+        return url
+
+    with _en_vuelo_lock:
+        future = _en_vuelo.get(clave)
+        propio = future is None
+        if propio:
+            future = _en_vuelo[clave] = Future()
+    if not propio:
+        metrics.incrementar("visualizador.espera_compartida")
+        return future.result(timeout=TIMELINE_RENDER_WAIT_SECONDS)
+
+    try:
+        url = _subir_si_no_existe(f"flujos/{ticket_id}_{clave}.png", generar)
+        _urls_conocidas.guardar(clave, url)
+        future.set_result(url)
+        return url
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _en_vuelo_lock:
+            _en_vuelo.pop(clave, None)
+
+
+def visualizar_flujo_tiquete(ticket_id: str, estilizado: bool = False, **kwargs) -> str:
+    """
+    Dibuja la línea de tiempo del tiquete, la sube a Google Cloud Storage y devuelve un objeto
+    JSON estructurado con la URL pública y el ID del tiquete. Por defecto la dibuja localmente
+    (ver `timeline_renderer`); con `estilizado` y IMAGEN_MODEL configurado, la genera Imagen.
+    Si los eventos no cambiaron desde el último diagrama, se devuelve la misma imagen.
     """
     if not GCS_BUCKET_NAME:
         return json.dumps({"error": "Error de configuración: La variable de entorno GCS_BUCKET_NAME no está definida."})
@@ -25,79 +157,30 @@ def visualizar_flujo_tiquete(ticket_id: str, **kwargs) -> str:
     if not existe:
         return json.dumps({"error": f"Error: El tiquete '{id_normalizado}' no fue encontrado."})
 
-    query = f"""
-        SELECT TipoEvento, FechaEvento, Detalles, Autor
-        FROM `{EVENTOS_TABLE_ID}`
-        WHERE TicketID = @ticket_id
-        ORDER BY FechaEvento ASC
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("ticket_id", "STRING", ticket_id)
-        ]
-    )
-    
+    flush_eventos(ticket_id)
     try:
-        eventos = list(client.query(query, job_config=job_config).result())
+        eventos = obtener_backend().listar_eventos(ticket_id)
         
         if not eventos:
             return json.dumps({"error": f"No se encontró historial para el tiquete con ID '{ticket_id}'."})
-        
-        prompt_para_imagen = (
-            f"Crea una infografía de una **línea de tiempo horizontal** para el tiquete de soporte '{ticket_id}'. "
-            "El diseño debe ser **ultra moderno, limpio y minimalista**, similar a los componentes de UI de alta gama. "
-            "Usa una paleta de colores sofisticada con gradientes sutiles. Fondo blanco o gris muy claro (#F9FAFB).\n\n"
-            f"En la parte superior, agrega un título principal que diga 'Historial del Tiquete {ticket_id}'.\n\n"
-            "Dibuja una línea gris delgada que conecte los siguientes hitos en orden cronológico de izquierda a derecha:\n"
-        )
 
-        total_eventos = len(eventos)
-        for i, evento in enumerate(eventos):
-            tipo_evento = evento.TipoEvento.replace("_", " ").title()
-            fecha_local = evento.FechaEvento.astimezone().strftime('%d %b, %H:%M')
-            detalles = json.loads(evento.Detalles)
-            es_el_ultimo_evento = (i == total_eventos - 1)
-            
-            prompt_para_imagen += "\n- "
-            if es_el_ultimo_evento and tipo_evento.lower() != "cerrado":
-                prompt_para_imagen += f"Un círculo grande con un gradiente de azul a cian, con un sutil brillo exterior para indicar que es el estado actual. Dentro del círculo, el texto '{tipo_evento}' en negrita blanca. Debajo, la fecha '{fecha_local}' en gris claro. "
-            else:
-                prompt_para_imagen += f"Un círculo pequeño de color verde sólido con un ícono de checkmark blanco adentro. Arriba del círculo, el título del evento '{tipo_evento}' en negrita. Debajo del círculo, la fecha '{fecha_local}' en texto gris. "
-            
-            if tipo_evento.lower() == "creado":
-                prompt_para_imagen += f"Añade un texto pequeño debajo de la fecha: 'Prioridad {detalles.get('prioridad_asignada', 'N/A')}'. "
-            elif tipo_evento.lower() == "reasignado":
-                prompt_para_imagen += f"Añade un texto pequeño debajo de la fecha: 'Asignado a {detalles.get('nuevo_responsable', 'N/A')}'. "
-        
-        generation_model = ImageGenerationModel.from_pretrained(IMAGEN_MODEL)
-        
-        print("▶️  Generando imagen con IA...")
-        images = generation_model.generate_images(
-            prompt=prompt_para_imagen, number_of_images=1, aspect_ratio="16:9"
-        )
-        
-        buffer = io.BytesIO()
-        images[0]._pil_image.save(buffer, format='PNG')
-        image_bytes = buffer.getvalue()
+        if estilizado and IMAGEN_MODEL:
+            url = obtener_url_linea_tiempo(ticket_id, eventos, lambda: generar_con_imagen(ticket_id, eventos), f"imagen-{IMAGEN_MODEL}")
+        else:
+            url = obtener_url_linea_tiempo(ticket_id, eventos, lambda: renderizar_linea_tiempo(ticket_id, eventos), f"local-{RENDERER_VERSION}")
 
-        print(f"▶️  Subiendo imagen al bucket '{GCS_BUCKET_NAME}'...")
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
-        
-        nombre_archivo_en_bucket = f"flujos/{ticket_id}_timeline.png"
-        blob = bucket.blob(nombre_archivo_en_bucket)
-        
-        blob.upload_from_string(image_bytes, content_type="image/png")
-        
-        print(f"✅ Imagen disponible en: {blob.public_url}")
+        print(f"✅ Imagen disponible en: {url}")
         
         response_data = {
             "type": "image_flow",
-            "imageUrl": blob.public_url,
+            "imageUrl": url,
             "ticketId": ticket_id
         }
         return json.dumps(response_data)
 
+    except FuturesTimeoutError:
+        print(f"🔴 El diagrama del tiquete {ticket_id} tardó demasiado en generarse.")
+        return json.dumps({"error": f"El diagrama del tiquete '{ticket_id}' tardó demasiado en generarse. Intenta de nuevo en unos momentos."})
     except Exception as e:
         print(f"🔴 Error al visualizar el flujo: {e}")
         return json.dumps({"error": f"Ocurrió un error al intentar generar el diagrama del tiquete: {e}"})
\ No newline at end of file
@@ -0,0 +1,186 @@
+import json
+import threading
+import multiprocessing
+from io import BytesIO
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageDraw, ImageFont
+from src.config import TIMELINE_RENDER_WORKERS, TIMELINE_RENDER_TIMEOUT_SECONDS
+from src.utils import metrics
+
+# Cambia cuando cambia el dibujo; las imágenes ya subidas de versiones anteriores dejan de reutilizarse.
+RENDERER_VERSION = "1"
+
+ANCHO, ALTO = 1600, 900
+MARGEN = 140
+Y_LINEA = 470
+FONDO = "#F9FAFB"
+GRIS_LINEA = "#D1D5DB"
+GRIS_TEXTO = "#6B7280"
+TEXTO = "#111827"
+VERDE = "#10B981"
+AZUL = "#2563EB"
+MAX_CARACTERES_DETALLE = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def preparar_hitos(eventos: list) -> list:
+    """
+    Convierte las filas de `listar_eventos` en los hitos que se dibujan: tipo, fecha local,
+    detalle (prioridad al crear, responsable al reasignar) y si es el estado actual.
+    Solo contiene tipos simples para poder enviarse al pool de procesos.
+    """
+    hitos = []
+    for i, evento in enumerate(eventos):
+        tipo = evento["TipoEvento"].replace("_", " ").title()
+        detalles = json.loads(evento["Detalles"]) if evento.get("Detalles") else {}
+        if evento["TipoEvento"] == "CREADO":
+            detalle = f"Prioridad {detalles.get('prioridad_asignada', 'N/A')}"
+        elif evento["TipoEvento"] == "REASIGNADO":
+            detalle = f"Asignado a {detalles.get('nuevo_responsable', 'N/A')}"
+        else:
+            detalle = ""
+        hitos.append({
+            "tipo": tipo,
+            "fecha": evento["FechaEvento"].astimezone().strftime('%d %b, %H:%M'),
+            "detalle": detalle,
+            "actual": i == len(eventos) - 1 and evento["TipoEvento"] != "CERRADO",
+        })
+    return hitos
+
+
+def _recortar(texto: str, maximo: int) -> str:
+    return texto if len(texto) <= maximo else texto[:maximo - 1] + "…"
+
+
+def _posiciones(hitos: list) -> list:
+    """Coordenada x de cada hito y si sus textos van debajo de la línea (se alternan cuando hay muchos)."""
+    if len(hitos) == 1:
+        return [(ANCHO // 2, None)]
+    paso = (ANCHO - 2 * MARGEN) / (len(hitos) - 1)
+    return [(int(MARGEN + i * paso), i % 2 == 1 if len(hitos) > 6 else None) for i in range(len(hitos))]
+
+
+def _textos(hito: dict, radio: int, abajo, densa: bool) -> list:
+    """
+    Textos de un hito como (y, texto, tamaño, negrita, color), con y al centro del texto.
+    Con pocos hitos el título va arriba y la fecha abajo; con muchos, los tres textos van
+    juntos arriba o abajo de la línea, alternando, para que no se encimen con los vecinos.
+    """
+    color_titulo = AZUL if hito["actual"] else TEXTO
+    detalle = _recortar(hito["detalle"], MAX_CARACTERES_DETALLE // 2 + 4 if densa else MAX_CARACTERES_DETALLE)
+    if abajo is None:
+        y_titulo, y_fecha = Y_LINEA - radio - 30, Y_LINEA + radio + 36
+    elif abajo:
+        y_titulo, y_fecha = Y_LINEA + radio + 30, Y_LINEA + radio + 66
+    else:
+        y_titulo, y_fecha = Y_LINEA - radio - 110, Y_LINEA - radio - 74
+    textos = [(y_titulo, hito["tipo"], 26, True, color_titulo), (y_fecha, hito["fecha"], 22, False, GRIS_TEXTO)]
+    if detalle:
+        textos.append((y_fecha + 32, detalle, 18, False, GRIS_TEXTO))
+    return textos
+
+
+@lru_cache(maxsize=None)
+def _fuente(tamano: int, negrita: bool = False):
+    for nombre in (["DejaVuSans-Bold.ttf"] if negrita else []) + ["DejaVuSans.ttf"]:
+        try:
+            return ImageFont.truetype(nombre, tamano)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=tamano)
+
+
+def _dibujar_png(ticket_id: str, hitos: list) -> bytes:
+    imagen = Image.new("RGB", (ANCHO, ALTO), FONDO)
+    lienzo = ImageDraw.Draw(imagen)
+    lienzo.text((ANCHO // 2, 110), f"Historial del Tiquete {ticket_id}", fill=TEXTO, font=_fuente(48, True), anchor="mm")
+    posiciones = _posiciones(hitos)
+    lienzo.line([(posiciones[0][0], Y_LINEA), (posiciones[-1][0], Y_LINEA)], fill=GRIS_LINEA, width=4)
+
+    for hito, (x, abajo) in zip(hitos, posiciones):
+        radio = 34 if hito["actual"] else 20
+        if hito["actual"]:
+            lienzo.ellipse([x - radio - 10, Y_LINEA - radio - 10, x + radio + 10, Y_LINEA + radio + 10], fill="#DBEAFE")
+            lienzo.ellipse([x - radio, Y_LINEA - radio, x + radio, Y_LINEA + radio], fill=AZUL)
+        else:
+            lienzo.ellipse([x - radio, Y_LINEA - radio, x + radio, Y_LINEA + radio], fill=VERDE)
+            lienzo.line([(x - 9, Y_LINEA), (x - 3, Y_LINEA + 7), (x + 9, Y_LINEA - 7)], fill="white", width=4)
+        for y, texto, tamano, negrita, color in _textos(hito, radio, abajo, len(hitos) > 10):
+            lienzo.text((x, y), texto, fill=color, font=_fuente(tamano, negrita), anchor="mm")
+
+    buffer = BytesIO()
+    imagen.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _calentar():
+    for tamano, negrita in ((48, True), (26, True), (22, False), (18, False)):
+        _fuente(tamano, negrita)
+
+
+def dibujar_linea_tiempo(ticket_id: str, hitos: list) -> bytes:
+    """Dibuja la línea de tiempo de los hitos en PNG con Pillow. Es la tarea que corre en el pool."""
+    return _dibujar_png(ticket_id, hitos)
+
+
+def _obtener_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "fork" copiaría un proceso que ya tiene hilos (gRPC, Vertex, refresco de SLA) y locks
+            # tomados. El forkserver arranca limpio y solo precarga este módulo (Pillow, config y
+            # métricas); los procesos del pool se crean desde él.
+            contexto = multiprocessing.get_context("forkserver")
+            contexto.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=TIMELINE_RENDER_WORKERS, mp_context=contexto)
+        return _pool
+
+
+def _descartar_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iniciar_pool_render():
+    """
+    Arranca los procesos del pool al inicio para que el primer diagrama no pague su arranque.
+    """
+    if TIMELINE_RENDER_WORKERS <= 0:
+        return
+    pool = _obtener_pool()
+    for _ in range(TIMELINE_RENDER_WORKERS):
+        pool.submit(_calentar)
+
+
+def renderizar_linea_tiempo(ticket_id: str, eventos: list) -> bytes:
+    """
+    Dibuja la línea de tiempo de los eventos de un tiquete. El dibujo corre en un pool de
+    procesos para no retener el GIL de los hilos que atienden solicitudes; con
+    TIMELINE_RENDER_WORKERS=0, o si el pool se rompe, se dibuja en el propio hilo.
+    Si el dibujo tarda más de TIMELINE_RENDER_TIMEOUT_SECONDS se propaga el TimeoutError.
+    """
+    hitos = preparar_hitos(eventos)
+    with metrics.cronometrar("visualizador.render_local"):
+        if TIMELINE_RENDER_WORKERS <= 0:
+            return dibujar_linea_tiempo(ticket_id, hitos)
+        pool = _obtener_pool()
+        future = pool.submit(dibujar_linea_tiempo, ticket_id, hitos)
+        try:
+            return future.result(timeout=TIMELINE_RENDER_TIMEOUT_SECONDS)
+        except FuturesTimeoutError:
+            future.cancel()
+            metrics.incrementar("visualizador.render_timeout")
+            print(f"⚠️  El dibujo de la línea de tiempo de {ticket_id} superó {TIMELINE_RENDER_TIMEOUT_SECONDS}s.")
+            raise
+        except BrokenProcessPool:
+            metrics.incrementar("visualizador.pool_reiniciado")
+            print("⚠️  El pool de render se detuvo; se dibuja en el hilo actual y se recreará en la próxima llamada.")
+            _descartar_pool(pool)
+            return dibujar_linea_tiempo(ticket_id, hitos)
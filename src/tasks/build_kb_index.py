@@ -0,0 +1,57 @@
+import os
+import argparse
+import tempfile
+from src.services.knowledge_service import (
+    storage_client, embedding_model, documentos_kb, KB_BUCKET_NAME, KB_PREFIX
+)
+from src.config import KB_VECTOR_INDEX_PATH, KB_INDEX_EMBED_BATCH_SIZE, KB_INDEX_MAX_CHARS
+from src.utils.vector_index import guardar_snapshot, ARCHIVO_EMBEDDINGS, ARCHIVO_IDS
+
+def _embeddings_documentos(textos: list) -> list:
+    """
+    Embeddings de documentos completos, en lotes de KB_INDEX_EMBED_BATCH_SIZE y truncados a
+    KB_INDEX_MAX_CHARS para no pasar el límite de entrada de la API. No usan la caché de
+    embeddings, que es solo para las consultas de los usuarios.
+    """
+    vectores = []
+    for inicio in range(0, len(textos), KB_INDEX_EMBED_BATCH_SIZE):
+        lote = [texto[:KB_INDEX_MAX_CHARS] for texto in textos[inicio:inicio + KB_INDEX_EMBED_BATCH_SIZE]]
+        vectores.extend(embedding.values for embedding in embedding_model.get_embeddings(lote, auto_truncate=True))
+    return vectores
+
+def construir_indice_kb(destino: str = KB_VECTOR_INDEX_PATH) -> int:
+    """
+    Genera el snapshot del índice vectorial local a partir de los documentos de `fuentes/`:
+    un embedding por documento (con el mismo modelo que las consultas, ver `_embeddings_documentos`) guardado como
+    `embeddings.npy` + `ids.json` en `destino` (directorio local o gs://bucket/ruta).
+    """
+    print(f"🚀 Construyendo el índice vectorial de la KB en {destino}...")
+    ids, textos = [], []
+    for blob in storage_client.bucket(KB_BUCKET_NAME).list_blobs(prefix=KB_PREFIX):
+        if blob.name.endswith("/"):
+            continue
+        texto = documentos_kb.obtener(blob.name)
+        if not texto:
+            continue
+        textos.append(texto)
+        ids.append(blob.name[len(KB_PREFIX):])
+    embeddings = _embeddings_documentos(textos)
+
+    if destino.startswith("gs://"):
+        bucket_nombre, _, prefijo = destino[len("gs://"):].partition("/")
+        bucket = storage_client.bucket(bucket_nombre)
+        with tempfile.TemporaryDirectory() as directorio:
+            guardar_snapshot(directorio, ids, embeddings)
+            for archivo in (ARCHIVO_EMBEDDINGS, ARCHIVO_IDS):
+                bucket.blob(f"{prefijo.rstrip('/')}/{archivo}").upload_from_filename(os.path.join(directorio, archivo))
+    else:
+        guardar_snapshot(destino, ids, embeddings)
+
+    print(f"✅ Índice vectorial construido con {len(ids)} documentos.")
+    return len(ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construye el snapshot del índice vectorial local de la KB.")
+    parser.add_argument("--destino", default=KB_VECTOR_INDEX_PATH, help="Directorio local o gs://bucket/ruta.")
+    args = parser.parse_args()
+    construir_indice_kb(args.destino)
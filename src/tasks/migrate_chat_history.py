@@ -0,0 +1,40 @@
+import argparse
+from src.services.memory_service import db, HISTORY_COLLECTION, FORMATO_HISTORIAL, migrar_historial_sesion
+
+def migrar_historiales(session_id: str = None, simular: bool = False) -> int:
+    """
+    Migra los historiales guardados como un arreglo `history` en un solo documento al formato
+    paginado (subcolección `mensajes`). Solo lee el campo `formato` para decidir qué migrar, así
+    que puede ejecutarse varias veces. Devuelve el número de sesiones migradas.
+    """
+    print(f"🚀 Migrando historiales de chat: {session_id or 'todas las sesiones'}{' (simulación)' if simular else ''}...")
+    if session_id:
+        documentos = [db.collection(HISTORY_COLLECTION).document(session_id).get()]
+    else:
+        documentos = db.collection(HISTORY_COLLECTION).select(["formato"]).stream()
+
+    sesiones, mensajes = 0, 0
+    for doc in documentos:
+        if not doc.exists or (doc.to_dict() or {}).get("formato") == FORMATO_HISTORIAL:
+            continue
+        if simular:
+            print(f"  • {doc.id}: pendiente de migrar.")
+            sesiones += 1
+            continue
+        try:
+            migrados = migrar_historial_sesion(doc.id)
+            sesiones += 1
+            mensajes += migrados
+            print(f"  • {doc.id}: {migrados} mensajes migrados.")
+        except Exception as e:
+            print(f"🔴 Error migrando el historial {doc.id}: {e}")
+
+    print(f"✅ Migración finalizada: {sesiones} sesiones, {mensajes} mensajes.")
+    return sesiones
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra los historiales de chat al formato paginado en Firestore.")
+    parser.add_argument("--session-id", help="Migra solo esta sesión.")
+    parser.add_argument("--simular", action="store_true", help="Lista las sesiones pendientes sin modificarlas.")
+    args = parser.parse_args()
+    migrar_historiales(args.session_id, args.simular)
@@ -0,0 +1,72 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+from src.config import PROJECTION_LOOKBACK_HOURS
+from src.utils import metrics
+from src.utils.bigquery_client import flush_eventos
+from src.utils.storage_backend import obtener_backend
+from src.utils.ticket_state import proyectar_eventos, filas_cubo
+
+TAMANO_LOTE = 500
+
+def _guardar_estados(backend, estados: list):
+    for inicio in range(0, len(estados), TAMANO_LOTE):
+        backend.guardar_estados_tiquetes(estados[inicio:inicio + TAMANO_LOTE])
+
+def reconstruir_ticket_state(ticket_id: str = None) -> int:
+    """
+    Reproduce el log de `eventos_tiquetes` para reconstruir la proyección `ticket_state`
+    completa, o solo la de un tiquete si se indica `ticket_id`. Sirve tanto para el
+    backfill inicial como para reparar estados inconsistentes. La reconstrucción completa
+    también recalcula el cubo `metricas_diarias` (sus medidas no se pueden restar por tiquete).
+    """
+    print(f"🚀 Reconstruyendo ticket_state para: {ticket_id or 'todos los tiquetes'}...")
+    flush_eventos()
+    backend = obtener_backend()
+    backend.asegurar_tabla_estado()
+
+    eventos = backend.listar_eventos_historicos([ticket_id.upper()] if ticket_id else None)
+    cubo = {} if ticket_id is None else None
+    estados = list(proyectar_eventos({}, eventos, cubo).values())
+    _guardar_estados(backend, estados)
+
+    if cubo is not None:
+        backend.asegurar_tabla_cubo()
+        filas = filas_cubo(cubo)
+        backend.reemplazar_metricas_diarias(filas)
+        print(f"✅ metricas_diarias reconstruida: {len(filas)} filas.")
+
+    print(f"✅ ticket_state reconstruida: {len(estados)} tiquetes a partir de {len(eventos)} eventos.")
+    return len(estados)
+
+def actualizar_proyecciones(horas: float = PROJECTION_LOOKBACK_HOURS) -> int:
+    """
+    Reconciliación programada de `ticket_state` y `metricas_diarias` (ver `POST /refresh-projections`).
+    Ambas se actualizan en cada flush de eventos; esto repara los lotes cuya proyección falló.
+    Reproyecta desde el log completo los tiquetes con algún evento desde el inicio del día UTC
+    de hace `horas` y reemplaza los días de ese rango en el cubo. Cada ejecución recalcula
+    desde los eventos en lugar de sumar sobre lo guardado, así que dos instancias que la
+    corran a la vez escriben el mismo resultado.
+    """
+    flush_eventos()
+    backend = obtener_backend()
+    desde = datetime.now(timezone.utc) - timedelta(hours=horas)
+    inicio_dia = desde.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    cubo = {}
+    eventos = backend.listar_eventos_historicos(activos_desde=inicio_dia)
+    estados = list(proyectar_eventos({}, eventos, cubo).values())
+    _guardar_estados(backend, estados)
+    # Los tiquetes de la ventana traen todo su historial; solo los días del rango se reemplazan.
+    filas = [fila for fila in filas_cubo(cubo) if fila["Fecha"] >= inicio_dia.date()]
+    backend.reemplazar_metricas_diarias(filas, desde=inicio_dia.date())
+
+    metrics.incrementar("ticket_state.actualizaciones", len(estados))
+    metrics.incrementar("metricas_diarias.actualizaciones", len(filas))
+    print(f"✅ Proyecciones actualizadas: {len(estados)} tiquetes y {len(filas)} filas del cubo desde {inicio_dia.date()}.")
+    return len(estados)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruye la proyección ticket_state desde el log de eventos.")
+    parser.add_argument("--ticket-id", help="Reconstruye solo este tiquete.")
+    args = parser.parse_args()
+    reconstruir_ticket_state(args.ticket_id)
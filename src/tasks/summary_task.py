@@ -1,61 +1,30 @@
 from datetime import datetime, timezone, timedelta
 from collections import defaultdict
-from src.services.notification_service import enviar_notificacion_email, enviar_notificacion_chat
-from src.utils.bigquery_client import client, TICKETS_TABLE_ID, EVENTOS_TABLE_ID
+from src.services.notification_service import enviar_emails_en_lote, enviar_notificacion_chat, esperar_notificaciones
+from src.utils.storage_backend import obtener_backend
+from src.utils.bigquery_client import flush_eventos
 
 def get_open_tickets_summary():
     """
     Consulta BigQuery para obtener todos los datos necesarios para los resúmenes, 
     incluyendo solicitante, responsable, fecha de vencimiento y departamento.
     """
-    query = f"""
-    WITH CreacionEventos AS (
-        SELECT
-            TicketID,
-            JSON_EXTRACT_SCALAR(Detalles, '$.equipo_asignado') as Departamento
-        FROM `{EVENTOS_TABLE_ID}`
-        WHERE TipoEvento = 'CREADO'
-    ),
-    UltimosEventosConResponsable AS (
-        SELECT
-            TicketID,
-            COALESCE(
-                JSON_EXTRACT_SCALAR(Detalles, '$.nuevo_responsable'),
-                JSON_EXTRACT_SCALAR(Detalles, '$.responsable_inicial')
-            ) as Responsable,
-            TipoEvento,
-            ROW_NUMBER() OVER(PARTITION BY TicketID ORDER BY FechaEvento DESC) as rn
-        FROM `{EVENTOS_TABLE_ID}`
-    )
-    SELECT
-        t.TicketID,
-        t.Solicitante,
-        t.FechaVencimiento,
-        ue.Responsable,
-        ce.Departamento
-    FROM `{TICKETS_TABLE_ID}` t
-    JOIN UltimosEventosConResponsable ue ON t.TicketID = ue.TicketID
-    JOIN CreacionEventos ce ON t.TicketID = ce.TicketID
-    WHERE 
-        ue.rn = 1 
-        AND ue.TipoEvento != 'CERRADO'
-        AND t.FechaVencimiento IS NOT NULL
-    """
+    flush_eventos()
     try:
-        results = client.query(query).result()
+        results = obtener_backend().listar_tiquetes_abiertos()
         all_tickets = []
         user_tickets = defaultdict(list)
         
         for row in results:
             ticket_data = {
-                "ticket_id": row.TicketID,
-                "solicitante": row.Solicitante,
-                "due_date": row.FechaVencimiento,
-                "assignee": row.Responsable or "No asignado",
-                "departamento": row.Departamento or "Sin Departamento"
+                "ticket_id": row["TicketID"],
+                "solicitante": row["Solicitante"],
+                "due_date": row["FechaVencimiento"],
+                "assignee": row["Responsable"] or "No asignado",
+                "departamento": row["Departamento"] or "Sin Departamento"
             }
             all_tickets.append(ticket_data)
-            user_tickets[row.Solicitante].append(ticket_data)
+            user_tickets[row["Solicitante"]].append(ticket_data)
             
         return all_tickets, user_tickets
     except Exception as e:
@@ -137,6 +106,7 @@ def send_daily_summaries():
     print("📢 Enviando resumen de administrador al canal principal...")
     enviar_notificacion_chat(admin_summary)
 
+    correos = []
     for user_email, tickets in user_tickets.items():
         asunto = "📄 Tu Resumen Diario de Tiquetes Abiertos"
         html_body = "<html><body><h2>Hola,</h2><p>Este es tu resumen diario de tiquetes de soporte abiertos:</p>"
@@ -148,8 +118,16 @@ def send_daily_summaries():
             html_body += f"<tr><td>{ticket['ticket_id']}</td><td>{ticket['assignee']}</td><td style='text-align:center;'>{time_left}</td></tr>"
         
         html_body += "</table><p>Gracias,<br>Dex Helpdesk AI</p></body></html>"
-        
-        print(f"✉️  Enviando resumen por email a {user_email}...")
-        enviar_notificacion_email(user_email, asunto, html_body)
+        correos.append({"destinatario": user_email, "asunto": asunto, "cuerpo_html": html_body})
+
+    print(f"✉️  Enviando {len(correos)} resúmenes por email en lotes...")
+    resultados = enviar_emails_en_lote(correos)
+    fallidos = [email for email, enviado in resultados.items() if not enviado]
+    print(f"📬 Resúmenes por email: {len(resultados) - len(fallidos)} enviados, {len(fallidos)} fallidos.")
+    for email in fallidos:
+        print(f"🔴 No se pudo enviar el resumen diario a {email}.")
 
+    # La tarea corre dentro de una petición: se espera la entrega antes de responder.
+    if not esperar_notificaciones():
+        print("⚠️  Quedaron notificaciones pendientes; se reintentarán en segundo plano o se guardarán al cerrar.")
     print("✅ Proceso de resúmenes diarios finalizado.")
\ No newline at end of file
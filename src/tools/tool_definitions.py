@@ -43,7 +43,14 @@ modificar_sla_declaration = FunctionDeclaration(
 visualizar_flujo_declaration = FunctionDeclaration(
     name="visualizar_flujo_tiquete",
     description="Muestra el historial completo de un tiquete como una infografía visual.",
-    parameters={"type": "object", "properties": {"ticket_id": {"type": "string"}}, "required": ["ticket_id"]}
+    parameters={
+        "type": "object",
+        "properties": {
+            "ticket_id": {"type": "string"},
+            "estilizado": {"type": "boolean", "description": "True solo si el usuario pide explícitamente una infografía estilizada o artística (generada con IA, más lenta)."}
+        },
+        "required": ["ticket_id"]
+    }
 )
 
 consultar_metricas_declaration = FunctionDeclaration(
@@ -100,7 +107,7 @@ agendar_reunion_declaration = FunctionDeclaration(
     }
 )
 
-all_tools_config = Tool(function_declarations=[
+_declaraciones = [
     crear_tiquete_declaration,
     consultar_estado_declaration,
     cerrar_tiquete_declaration,
@@ -110,4 +117,27 @@ all_tools_config = Tool(function_declarations=[
     consultar_metricas_declaration,
     convertir_a_tarea_declaration,
     agendar_reunion_declaration
-])
\ No newline at end of file
+]
+
+all_tools_config = Tool(function_declarations=_declaraciones)
+
+SENTIMIENTOS_TURNO = ["positivo", "negativo", "neutro"]
+INTENCIONES_TURNO = ["crear_tiquete", "consultar_tiquete", "gestionar_tiquete", "metricas", "reunion", "pregunta_general", "conversacion"]
+
+CAMPOS_CONTEXTO_TURNO = {
+    "sentimiento_usuario": {"type": "string", "enum": SENTIMIENTOS_TURNO, "description": "Sentimiento del último mensaje del usuario."},
+    "intencion_usuario": {"type": "string", "enum": INTENCIONES_TURNO, "description": "Intención principal del último mensaje del usuario."}
+}
+
+def _con_contexto_turno(declaracion: FunctionDeclaration) -> FunctionDeclaration:
+    """Copia una declaración añadiendo los campos de sentimiento e intención del turno."""
+    datos = declaracion.to_dict()
+    parametros = datos["parameters"]
+    parametros.pop("property_ordering", None)
+    parametros["properties"].update(CAMPOS_CONTEXTO_TURNO)
+    parametros["required"] = list(parametros.get("required", [])) + list(CAMPOS_CONTEXTO_TURNO)
+    return FunctionDeclaration(name=datos["name"], description=datos["description"], parameters=parametros)
+
+# Variante para el modo de turno en una sola llamada: cada herramienta reporta también
+# el sentimiento y la intención del usuario como argumentos estructurados.
+structured_turn_tools_config = Tool(function_declarations=[_con_contexto_turno(d) for d in _declaraciones])
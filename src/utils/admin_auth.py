@@ -0,0 +1,48 @@
+import hmac
+import json
+from functools import wraps
+from flask import request, jsonify
+from src.config import ADMIN_API_TOKEN, ADMIN_OIDC_AUDIENCE, ADMIN_OIDC_SERVICE_ACCOUNTS
+from src.utils import metrics
+
+_sesion_certificados = None
+
+
+def _token_compartido_valido() -> bool:
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_API_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_API_TOKEN.encode("utf-8"))
+
+
+def _oidc_valido() -> bool:
+    """Token OIDC de Cloud Scheduler: firma de Google, audiencia ADMIN_OIDC_AUDIENCE y cuenta de servicio permitida."""
+    global _sesion_certificados
+    encabezado = request.headers.get("Authorization", "")
+    if not (ADMIN_OIDC_AUDIENCE and ADMIN_OIDC_SERVICE_ACCOUNTS and encabezado.startswith("Bearer ")):
+        return False
+    from google.oauth2 import id_token
+    from google.auth.transport import requests as google_requests
+    if _sesion_certificados is None:
+        _sesion_certificados = google_requests.Request()
+    try:
+        datos = id_token.verify_oauth2_token(encabezado[len("Bearer "):], _sesion_certificados, audience=ADMIN_OIDC_AUDIENCE)
+    except ValueError as e:
+        print(f"⚠️  Token OIDC rechazado en {request.path}: {e}")
+        return False
+    return bool(datos.get("email_verified")) and datos.get("email") in ADMIN_OIDC_SERVICE_ACCOUNTS
+
+
+def requiere_admin(vista):
+    """
+    Protege un endpoint de operación (tareas de Cloud Scheduler, caché de roles, métricas).
+    Acepta el encabezado `X-Admin-Token` igual a ADMIN_API_TOKEN o un token OIDC de Google
+    (`Authorization: Bearer ...`) emitido para ADMIN_OIDC_AUDIENCE a una cuenta de
+    ADMIN_OIDC_SERVICE_ACCOUNTS. Sin ninguno de los dos configurado, rechaza todas las llamadas.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if _token_compartido_valido() or _oidc_valido():
+            return vista(*args, **kwargs)
+        metrics.incrementar("admin.no_autorizado")
+        print(json.dumps({"log_name": "Admin_NoAutorizado", "ruta": request.path, "remote_addr": request.remote_addr}))
+        return jsonify({"error": "No autorizado."}), 401
+    return envoltura
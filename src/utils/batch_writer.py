@@ -0,0 +1,122 @@
+import json
+import time
+import atexit
+import threading
+from src.utils import metrics
+
+
+class BatchWriter:
+    """
+    Cola en memoria que agrupa filas y las escribe en lotes con `funcion_escritura`.
+    El lote se envía cuando la cola alcanza `tamano_lote`, cuando pasan
+    `intervalo_segundos` desde el último envío, al llamar a `flush()` o al
+    terminar el proceso.
+
+    En Cloud Run el hilo de fondo solo recibe CPU fuera de las peticiones si el
+    servicio tiene la CPU siempre asignada; en cualquier caso las lecturas que
+    necesitan ver sus propias escrituras deben llamar a `flush()`.
+    """
+
+    def __init__(self, nombre: str, funcion_escritura, tamano_lote: int = 500,
+                 intervalo_segundos: float = 2.0, max_reintentos: int = 3):
+        self.nombre = nombre
+        self._funcion_escritura = funcion_escritura
+        self.tamano_lote = tamano_lote
+        self.intervalo_segundos = intervalo_segundos
+        self.max_reintentos = max_reintentos
+        self._cola = []
+        self._condicion = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._hilo = None
+        self._cerrado = False
+        atexit.register(self.cerrar)
+
+    def agregar(self, fila: dict):
+        """Encola una fila; despierta al hilo de fondo si el lote está completo."""
+        with self._condicion:
+            self._cola.append(fila)
+            profundidad = len(self._cola)
+            if profundidad >= self.tamano_lote:
+                self._condicion.notify()
+        metrics.fijar(f"{self.nombre}.profundidad_cola", profundidad)
+        self._asegurar_hilo()
+
+    def pendientes(self, predicado=None) -> int:
+        """Cuenta las filas encoladas (opcionalmente solo las que cumplen `predicado`)."""
+        with self._condicion:
+            if predicado is None:
+                return len(self._cola)
+            return sum(1 for fila in self._cola if predicado(fila))
+
+    def flush(self) -> int:
+        """
+        Escribe de inmediato todas las filas encoladas. Devuelve cuántas se escribieron.
+        Si un lote falla vuelve al frente de la cola y se reintenta tras una espera que se
+        hace fuera de `_flush_lock`, para no bloquear a los demás hilos que hacen flush.
+        """
+        escritas = 0
+        for intento in range(1, self.max_reintentos + 1):
+            with self._flush_lock:
+                escritas_intento, completo = self._vaciar_cola(intento)
+            escritas += escritas_intento
+            if completo:
+                break
+            if intento < self.max_reintentos:
+                time.sleep(min(2 ** intento * 0.1, 2))
+        metrics.fijar(f"{self.nombre}.profundidad_cola", self.pendientes())
+        return escritas
+
+    def _vaciar_cola(self, intento: int) -> (int, bool):
+        escritas = 0
+        while True:
+            with self._condicion:
+                lote = self._cola[:self.tamano_lote]
+                del self._cola[:self.tamano_lote]
+            if not lote:
+                return escritas, True
+            if not self._escribir_lote(lote, intento):
+                with self._condicion:
+                    self._cola[:0] = lote
+                return escritas, False
+            escritas += len(lote)
+
+    def _escribir_lote(self, lote: list, intento: int) -> bool:
+        inicio = time.perf_counter()
+        try:
+            self._funcion_escritura(lote)
+        except Exception as e:
+            metrics.incrementar(f"{self.nombre}.errores_flush")
+            print(f"🔴 Error al escribir un lote de {len(lote)} filas en '{self.nombre}' (intento {intento}/{self.max_reintentos}): {e}")
+            return False
+        metrics.observar(f"{self.nombre}.flush", (time.perf_counter() - inicio) * 1000)
+        metrics.incrementar(f"{self.nombre}.filas_escritas", len(lote))
+        metrics.incrementar(f"{self.nombre}.lotes_escritos")
+        return True
+
+    def _asegurar_hilo(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            with self._condicion:
+                if self._cerrado or (self._hilo is not None and self._hilo.is_alive()):
+                    return
+                self._hilo = threading.Thread(target=self._bucle, name=f"batch-writer-{self.nombre}", daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                if len(self._cola) < self.tamano_lote and not self._cerrado:
+                    self._condicion.wait(timeout=self.intervalo_segundos)
+                if self._cerrado:
+                    return
+            self.flush()
+
+    def cerrar(self):
+        """Detiene el hilo de fondo y escribe lo pendiente. Las filas que no se pudieron escribir se registran en el log."""
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify_all()
+        self.flush()
+        with self._condicion:
+            perdidas, self._cola = self._cola, []
+        for fila in perdidas:
+            print(json.dumps({"log_name": "BatchWriter_FilaNoEscrita", "writer": self.nombre, "fila": fila}, default=str))
@@ -1,38 +1,128 @@
 import os
+import time
 import uuid
 import json
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
 from datetime import datetime
-from google.cloud import bigquery
-from src.config import GCP_PROJECT_ID, BIGQUERY_DATASET_ID, TICKETS_TABLE_NAME, EVENTOS_TABLE_NAME
+from src.config import (
+    GCP_PROJECT_ID, BIGQUERY_DATASET_ID, TICKETS_TABLE_NAME, EVENTOS_TABLE_NAME,
+    EVENT_WRITER_MODE, EVENT_BATCH_SIZE, EVENT_FLUSH_INTERVAL_SECONDS,
+    FEEDBACK_BATCH_SIZE, FEEDBACK_FLUSH_INTERVAL_SECONDS,
+    ROLES_CACHE_TTL_SECONDS, ROLES_NEGATIVE_CACHE_TTL_SECONDS, SLA_REFRESH_INTERVAL_SECONDS
+)
+from src.utils import metrics
+from src.utils.storage_backend import obtener_backend
+from src.utils.batch_writer import BatchWriter
+from src.utils.cache import TTLCache
+from src.utils.ticket_state import proyectar_eventos, proyectar_lote, filas_cubo
 
-client = bigquery.Client(project=GCP_PROJECT_ID)
 ROLES_TABLE_ID = f"{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.roles_usuarios"
 TICKETS_TABLE_ID = f"{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.{TICKETS_TABLE_NAME}"
 EVENTOS_TABLE_ID = f"{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.{EVENTOS_TABLE_NAME}"
 SLA_CONFIG_TABLE_ID = f"{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.sla_configuracion"
 
-def registrar_evento(ticket_id: str, tipo_evento: str, autor: str, detalles: dict):
-    """Función centralizada para insertar un nuevo evento en la tabla de eventos."""
-    evento_id = str(uuid.uuid4())
-    query = f"""
-        INSERT INTO `{EVENTOS_TABLE_ID}` 
-        (EventoID, TicketID, FechaEvento, Autor, TipoEvento, Detalles)
-        VALUES (@evento_id, @ticket_id, @timestamp, @autor, @tipo_evento, @detalles)
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("evento_id", "STRING", evento_id),
-            bigquery.ScalarQueryParameter("ticket_id", "STRING", ticket_id),
-            bigquery.ScalarQueryParameter("timestamp", "TIMESTAMP", datetime.utcnow()),
-            bigquery.ScalarQueryParameter("autor", "STRING", autor),
-            bigquery.ScalarQueryParameter("tipo_evento", "STRING", tipo_evento),
-            bigquery.ScalarQueryParameter("detalles", "STRING", json.dumps(detalles)),
-        ]
-    )
-    client.query(query, job_config=job_config).result()
+def _escribir_eventos(eventos: list):
+    """
+    Escribe un lote de eventos, actualiza la proyección `ticket_state` de sus tiquetes y suma
+    su aporte al cubo `metricas_diarias`.
+    """
+    backend = obtener_backend()
+    backend.insertar_eventos(eventos)
+    _proyectar_lote(backend, eventos)
+
+def _proyectar_lote(backend, eventos: list):
+    """
+    Recalcula desde el log el estado de los tiquetes del lote y lo guarda en `ticket_state`,
+    y suma a `metricas_diarias` lo que aportan los eventos del lote, en una sola transacción.
+    Un fallo aquí no reintenta el lote (los eventos ya están escritos y el cubo sumaría dos
+    veces): se registra y el refresco programado (`POST /refresh-projections`) deja ambas
+    proyecciones al día.
+    """
+    ticket_ids = sorted({evento["TicketID"] for evento in eventos})
+    try:
+        historial = backend.listar_eventos_historicos(ticket_ids)
+        cubo = {}
+        estados = proyectar_lote(historial, eventos, cubo)
+        incrementos = filas_cubo(cubo)
+        backend.aplicar_proyecciones(list(estados.values()), incrementos)
+        metrics.incrementar("ticket_state.actualizaciones", len(estados))
+        metrics.incrementar("metricas_diarias.actualizaciones", len(incrementos))
+    except Exception as e:
+        metrics.incrementar("ticket_state.actualizaciones_fallidas")
+        print(f"🔴 No se pudo actualizar ticket_state para {len(ticket_ids)} tiquetes: {e}")
+
+event_writer = BatchWriter(
+    "eventos",
+    _escribir_eventos,
+    tamano_lote=EVENT_BATCH_SIZE,
+    intervalo_segundos=EVENT_FLUSH_INTERVAL_SECONDS,
+)
+
+_tabla_feedback_verificada = False
+
+def _escribir_feedbacks(feedbacks: list):
+    """Escribe un lote de valoraciones; la primera vez verifica que la tabla tenga `message_id`."""
+    global _tabla_feedback_verificada
+    backend = obtener_backend()
+    if not _tabla_feedback_verificada:
+        backend.asegurar_tabla_feedback()
+        _tabla_feedback_verificada = True
+    backend.insertar_feedbacks(feedbacks)
+
+feedback_writer = BatchWriter(
+    "feedback",
+    _escribir_feedbacks,
+    tamano_lote=FEEDBACK_BATCH_SIZE,
+    intervalo_segundos=FEEDBACK_FLUSH_INTERVAL_SECONDS,
+)
+
+roles_cache = TTLCache("roles_cache", ROLES_CACHE_TTL_SECONDS)
+_roles_precargados_hasta = 0.0
+
+SLA_POR_DEFECTO_HORAS = 24
+_matriz_sla = {}
+_hilo_refresco_sla = None
+
+_snapshots_solicitud = ContextVar("snapshots_tiquetes", default=None)
+
+def registrar_evento(ticket_id: str, tipo_evento: str, autor: str, detalles: dict, sincronico: bool = False):
+    """
+    Función centralizada para registrar un nuevo evento de tiquete.
+    El evento se encola y se escribe en lote; con `sincronico=True` (o EVENT_WRITER_MODE=sync)
+    se escribe antes de retornar.
+    """
+    evento = {
+        "EventoID": str(uuid.uuid4()),
+        "TicketID": ticket_id,
+        "FechaEvento": datetime.utcnow(),
+        "Autor": autor,
+        "TipoEvento": tipo_evento,
+        "Detalles": json.dumps(detalles),
+    }
+    event_writer.agregar(evento)
+    memo = _snapshots_solicitud.get()
+    if memo is not None:
+        memo.pop(ticket_id, None)
+    if sincronico or EVENT_WRITER_MODE == "sync":
+        event_writer.flush()
     print(f"✅ Evento '{tipo_evento}' registrado para el tiquete {ticket_id}.")
 
 
+def flush_eventos(ticket_id: str = None):
+    """
+    Escribe los eventos pendientes antes de una lectura que necesita verlos.
+    Con `ticket_id` solo hace flush si hay eventos encolados de ese tiquete.
+    """
+    if ticket_id is None:
+        pendientes = event_writer.pendientes()
+    else:
+        pendientes = event_writer.pendientes(lambda evento: evento["TicketID"] == ticket_id)
+    if pendientes:
+        event_writer.flush()
+
+
 def validar_tiquete(ticket_id: str) -> (str, bool):
     """
     Normaliza un ID de tiquete a mayúsculas y verifica si existe en la base de datos.
@@ -40,17 +130,8 @@ def validar_tiquete(ticket_id: str) -> (str, bool):
     """
     id_normalizado = ticket_id.upper()
     
-    query = f"SELECT COUNT(TicketID) as count FROM `{TICKETS_TABLE_ID}` WHERE TicketID = @ticket_id"
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("ticket_id", "STRING", id_normalizado)
-        ]
-    )
-    
     try:
-        query_job = client.query(query, job_config=job_config)
-        results = query_job.result()
-        count = next(results).count
+        count = obtener_backend().contar_tiquete(id_normalizado)
         
         existe = count > 0
         return id_normalizado, existe
@@ -59,193 +140,253 @@ def validar_tiquete(ticket_id: str) -> (str, bool):
         print(f"🔴 Error al validar el tiquete {id_normalizado}: {e}")
         return id_normalizado, False
 
+def precargar_roles() -> int:
+    """
+    Carga toda la tabla de roles en la caché. Mientras la precarga esté vigente,
+    un correo que no aparece en ella recibe el rol 'user' sin consultar la base de datos.
+    """
+    global _roles_precargados_hasta
+    try:
+        filas = obtener_backend().listar_roles()
+    except Exception as e:
+        print(f"🔴 Error al precargar la tabla de roles: {e}")
+        return 0
+    for fila in filas:
+        roles_cache.guardar(fila["user_email"], (fila["role"], fila["department"]))
+    _roles_precargados_hasta = time.monotonic() + ROLES_CACHE_TTL_SECONDS
+    print(f"✅ {len(filas)} roles precargados en caché.")
+    return len(filas)
+
+def invalidar_cache_roles(user_email: str = None):
+    """Invalida el rol de un usuario, o toda la caché de roles si no se indica correo."""
+    global _roles_precargados_hasta
+    if user_email is None:
+        _roles_precargados_hasta = 0.0
+    roles_cache.invalidar(user_email)
+    print(f"▶️ Caché de roles invalidada para: {user_email or 'todos los usuarios'}")
+
 def obtener_rol_usuario(user_email: str) -> (str, str):
     """
     Consulta la tabla de roles para obtener el rol y departamento de un usuario.
     Si el usuario no se encuentra, devuelve el rol 'user' por defecto.
+    Los resultados (incluido el rol por defecto) se guardan en caché.
     """
-    query = f"""
-        SELECT role, department
-        FROM `{ROLES_TABLE_ID}`
-        WHERE user_email = @user_email
-        LIMIT 1
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("user_email", "STRING", user_email)
-        ]
-    )
-    
+    en_cache = roles_cache.obtener(user_email)
+    if en_cache:
+        return en_cache
+    if time.monotonic() < _roles_precargados_hasta:
+        roles_cache.guardar(user_email, ("user", None), ROLES_NEGATIVE_CACHE_TTL_SECONDS)
+        return "user", None
+
     try:
-        results = list(client.query(query, job_config=job_config).result())
-        if results:
-            user_data = results[0]
-            print(f"✅ Rol encontrado para {user_email}: {user_data.role}")
-            return user_data.role, user_data.department
+        user_data = obtener_backend().obtener_rol(user_email)
+        if user_data:
+            print(f"✅ Rol encontrado para {user_email}: {user_data['role']}")
+            roles_cache.guardar(user_email, (user_data["role"], user_data["department"]))
+            return user_data["role"], user_data["department"]
         else:
             print(f"✅ Usuario {user_email} no encontrado en tabla de roles. Asignado rol 'user'.")
+            roles_cache.guardar(user_email, ("user", None), ROLES_NEGATIVE_CACHE_TTL_SECONDS)
             return "user", None
             
     except Exception as e:
         print(f"🔴 Error al obtener el rol para {user_email}: {e}")
         return "user", None
 
+def _estado_desde_log(ticket_id: str) -> dict | None:
+    """Deriva el estado de un tiquete que aún no está en `ticket_state` reproduciendo su log."""
+    metrics.incrementar("ticket_state.lecturas_desde_log")
+    eventos = obtener_backend().listar_eventos_historicos([ticket_id])
+    return proyectar_eventos({}, eventos).get(ticket_id)
+
+def obtener_estado_tiquete(ticket_id: str) -> dict | None:
+    """
+    Lee por clave el estado actual del tiquete (estado, departamento, responsable, solicitante,
+    vencimiento y último evento) en `ticket_state`. Si el tiquete no está en la proyección,
+    lo deriva de su log de eventos.
+    """
+    id_normalizado = ticket_id.upper()
+    flush_eventos(id_normalizado)
+    filas = obtener_backend().obtener_estados_tiquetes([id_normalizado])
+    return filas[0] if filas else _estado_desde_log(id_normalizado)
+
+@dataclass(frozen=True)
+class TicketSnapshot:
+    """Foto del tiquete usada por las herramientas que lo modifican."""
+    ticket_id: str
+    existe: bool
+    estado: str = None
+    departamento: str = None
+    responsable: str = None
+    solicitante: str = None
+    fecha_creacion: datetime = None
+    sla_horas: int = None
+    fecha_vencimiento: datetime = None
+    ultimo_evento: str = None
+    detalles_ultimo_evento: dict = None
+
+    def descripcion_estado(self) -> str:
+        """Describe el estado actual en el mismo formato que `consultar_estado_tiquete`."""
+        detalles = self.detalles_ultimo_evento or {}
+        if not self.existe or not self.ultimo_evento:
+            return f"No se encontró ningún tiquete o evento con el ID '{self.ticket_id}'."
+        if self.ultimo_evento == "CREADO":
+            return f"El tiquete {self.ticket_id} está 'Abierto' y asignado a {detalles.get('responsable_inicial')}."
+        elif self.ultimo_evento == "CERRADO":
+            return f"El tiquete {self.ticket_id} está 'Cerrado'. Resolución: {detalles.get('resolucion')}."
+        elif self.ultimo_evento == "REASIGNADO":
+            return f"El tiquete {self.ticket_id} está 'Abierto' y ha sido reasignado a {detalles.get('nuevo_responsable')}."
+        return f"El último evento para el tiquete {self.ticket_id} fue '{self.ultimo_evento}'."
+
+def iniciar_memo_snapshots():
+    """Abre una memoización de snapshots para la solicitud en curso (llamar al inicio de cada turno)."""
+    _snapshots_solicitud.set({})
+
+def cargar_snapshot_tiquete(ticket_id: str) -> TicketSnapshot:
+    """
+    Obtiene existencia, departamento, estado, responsable, solicitante y fecha de creación
+    de un tiquete en una sola consulta por clave (la fila de `tickets` y la de `ticket_state`).
+    Dentro de una solicitud el resultado se memoiza hasta que se registra un nuevo evento
+    del tiquete. Si la consulta falla, el tiquete se reporta como no encontrado.
+    """
+    id_normalizado = ticket_id.upper()
+    memo = _snapshots_solicitud.get()
+    if memo is not None and id_normalizado in memo:
+        return memo[id_normalizado]
+
+    try:
+        flush_eventos(id_normalizado)
+        fila = obtener_backend().obtener_snapshot_tiquete(id_normalizado)
+        estado = fila if not fila or fila["Proyectado"] else _estado_desde_log(id_normalizado) or {}
+    except Exception as e:
+        print(f"🔴 Error al cargar el tiquete {id_normalizado}: {e}")
+        return TicketSnapshot(ticket_id=id_normalizado, existe=False)
+
+    if not fila:
+        snapshot = TicketSnapshot(ticket_id=id_normalizado, existe=False)
+    else:
+        snapshot = TicketSnapshot(
+            ticket_id=id_normalizado,
+            existe=True,
+            estado=estado.get("Estado"),
+            departamento=estado.get("Departamento"),
+            responsable=estado.get("Responsable"),
+            solicitante=fila["Solicitante"],
+            fecha_creacion=fila["FechaCreacion"],
+            sla_horas=fila["SLA_Horas"],
+            fecha_vencimiento=fila["FechaVencimiento"],
+            ultimo_evento=estado.get("UltimoEvento"),
+            detalles_ultimo_evento=json.loads(estado["DetallesUltimoEvento"]) if estado.get("DetallesUltimoEvento") else None,
+        )
+    if memo is not None:
+        memo[id_normalizado] = snapshot
+    return snapshot
+
 def obtener_departamento_tiquete(ticket_id: str) -> str:
     """
-    Consulta el evento de creación de un tiquete para obtener su departamento asignado.
+    Obtiene el departamento asignado al tiquete desde la proyección de estado.
     """
     id_normalizado = ticket_id.upper()
-    query = f"""
-        SELECT JSON_EXTRACT_SCALAR(Detalles, '$.equipo_asignado') as departamento
-        FROM `{EVENTOS_TABLE_ID}`
-        WHERE TicketID = @ticket_id AND TipoEvento = 'CREADO'
-        LIMIT 1
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("ticket_id", "STRING", id_normalizado)
-        ]
-    )
     try:
-        results = list(client.query(query, job_config=job_config).result())
-        if results and results[0].departamento:
-            return results[0].departamento
+        estado = obtener_estado_tiquete(id_normalizado)
+        if estado and estado["Departamento"]:
+            return estado["Departamento"]
         return None
     except Exception as e:
         print(f"🔴 Error al obtener el departamento del tiquete {id_normalizado}: {e}")
         return None
 
+def cargar_matriz_sla() -> int:
+    """
+    Carga la tabla de configuración de SLA completa (departamento × prioridad) en memoria.
+    Si la carga falla se conserva la matriz anterior.
+    """
+    global _matriz_sla
+    try:
+        filas = obtener_backend().listar_sla_configuracion()
+    except Exception as e:
+        print(f"🔴 Error al cargar la matriz de SLA: {e}. Se conserva la versión anterior.")
+        return len(_matriz_sla)
+    _matriz_sla = {(fila["department"], fila["priority"]): fila["sla_hours"] for fila in filas}
+    metrics.fijar("sla_matriz.entradas", len(_matriz_sla))
+    return len(_matriz_sla)
+
+def iniciar_refresco_sla():
+    """Carga la matriz de SLA y la refresca en segundo plano cada SLA_REFRESH_INTERVAL_SECONDS."""
+    global _hilo_refresco_sla
+    if _hilo_refresco_sla is not None:
+        return
+    cargar_matriz_sla()
+    print(f"✅ Matriz de SLA cargada con {len(_matriz_sla)} entradas.")
+
+    def refrescar():
+        while True:
+            time.sleep(SLA_REFRESH_INTERVAL_SECONDS)
+            cargar_matriz_sla()
+
+    _hilo_refresco_sla = threading.Thread(target=refrescar, name="sla-refresh", daemon=True)
+    _hilo_refresco_sla.start()
+
+def listar_departamentos() -> list:
+    """Departamentos con SLA configurado, según la matriz en memoria."""
+    return sorted({departamento for departamento, _ in _matriz_sla})
+
 def obtener_sla_por_configuracion(departamento: str, prioridad: str) -> int:
     """
-    Consulta la tabla de configuración para obtener las horas de SLA.
+    Obtiene las horas de SLA desde la matriz de configuración en memoria.
+    Nunca consulta la base de datos: si no hay configuración usa 24h por defecto.
     """
     prioridad_limpia = prioridad.lower()
     if "alta" in prioridad_limpia: prioridad_final = "alta"
     elif "baja" in prioridad_limpia: prioridad_final = "baja"
     else: prioridad_final = "media"
     
-    query = f"""
-        SELECT sla_hours
-        FROM `{SLA_CONFIG_TABLE_ID}`
-        WHERE department = @department AND priority = @priority
-        LIMIT 1
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("department", "STRING", departamento),
-            bigquery.ScalarQueryParameter("priority", "STRING", prioridad_final),
-        ]
-    )
-    
-    try:
-        results = list(client.query(query, job_config=job_config).result())
-        if results:
-            return results[0].sla_hours
-        else:
-            print(f"⚠️ Advertencia: No se encontró configuración de SLA para {departamento}/{prioridad_final}. Usando 24h por defecto.")
-            return 24
-            
-    except Exception as e:
-        print(f"🔴 Error al obtener configuración de SLA: {e}. Usando 24h por defecto.")
-        return 24
+    sla_hours = _matriz_sla.get((departamento, prioridad_final))
+    if sla_hours is not None:
+        return sla_hours
+    print(f"⚠️ Advertencia: No se encontró configuración de SLA para {departamento}/{prioridad_final}. Usando {SLA_POR_DEFECTO_HORAS}h por defecto.")
+    return SLA_POR_DEFECTO_HORAS
 
 def obtener_participantes_tiquete(ticket_id: str) -> dict:
     """
-    Obtiene el correo del solicitante y del responsable actual de un tiquete.
-    Esta versión es más robusta y busca el último responsable válido.
+    Obtiene el correo del solicitante y del responsable actual de un tiquete
+    desde la proyección de estado.
     """
     id_normalizado = ticket_id.upper()
-    query = f"""
-    WITH EventosConResponsable AS (
-        -- Seleccionamos todos los eventos que definen un responsable
-        SELECT
-            TicketID,
-            FechaEvento,
-            COALESCE(
-                JSON_EXTRACT_SCALAR(Detalles, '$.nuevo_responsable'),
-                JSON_EXTRACT_SCALAR(Detalles, '$.responsable_inicial')
-            ) as Responsable
-        FROM `{EVENTOS_TABLE_ID}`
-        WHERE 
-            TicketID = @ticket_id 
-            AND (
-                JSON_EXTRACT_SCALAR(Detalles, '$.nuevo_responsable') IS NOT NULL 
-                OR JSON_EXTRACT_SCALAR(Detalles, '$.responsable_inicial') IS NOT NULL
-            )
-    ),
-    UltimoResponsable AS (
-        -- De esos eventos, nos quedamos solo con el más reciente
-        SELECT Responsable
-        FROM EventosConResponsable
-        ORDER BY FechaEvento DESC
-        LIMIT 1
-    )
-    SELECT
-        t.Solicitante,
-        (SELECT Responsable FROM UltimoResponsable) AS Responsable
-    FROM `{TICKETS_TABLE_ID}` t
-    WHERE t.TicketID = @ticket_id
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[bigquery.ScalarQueryParameter("ticket_id", "STRING", id_normalizado)]
-    )
     try:
-        results = list(client.query(query, job_config=job_config).result())
-        if not results:
+        estado = obtener_estado_tiquete(id_normalizado)
+        if not estado:
             return {"error": "No se encontraron participantes para el tiquete."}
         
-        participantes = results[0]
         return {
-            "solicitante": participantes.Solicitante,
-            "responsable": participantes.Responsable
+            "solicitante": estado["Solicitante"],
+            "responsable": estado["Responsable"]
         }
     except Exception as e:
         print(f"🔴 Error al obtener participantes del tiquete {id_normalizado}: {e}")
         return {"error": str(e)}
 
-def registrar_feedback(session_id: str, user_email: str, rating: int):
-    """Inserta una nueva valoración de NPS en la tabla de feedback."""
-    feedback_id = str(uuid.uuid4())
-    NPS_TABLE_ID = f"{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.nps_feedback"
-    
-    query = f"""
-        INSERT INTO `{NPS_TABLE_ID}` 
-        (feedback_id, session_id, user_email, rating, timestamp)
-        VALUES (@feedback_id, @session_id, @user_email, @rating, @timestamp)
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("feedback_id", "STRING", feedback_id),
-            bigquery.ScalarQueryParameter("session_id", "STRING", session_id),
-            bigquery.ScalarQueryParameter("user_email", "STRING", user_email),
-            bigquery.ScalarQueryParameter("rating", "INTEGER", rating),
-            bigquery.ScalarQueryParameter("timestamp", "TIMESTAMP", datetime.utcnow()),
-        ]
-    )
-    client.query(query, job_config=job_config).result()
+def registrar_feedback(session_id: str, user_email: str, rating: int, message_id: str = None):
+    """
+    Encola una nueva valoración de NPS para la tabla de feedback. Se escribe en lote junto
+    con las de otros usuarios (ver `feedback_writer`).
+    """
+    feedback = {
+        "feedback_id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "message_id": message_id,
+        "user_email": user_email,
+        "rating": rating,
+        "timestamp": datetime.utcnow(),
+    }
+    feedback_writer.agregar(feedback)
     print(f"✅ Feedback registrado para la sesión {session_id}.")
 
 def actualizar_feedback_comentario(session_id: str, comment: str):
     """
     Busca el último feedback negativo de una sesión y le añade el comentario del usuario.
     """
-    NPS_TABLE_ID = f"{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.nps_feedback"
-    query = f"""
-        UPDATE `{NPS_TABLE_ID}`
-        SET comment = @comment
-        WHERE feedback_id = (
-            SELECT feedback_id
-            FROM `{NPS_TABLE_ID}`
-            WHERE session_id = @session_id AND rating = 0
-            ORDER BY timestamp DESC
-            LIMIT 1
-        )
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("comment", "STRING", comment),
-            bigquery.ScalarQueryParameter("session_id", "STRING", session_id),
-        ]
-    )
-    client.query(query, job_config=job_config).result()
+    if feedback_writer.pendientes(lambda feedback: feedback["session_id"] == session_id):
+        feedback_writer.flush()
+    obtener_backend().actualizar_comentario_feedback(session_id, comment)
     print(f"✅ Comentario de feedback actualizado para la sesión {session_id}.")
\ No newline at end of file
@@ -0,0 +1,55 @@
+import time
+import threading
+from collections import OrderedDict
+from src.utils import metrics
+
+_SIN_VALOR = object()
+
+
+class TTLCache:
+    """
+    Caché en memoria con expiración por entrada y tamaño máximo (LRU).
+    Los aciertos y fallos se registran en `metrics` como '<nombre>.hit' y '<nombre>.miss'.
+    """
+
+    def __init__(self, nombre: str, ttl_segundos: float, max_entradas: int = 10000):
+        self.nombre = nombre
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, defecto=None):
+        """Devuelve el valor vigente para `clave` o `defecto` si no existe o expiró."""
+        with self._lock:
+            entrada = self._datos.get(clave, _SIN_VALOR)
+            if entrada is not _SIN_VALOR:
+                valor, expira = entrada
+                if expira > time.monotonic():
+                    self._datos.move_to_end(clave)
+                    metrics.incrementar(f"{self.nombre}.hit")
+                    return valor
+                del self._datos[clave]
+        metrics.incrementar(f"{self.nombre}.miss")
+        return defecto
+
+    def guardar(self, clave, valor, ttl_segundos: float = None):
+        """Guarda un valor; `ttl_segundos` permite un TTL distinto al por defecto."""
+        expira = time.monotonic() + (self.ttl_segundos if ttl_segundos is None else ttl_segundos)
+        with self._lock:
+            self._datos[clave] = (valor, expira)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave=None):
+        """Elimina una entrada, o todas si no se indica `clave`."""
+        with self._lock:
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._datos)
@@ -0,0 +1,97 @@
+import time
+import threading
+from collections import OrderedDict
+from src.utils import metrics
+
+
+class DocumentCache:
+    """
+    Caché LRU en memoria de objetos de texto de un bucket de GCS, acotada por bytes.
+    Cada entrada guarda la generación del objeto; pasado `revalidar_segundos` se hace una
+    descarga condicional (`if_generation_not_match`) que solo transfiere el contenido si
+    el objeto cambió. Los objetos inexistentes también se recuerdan hasta la revalidación.
+    """
+
+    def __init__(self, nombre: str, obtener_bucket, max_bytes: int, revalidar_segundos: float):
+        self.nombre = nombre
+        self._obtener_bucket = obtener_bucket
+        self.max_bytes = max_bytes
+        self.revalidar_segundos = revalidar_segundos
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def obtener(self, nombre_objeto: str) -> str | None:
+        """Devuelve el texto del objeto o None si no existe."""
+        from google.api_core.exceptions import NotFound, NotModified
+
+        with self._lock:
+            entrada = self._entradas.get(nombre_objeto)
+            if entrada:
+                self._entradas.move_to_end(nombre_objeto)
+        if entrada and time.monotonic() - entrada["verificado"] < self.revalidar_segundos:
+            metrics.incrementar(f"{self.nombre}.hit")
+            return entrada["texto"]
+
+        blob = self._obtener_bucket().blob(nombre_objeto)
+        try:
+            if entrada and entrada["generacion"] is not None:
+                contenido = blob.download_as_bytes(if_generation_not_match=entrada["generacion"])
+            else:
+                contenido = blob.download_as_bytes()
+        except NotModified:
+            metrics.incrementar(f"{self.nombre}.revalidado_sin_cambios")
+            with self._lock:
+                entrada["verificado"] = time.monotonic()
+            return entrada["texto"]
+        except NotFound:
+            metrics.incrementar(f"{self.nombre}.no_encontrado")
+            self._guardar(nombre_objeto, None, None)
+            return None
+
+        metrics.incrementar(f"{self.nombre}.descargado")
+        texto = contenido.decode("utf-8")
+        self._guardar(nombre_objeto, texto, blob.generation)
+        return texto
+
+    def precargar(self, prefijo: str) -> int:
+        """Descarga todos los objetos bajo `prefijo` (hasta llenar `max_bytes`). Devuelve cuántos cargó."""
+        cargados, omitidos = 0, 0
+        for blob in self._obtener_bucket().list_blobs(prefix=prefijo):
+            if blob.name.endswith("/"):
+                continue
+            if self._bytes + (blob.size or 0) > self.max_bytes:
+                omitidos += 1
+                continue
+            texto = blob.download_as_bytes(if_generation_match=blob.generation).decode("utf-8")
+            self._guardar(blob.name, texto, blob.generation)
+            cargados += 1
+        if omitidos:
+            print(f"⚠️  '{self.nombre}': {omitidos} objetos no se precargaron por el límite de {self.max_bytes} bytes.")
+        return cargados
+
+    def _guardar(self, nombre_objeto: str, texto: str | None, generacion):
+        tamano = len(texto.encode("utf-8")) if texto else 0
+        with self._lock:
+            anterior = self._entradas.pop(nombre_objeto, None)
+            if anterior:
+                self._bytes -= anterior["bytes"]
+            if tamano > self.max_bytes:
+                return
+            self._entradas[nombre_objeto] = {"texto": texto, "generacion": generacion, "bytes": tamano, "verificado": time.monotonic()}
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                _, desalojada = self._entradas.popitem(last=False)
+                self._bytes -= desalojada["bytes"]
+                metrics.incrementar(f"{self.nombre}.desalojado")
+            metrics.fijar(f"{self.nombre}.bytes", self._bytes)
+
+    def invalidar(self, nombre_objeto: str = None):
+        with self._lock:
+            if nombre_objeto is None:
+                self._entradas.clear()
+                self._bytes = 0
+            else:
+                entrada = self._entradas.pop(nombre_objeto, None)
+                if entrada:
+                    self._bytes -= entrada["bytes"]
@@ -0,0 +1,98 @@
+import os
+import re
+import hashlib
+import unicodedata
+from datetime import datetime, timezone
+import numpy as np
+from src.config import (
+    EMBEDDING_CACHE_BACKEND, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_COLLECTION
+)
+from src.utils import metrics
+from src.utils.cache import TTLCache
+
+# Los embeddings de un texto no cambian mientras no cambie el modelo (que forma parte de la clave).
+_memoria = TTLCache("embedding_cache", ttl_segundos=float("inf"), max_entradas=EMBEDDING_CACHE_MAX_ENTRIES)
+_firestore_db = None
+
+
+def normalizar_consulta(texto: str) -> str:
+    """Normaliza una consulta para que variantes triviales (mayúsculas, espacios, puntuación final) compartan clave."""
+    texto = unicodedata.normalize("NFKC", texto).casefold()
+    texto = " ".join(texto.split())
+    return re.sub(r"^[\W_]+|[\W_]+$", "", texto)
+
+
+def clave_embedding(texto: str, modelo: str) -> str:
+    return hashlib.sha256(f"{modelo}\x00{normalizar_consulta(texto)}".encode("utf-8")).hexdigest()
+
+
+def _db():
+    global _firestore_db
+    if _firestore_db is None:
+        from google.cloud import firestore
+        _firestore_db = firestore.Client()
+    return _firestore_db
+
+
+def _leer_persistente(clave: str, modelo: str):
+    if EMBEDDING_CACHE_BACKEND == "firestore":
+        doc = _db().collection(EMBEDDING_CACHE_COLLECTION).document(clave).get()
+        if doc.exists:
+            datos = doc.to_dict()
+            if datos.get("modelo") == modelo:
+                return np.frombuffer(datos["vector"], dtype=np.float32)
+    elif EMBEDDING_CACHE_BACKEND == "disk":
+        ruta = os.path.join(EMBEDDING_CACHE_DIR, modelo.replace("/", "_"), f"{clave}.f32")
+        if os.path.exists(ruta):
+            return np.fromfile(ruta, dtype=np.float32)
+    return None
+
+
+def _escribir_persistente(clave: str, modelo: str, vector: np.ndarray, texto_normalizado: str):
+    if EMBEDDING_CACHE_BACKEND == "firestore":
+        _db().collection(EMBEDDING_CACHE_COLLECTION).document(clave).set({
+            "modelo": modelo,
+            "texto": texto_normalizado[:1500],
+            "dimension": int(vector.shape[0]),
+            "vector": vector.tobytes(),
+            "creado": datetime.now(timezone.utc)
+        })
+    elif EMBEDDING_CACHE_BACKEND == "disk":
+        directorio = os.path.join(EMBEDDING_CACHE_DIR, modelo.replace("/", "_"))
+        os.makedirs(directorio, exist_ok=True)
+        temporal = os.path.join(directorio, f"{clave}.{os.getpid()}.tmp")
+        vector.tofile(temporal)
+        os.replace(temporal, os.path.join(directorio, f"{clave}.f32"))
+
+
+def obtener_embedding(texto: str, modelo: str, funcion_embedding) -> np.ndarray:
+    """
+    Devuelve el embedding (float32) de `texto` para `modelo`. Busca primero en memoria (LRU),
+    luego en el nivel persistente (EMBEDDING_CACHE_BACKEND: 'firestore', 'disk' o 'none'),
+    y solo si no existe llama a `funcion_embedding(texto)` y guarda el resultado en ambos niveles.
+    """
+    clave = clave_embedding(texto, modelo)
+    vector = _memoria.obtener(clave)
+    if vector is not None:
+        return vector
+
+    try:
+        vector = _leer_persistente(clave, modelo)
+    except Exception as e:
+        print(f"⚠️  No se pudo leer la caché persistente de embeddings: {e}")
+        vector = None
+    if vector is not None:
+        metrics.incrementar("embedding_cache.persistente.hit")
+        _memoria.guardar(clave, vector)
+        return vector
+    metrics.incrementar("embedding_cache.persistente.miss")
+
+    with metrics.cronometrar("embedding_cache.api"):
+        vector = np.asarray(funcion_embedding(texto), dtype=np.float32)
+    vector.setflags(write=False)
+    _memoria.guardar(clave, vector)
+    try:
+        _escribir_persistente(clave, modelo, vector, normalizar_consulta(texto))
+    except Exception as e:
+        print(f"⚠️  No se pudo guardar el embedding en la caché persistente: {e}")
+    return vector
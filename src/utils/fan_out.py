@@ -0,0 +1,55 @@
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from src.config import FANOUT_MAX_WORKERS
+from src.utils import metrics
+
+# Pool compartido por todas las solicitudes para las consultas independientes previas al LLM.
+_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fan-out")
+
+
+def lanzar(nombre: str, funcion, *args, **kwargs):
+    """
+    Inicia `funcion` en el pool compartido y devuelve su Future. Se copia el contexto
+    de la solicitud (ContextVars) para que la tarea vea el mismo estado que el llamador.
+    """
+    contexto = contextvars.copy_context()
+    inicio = time.perf_counter()
+
+    def tarea():
+        try:
+            return contexto.run(funcion, *args, **kwargs)
+        finally:
+            metrics.observar(f"fan_out.{nombre}", (time.perf_counter() - inicio) * 1000)
+
+    future = _executor.submit(tarea)
+    future.inicio_fan_out = inicio
+    return future
+
+
+def esperar_resultado(nombre: str, future, timeout_segundos: float, defecto=None):
+    """
+    Espera el resultado de `future` hasta `timeout_segundos` contados desde que se lanzó.
+    Si vence el plazo o la tarea falla, devuelve `defecto` y la solicitud continúa sin ese dato.
+    """
+    restante = timeout_segundos - (time.perf_counter() - getattr(future, "inicio_fan_out", time.perf_counter()))
+    try:
+        return future.result(timeout=max(restante, 0))
+    except FuturesTimeoutError:
+        future.cancel()
+        metrics.incrementar(f"fan_out.{nombre}.timeout")
+        print(f"⚠️  '{nombre}' superó su plazo de {timeout_segundos}s; se continúa con el valor por defecto.")
+    except Exception as e:
+        metrics.incrementar(f"fan_out.{nombre}.error")
+        print(f"⚠️  Error en '{nombre}': {e}; se continúa con el valor por defecto.")
+    return defecto
+
+
+def cancelar(*futures):
+    """
+    Descarta resultados que ya no se usarán. Las tareas que aún no empezaron se cancelan;
+    las que ya están en curso terminan en segundo plano y su resultado se ignora.
+    """
+    for future in futures:
+        if future is not None and future.cancel():
+            metrics.incrementar("fan_out.canceladas")
@@ -0,0 +1,76 @@
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_contadores = defaultdict(int)
+_tiempos = defaultdict(lambda: {"llamadas": 0, "total_ms": 0.0, "max_ms": 0.0})
+_indicadores = {}
+
+
+def incrementar(nombre: str, valor: int = 1):
+    """Incrementa un contador en memoria del proceso."""
+    with _lock:
+        _contadores[nombre] += valor
+
+
+def fijar(nombre: str, valor: float):
+    """Fija el valor actual de un indicador (p. ej. profundidad de una cola)."""
+    with _lock:
+        _indicadores[nombre] = valor
+
+
+def observar(nombre: str, duracion_ms: float):
+    """Registra la duración de una operación en milisegundos."""
+    with _lock:
+        tiempo = _tiempos[nombre]
+        tiempo["llamadas"] += 1
+        tiempo["total_ms"] += duracion_ms
+        tiempo["max_ms"] = max(tiempo["max_ms"], duracion_ms)
+
+
+@contextmanager
+def cronometrar(nombre: str):
+    """Mide el tiempo de un bloque de código y lo registra con `observar`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nombre, (time.perf_counter() - inicio) * 1000)
+
+
+def registrar_uso_vertex(response, etapa: str):
+    """Cuenta una llamada a Vertex AI y sus tokens de entrada/salida (si la respuesta los incluye)."""
+    uso = getattr(response, "usage_metadata", None)
+    entrada = getattr(uso, "prompt_token_count", 0) or 0
+    salida = getattr(uso, "candidates_token_count", 0) or 0
+    with _lock:
+        for prefijo in ("vertex", f"vertex.{etapa}"):
+            _contadores[f"{prefijo}.llamadas"] += 1
+            _contadores[f"{prefijo}.tokens_entrada"] += entrada
+            _contadores[f"{prefijo}.tokens_salida"] += salida
+
+
+def obtener_contador(nombre: str) -> int:
+    """Devuelve el valor actual de un contador."""
+    with _lock:
+        return _contadores.get(nombre, 0)
+
+
+def snapshot() -> dict:
+    """Devuelve una copia de todos los contadores y tiempos registrados."""
+    with _lock:
+        tiempos = {
+            nombre: {**datos, "promedio_ms": datos["total_ms"] / datos["llamadas"] if datos["llamadas"] else 0.0}
+            for nombre, datos in _tiempos.items()
+        }
+        return {"contadores": dict(_contadores), "indicadores": dict(_indicadores), "tiempos": tiempos}
+
+
+def reiniciar():
+    """Borra todos los contadores y tiempos (útil en benchmarks)."""
+    with _lock:
+        _contadores.clear()
+        _indicadores.clear()
+        _tiempos.clear()
@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import threading
+from datetime import datetime, timezone
+from src.utils import metrics
+
+
+class ErrorReintentable(Exception):
+    """Fallo transitorio (429, 5xx, red): el mensaje se reintenta con backoff exponencial."""
+
+    def __init__(self, mensaje: str, reintentar_en: float = None):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class _SpillArchivo:
+    """Spill en un archivo JSONL local. Solo sirve donde el disco sobrevive al proceso (desarrollo)."""
+
+    def __init__(self, ruta: str):
+        self.descripcion = ruta
+        self._ruta = ruta
+
+    def guardar(self, mensajes: list):
+        with open(self._ruta, "a", encoding="utf-8") as archivo:
+            for mensaje in mensajes:
+                archivo.write(json.dumps(mensaje, default=str) + "\n")
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+    def recuperar(self) -> list:
+        if not os.path.exists(self._ruta):
+            return []
+        with open(self._ruta, encoding="utf-8") as archivo:
+            mensajes = [json.loads(linea) for linea in archivo if linea.strip()]
+        os.remove(self._ruta)
+        return mensajes
+
+
+class _SpillGCS:
+    """
+    Spill en GCS (`gs://bucket/prefijo`): cada derrame es un objeto JSONL nuevo. Al arrancar,
+    una instancia reclama cada objeto borrándolo con su generación; si otra lo borró antes,
+    lo omite, así que cada mensaje se reencola en una sola instancia.
+    """
+
+    def __init__(self, uri: str, nombre: str):
+        self.descripcion = uri
+        self._nombre_bucket, _, prefijo = uri[len("gs://"):].partition("/")
+        self._prefijo = f"{prefijo.strip('/')}/{nombre}/".lstrip("/")
+        self._bucket = None
+
+    def _obtener_bucket(self):
+        # El cliente se crea al primer uso para no exigir credenciales al importar el módulo.
+        if self._bucket is None:
+            from google.cloud import storage
+            self._bucket = storage.Client().bucket(self._nombre_bucket)
+        return self._bucket
+
+    def guardar(self, mensajes: list):
+        marca = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        blob = self._obtener_bucket().blob(f"{self._prefijo}{marca}-{os.getpid()}-{random.getrandbits(32):08x}.jsonl")
+        contenido = "".join(json.dumps(mensaje, default=str) + "\n" for mensaje in mensajes)
+        blob.upload_from_string(contenido, content_type="application/jsonl", if_generation_match=0)
+
+    def recuperar(self) -> list:
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        mensajes = []
+        for blob in self._obtener_bucket().list_blobs(prefix=self._prefijo):
+            try:
+                contenido = blob.download_as_text(if_generation_match=blob.generation)
+                blob.delete(if_generation_match=blob.generation)
+            except (NotFound, PreconditionFailed):
+                continue
+            mensajes.extend(json.loads(linea) for linea in contenido.splitlines() if linea.strip())
+        return mensajes
+
+
+class Outbox:
+    """
+    Cola acotada de mensajes salientes atendida por un pool de hilos con `funcion_envio`.
+    `funcion_envio(mensaje)` lanza `ErrorReintentable` ante fallos transitorios; cualquier
+    otro error descarta el mensaje. Lo que no se pueda entregar (cola llena, reintentos
+    agotados o cierre del proceso) se guarda en `ruta_spill` como JSONL y se vuelve a
+    encolar con `iniciar()` al arrancar el siguiente proceso. En Cloud Run el disco no sobrevive a la
+    instancia: ahí `ruta_spill` debe ser un prefijo `gs://bucket/ruta`.
+    """
+
+    def __init__(self, nombre: str, funcion_envio, workers: int = 4, tamano_maximo: int = 1000,
+                 max_reintentos: int = 5, backoff_base_segundos: float = 0.5,
+                 backoff_max_segundos: float = 30.0, ruta_spill: str = None):
+        self.nombre = nombre
+        self._funcion_envio = funcion_envio
+        self.workers = workers
+        self.max_reintentos = max_reintentos
+        self.backoff_base_segundos = backoff_base_segundos
+        self.backoff_max_segundos = backoff_max_segundos
+        self.ruta_spill = ruta_spill
+        if not ruta_spill:
+            self._spill = None
+        elif ruta_spill.startswith("gs://"):
+            self._spill = _SpillGCS(ruta_spill, nombre)
+        else:
+            self._spill = _SpillArchivo(ruta_spill)
+        self._cola = queue.Queue(maxsize=tamano_maximo)
+        self._hilos = []
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._cerrado = threading.Event()
+        self._spill_recuperado = False
+        atexit.register(self.cerrar)
+
+    def iniciar(self):
+        """Reencola lo pendiente en el spill y arranca los workers. Se llama al arrancar la instancia."""
+        with self._lock:
+            if self._spill_recuperado:
+                return
+            self._spill_recuperado = True
+        self._reanudar_spill()
+        self._asegurar_workers()
+
+    def encolar(self, mensaje: dict) -> bool:
+        """Encola un mensaje sin bloquear. Si la cola está llena, el mensaje se guarda en el spill."""
+        self._asegurar_workers()
+        if self._cerrado.is_set():
+            self._derramar([mensaje], "cerrado")
+            return True
+        try:
+            self._cola.put_nowait({"mensaje": mensaje, "intentos": 0})
+        except queue.Full:
+            self._derramar([mensaje], "cola_llena")
+            return True
+        metrics.incrementar(f"{self.nombre}.encolados")
+        metrics.fijar(f"{self.nombre}.profundidad_cola", self._cola.qsize())
+        return True
+
+    def enviar_ahora(self, mensaje: dict) -> bool:
+        """Envía un mensaje en el hilo actual, con los mismos reintentos que los workers."""
+        return self._entregar({"mensaje": mensaje, "intentos": 0})
+
+    def pendientes(self) -> int:
+        return self._cola.unfinished_tasks
+
+    def esperar(self, timeout_segundos: float = 30.0) -> bool:
+        """Espera a que la cola se vacíe. Devuelve False si se agota el tiempo."""
+        limite = time.monotonic() + timeout_segundos
+        while self._cola.unfinished_tasks:
+            if time.monotonic() >= limite:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _asegurar_workers(self):
+        with self._lock:
+            self._hilos = [hilo for hilo in self._hilos if hilo.is_alive()]
+            if self._cerrado.is_set() or len(self._hilos) >= self.workers:
+                return
+            for i in range(len(self._hilos), self.workers):
+                hilo = threading.Thread(target=self._bucle, name=f"outbox-{self.nombre}-{i}", daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def _bucle(self):
+        while not self._cerrado.is_set():
+            try:
+                item = self._cola.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._entregar(item)
+            finally:
+                self._cola.task_done()
+                metrics.fijar(f"{self.nombre}.profundidad_cola", self._cola.qsize())
+
+    def _entregar(self, item: dict) -> bool:
+        mensaje = item["mensaje"]
+        while True:
+            item["intentos"] += 1
+            inicio = time.perf_counter()
+            try:
+                resultado = self._funcion_envio(mensaje)
+                metrics.observar(f"{self.nombre}.envio", (time.perf_counter() - inicio) * 1000)
+                metrics.incrementar(f"{self.nombre}.enviados" if resultado is not False else f"{self.nombre}.descartados")
+                return resultado is not False
+            except ErrorReintentable as e:
+                if item["intentos"] > self.max_reintentos or self._cerrado.is_set():
+                    metrics.incrementar(f"{self.nombre}.reintentos_agotados")
+                    print(f"🔴 '{self.nombre}': no se pudo entregar el mensaje tras {item['intentos']} intentos: {e}")
+                    self._derramar([mensaje], "reintentos_agotados")
+                    return False
+                espera = e.reintentar_en
+                if espera is None:
+                    espera = min(self.backoff_base_segundos * 2 ** (item["intentos"] - 1), self.backoff_max_segundos)
+                    espera *= random.uniform(0.5, 1.0)
+                metrics.incrementar(f"{self.nombre}.reintentos")
+                print(f"⚠️  '{self.nombre}': error transitorio ({e}); reintento {item['intentos']}/{self.max_reintentos} en {espera:.1f}s.")
+                if self._cerrado.wait(min(espera, self.backoff_max_segundos)):
+                    self._derramar([mensaje], "cerrado")
+                    return False
+            except Exception as e:
+                metrics.incrementar(f"{self.nombre}.descartados")
+                print(f"🔴 '{self.nombre}': error no recuperable al enviar el mensaje, se descarta: {e}")
+                return False
+
+    def _derramar(self, mensajes: list, motivo: str):
+        if not mensajes:
+            return
+        metrics.incrementar(f"{self.nombre}.derramados", len(mensajes))
+        if self._spill is not None:
+            try:
+                with self._spill_lock:
+                    self._spill.guardar(mensajes)
+                print(f"💾 '{self.nombre}': {len(mensajes)} mensaje(s) guardados en {self._spill.descripcion} ({motivo}).")
+                return
+            except Exception as e:
+                metrics.incrementar(f"{self.nombre}.errores_spill")
+                print(f"🔴 '{self.nombre}': no se pudo guardar el spill en {self._spill.descripcion}: {e}")
+        for mensaje in mensajes:
+            print(json.dumps({"log_name": "Outbox_MensajeNoEnviado", "outbox": self.nombre, "motivo": motivo, "mensaje": mensaje}, default=str))
+
+    def _reanudar_spill(self):
+        if self._spill is None:
+            return
+        try:
+            with self._spill_lock:
+                mensajes = self._spill.recuperar()
+        except Exception as e:
+            metrics.incrementar(f"{self.nombre}.errores_spill")
+            print(f"🔴 '{self.nombre}': no se pudo leer el spill de {self._spill.descripcion}: {e}")
+            return
+        if not mensajes:
+            return
+        restantes = []
+        for mensaje in mensajes:
+            try:
+                self._cola.put_nowait({"mensaje": mensaje, "intentos": 0})
+            except queue.Full:
+                restantes.append(mensaje)
+        if restantes:
+            self._derramar(restantes, "cola_llena")
+        print(f"📤 '{self.nombre}': {len(mensajes) - len(restantes)} mensaje(s) pendientes recuperados de {self._spill.descripcion}.")
+
+    def cerrar(self, timeout_segundos: float = 10.0):
+        """Da un plazo para vaciar la cola, detiene los workers y guarda en el spill lo que quede."""
+        if self._cerrado.is_set():
+            return
+        if self._hilos:
+            self.esperar(timeout_segundos)
+        self._cerrado.set()
+        for hilo in self._hilos:
+            hilo.join(timeout=5)
+        restantes = []
+        while True:
+            try:
+                restantes.append(self._cola.get_nowait()["mensaje"])
+                self._cola.task_done()
+            except queue.Empty:
+                break
+        self._derramar(restantes, "cerrado")
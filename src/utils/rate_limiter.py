@@ -0,0 +1,30 @@
+import time
+import threading
+
+
+class LimitadorTasa:
+    """
+    Token bucket compartido entre hilos: permite `por_segundo` operaciones sostenidas
+    con ráfagas de hasta `rafaga`. `adquirir()` bloquea hasta que haya un token.
+    """
+
+    def __init__(self, por_segundo: float, rafaga: int = 1):
+        self.por_segundo = por_segundo
+        self.rafaga = max(rafaga, 1)
+        self._tokens = float(self.rafaga)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        if self.por_segundo <= 0:
+            return
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.rafaga, self._tokens + (ahora - self._ultimo) * self.por_segundo)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.por_segundo
+            time.sleep(espera)
@@ -0,0 +1,890 @@
+import re
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from src.config import (
+    GCP_PROJECT_ID, BIGQUERY_DATASET_ID, TICKETS_TABLE_NAME, EVENTOS_TABLE_NAME,
+    STORAGE_BACKEND, SQLITE_DB_PATH
+)
+from src.utils import metrics
+
+ROLES_TABLE_NAME = "roles_usuarios"
+SLA_CONFIG_TABLE_NAME = "sla_configuracion"
+NPS_TABLE_NAME = "nps_feedback"
+TICKET_STATE_TABLE_NAME = "ticket_state"
+METRICAS_DIARIAS_TABLE_NAME = "metricas_diarias"
+
+# Columnas de la proyección `ticket_state` (estado actual de cada tiquete) y su tipo en BigQuery.
+COLUMNAS_ESTADO = {
+    "TicketID": "STRING",
+    "Estado": "STRING",
+    "Departamento": "STRING",
+    "Responsable": "STRING",
+    "Solicitante": "STRING",
+    "Prioridad": "STRING",
+    "FechaCreacion": "TIMESTAMP",
+    "SLA_Horas": "INT64",
+    "FechaVencimiento": "TIMESTAMP",
+    "UltimoEvento": "STRING",
+    "DetallesUltimoEvento": "STRING",
+    "FechaUltimoEvento": "TIMESTAMP",
+}
+
+# Cubo `metricas_diarias`: una fila por día (UTC) y combinación de dimensiones, con
+# medidas aditivas que se suman a medida que se escriben los eventos.
+DIMENSIONES_CUBO = {
+    "Fecha": "DATE",
+    "Departamento": "STRING",
+    "Responsable": "STRING",
+    "Prioridad": "STRING",
+}
+MEDIDAS_CUBO = {
+    "Abiertos": "INT64",
+    "Cerrados": "INT64",
+    "CerradosVencidos": "INT64",
+    "MinutosResolucion": "INT64",
+}
+
+# Columnas de una valoración en `nps_feedback` (el comentario se añade después con UPDATE).
+COLUMNAS_FEEDBACK = {
+    "feedback_id": "STRING",
+    "session_id": "STRING",
+    "message_id": "STRING",
+    "user_email": "STRING",
+    "rating": "INT64",
+    "timestamp": "TIMESTAMP",
+}
+
+
+class StorageBackend:
+    """
+    Interfaz de acceso a datos del helpdesk. Cada método corresponde a una sola
+    ida y vuelta a la base de datos, que se contabiliza en `metrics` bajo
+    'backend.round_trips' y 'backend.<operacion>'.
+    """
+    nombre = "base"
+
+    @contextmanager
+    def _round_trip(self, operacion: str):
+        metrics.incrementar("backend.round_trips")
+        metrics.incrementar(f"backend.round_trips.{operacion}")
+        with metrics.cronometrar(f"backend.{operacion}"):
+            yield
+
+    def _ejecutar(self, operacion: str, sql: str, parametros: dict = None) -> list:
+        with self._round_trip(operacion):
+            return self._ejecutar_sql(sql, parametros or {})
+
+    def _ejecutar_sql(self, sql: str, parametros: dict) -> list:
+        raise NotImplementedError
+
+    def insertar_eventos(self, eventos: list):
+        """Inserta un lote de eventos en una sola operación."""
+        raise NotImplementedError
+
+    def insertar_tiquete(self, tiquete: dict):
+        raise NotImplementedError
+
+    def contar_tiquete(self, ticket_id: str) -> int:
+        raise NotImplementedError
+
+    def obtener_rol(self, user_email: str) -> dict | None:
+        raise NotImplementedError
+
+    def listar_roles(self) -> list:
+        raise NotImplementedError
+
+    def asegurar_tabla_estado(self):
+        """Crea la tabla de proyección `ticket_state` si no existe."""
+        raise NotImplementedError
+
+    def guardar_estados_tiquetes(self, estados: list):
+        """Inserta o reemplaza (upsert) filas completas de `ticket_state`."""
+        raise NotImplementedError
+
+    def aplicar_proyecciones(self, estados: list, incrementos_cubo: list = None):
+        """
+        Upsert de `ticket_state` tras escribir un lote de eventos y suma de `incrementos_cubo`
+        a `metricas_diarias`, en una sola transacción. Una fila de estado solo reemplaza a la
+        guardada si su FechaUltimoEvento no es anterior, así el flush de otra instancia que leyó
+        menos eventos no pisa un estado más reciente.
+        """
+        raise NotImplementedError
+
+    def obtener_estados_tiquetes(self, ticket_ids: list) -> list:
+        """Lee por clave las filas de `ticket_state` de los tiquetes indicados."""
+        raise NotImplementedError
+
+    def listar_eventos_historicos(self, ticket_ids: list = None, activos_desde: datetime = None) -> list:
+        """
+        Devuelve el log de eventos completo (o de algunos tiquetes) para reconstruir la proyección.
+        Con `activos_desde`, solo los eventos de los tiquetes con algún evento desde esa fecha.
+        """
+        raise NotImplementedError
+
+    def listar_sla_configuracion(self) -> list:
+        raise NotImplementedError
+
+    def obtener_snapshot_tiquete(self, ticket_id: str) -> dict | None:
+        """
+        Lee en una sola consulta, por clave, la fila de `tickets` y la de `ticket_state`.
+        `Proyectado` indica si el tiquete ya tiene fila en la proyección.
+        """
+        raise NotImplementedError
+
+    def asegurar_tabla_cubo(self):
+        """Crea la tabla `metricas_diarias` si no existe."""
+        raise NotImplementedError
+
+    def reemplazar_metricas_diarias(self, filas: list, desde: date = None, hasta: date = None):
+        """
+        Reemplaza en una sola operación las filas de `metricas_diarias` con Fecha en
+        [desde, hasta) (sin límites, toda la tabla) por `filas`.
+        """
+        raise NotImplementedError
+
+    def consultar_metricas_diarias(self, dimensiones: list, desde: date = None, hasta: date = None,
+                                   filtros: dict = None) -> list:
+        """
+        Agrega `metricas_diarias` en [desde, hasta) por `dimensiones`, con filtros de igualdad
+        sobre dimensiones. Devuelve las medidas sumadas y las horas promedio de resolución.
+        """
+        raise NotImplementedError
+
+    def _sql_consulta_cubo(self, tabla: str, marcador: str, dimensiones: list, desde, hasta, filtros: dict) -> (str, dict):
+        for columna in list(dimensiones) + list(filtros or {}):
+            if columna not in DIMENSIONES_CUBO:
+                raise ValueError(f"Dimensión desconocida en metricas_diarias: {columna}")
+        condiciones, parametros = [], {}
+        if desde:
+            condiciones.append(f"Fecha >= {marcador}desde")
+            parametros["desde"] = desde
+        if hasta:
+            condiciones.append(f"Fecha < {marcador}hasta")
+            parametros["hasta"] = hasta
+        for columna, valor in (filtros or {}).items():
+            condiciones.append(f"{columna} = {marcador}{columna.lower()}")
+            parametros[columna.lower()] = valor
+        seleccion = [*dimensiones, *(f"SUM({medida}) AS {medida}" for medida in MEDIDAS_CUBO),
+                     "ROUND(SUM(MinutosResolucion) / NULLIF(SUM(Cerrados), 0) / 60.0, 2) AS HorasPromedioResolucion"]
+        query = f"""
+            SELECT {", ".join(seleccion)}
+            FROM {tabla}
+            {"WHERE " + " AND ".join(condiciones) if condiciones else ""}
+            {"GROUP BY " + ", ".join(dimensiones) + " ORDER BY " + ", ".join(dimensiones) if dimensiones else ""}
+        """
+        return query, parametros
+
+    def actualizar_sla_tiquete(self, ticket_id: str, nuevas_horas: int, nueva_fecha: datetime):
+        raise NotImplementedError
+
+    def listar_eventos(self, ticket_id: str) -> list:
+        raise NotImplementedError
+
+    def listar_tiquetes_abiertos(self) -> list:
+        raise NotImplementedError
+
+    def asegurar_tabla_feedback(self):
+        """Añade a `nps_feedback` las columnas que falten (p. ej. `message_id`)."""
+        raise NotImplementedError
+
+    def insertar_feedbacks(self, feedbacks: list):
+        """Inserta un lote de valoraciones en una sola operación."""
+        raise NotImplementedError
+
+    def actualizar_comentario_feedback(self, session_id: str, comment: str):
+        raise NotImplementedError
+
+    def ejecutar_consulta(self, sql: str, parametros: dict = None, max_bytes: int = None,
+                          timeout_segundos: float = None) -> list:
+        """
+        Ejecuta una consulta SQL libre (p. ej. generada por IA) y devuelve filas como diccionarios.
+        Los `parametros` se referencian en el SQL como @nombre. `max_bytes` y `timeout_segundos`
+        limitan lo que puede procesar y durar la consulta, si el backend lo permite.
+        """
+        return self._ejecutar("ejecutar_consulta", sql, parametros)
+
+    def ejecutar_consulta_acotada(self, sql: str, parametros: dict = None, max_filas: int = 500,
+                                  max_bytes: int = None, timeout_segundos: float = None) -> (list, int):
+        """
+        Como `ejecutar_consulta`, pero solo materializa las primeras `max_filas` filas.
+        Devuelve esas filas y el total de filas del resultado.
+        """
+        filas = self.ejecutar_consulta(sql, parametros, max_bytes, timeout_segundos)
+        return filas[:max_filas], len(filas)
+
+    def analizar_consulta(self, sql: str, parametros: dict = None) -> dict | None:
+        """
+        Analiza la consulta sin ejecutarla: `{"bytes": bytes que procesaría, "tablas": conjunto de
+        tablas que lee como 'proyecto.dataset.tabla'}`. None si el backend no sabe analizarla.
+        """
+        return None
+
+
+class BigQueryBackend(StorageBackend):
+    """Implementación sobre las tablas de BigQuery del dataset del helpdesk."""
+    nombre = "bigquery"
+
+    def __init__(self, project_id: str = GCP_PROJECT_ID, dataset_id: str = BIGQUERY_DATASET_ID):
+        from google.cloud import bigquery
+        self._bigquery = bigquery
+        self.client = bigquery.Client(project=project_id)
+        prefijo = f"{project_id}.{dataset_id}"
+        self.tickets_table_id = f"{prefijo}.{TICKETS_TABLE_NAME}"
+        self.eventos_table_id = f"{prefijo}.{EVENTOS_TABLE_NAME}"
+        self.roles_table_id = f"{prefijo}.{ROLES_TABLE_NAME}"
+        self.sla_config_table_id = f"{prefijo}.{SLA_CONFIG_TABLE_NAME}"
+        self.nps_table_id = f"{prefijo}.{NPS_TABLE_NAME}"
+        self.ticket_state_table_id = f"{prefijo}.{TICKET_STATE_TABLE_NAME}"
+        self.metricas_diarias_table_id = f"{prefijo}.{METRICAS_DIARIAS_TABLE_NAME}"
+
+    def _parametro(self, nombre: str, valor):
+        if isinstance(valor, (self._bigquery.ArrayQueryParameter, self._bigquery.StructQueryParameter)):
+            return valor
+        if isinstance(valor, tuple):
+            tipo, valor = valor
+        elif isinstance(valor, bool):
+            tipo = "BOOL"
+        elif isinstance(valor, int):
+            tipo = "INT64"
+        elif isinstance(valor, float):
+            tipo = "FLOAT64"
+        elif isinstance(valor, datetime):
+            tipo = "TIMESTAMP"
+        else:
+            tipo = "STRING"
+        return self._bigquery.ScalarQueryParameter(nombre, tipo, valor)
+
+    def _ejecutar_sql(self, sql: str, parametros: dict) -> list:
+        job_config = self._bigquery.QueryJobConfig(
+            query_parameters=[self._parametro(nombre, valor) for nombre, valor in parametros.items()]
+        )
+        return [dict(row) for row in self.client.query(sql, job_config=job_config).result()]
+
+    def _config_consulta(self, parametros: dict, max_bytes: int, timeout_segundos: float):
+        return self._bigquery.QueryJobConfig(
+            query_parameters=[self._parametro(nombre, valor) for nombre, valor in (parametros or {}).items()],
+            maximum_bytes_billed=max_bytes,
+            job_timeout_ms=int(timeout_segundos * 1000) if timeout_segundos else None,
+        )
+
+    def ejecutar_consulta(self, sql: str, parametros: dict = None, max_bytes: int = None,
+                          timeout_segundos: float = None) -> list:
+        job_config = self._config_consulta(parametros, max_bytes, timeout_segundos)
+        with self._round_trip("ejecutar_consulta"):
+            job = self.client.query(sql, job_config=job_config, timeout=timeout_segundos)
+            return [dict(row) for row in job.result(timeout=timeout_segundos)]
+
+    def ejecutar_consulta_acotada(self, sql: str, parametros: dict = None, max_filas: int = 500,
+                                  max_bytes: int = None, timeout_segundos: float = None) -> (list, int):
+        job_config = self._config_consulta(parametros, max_bytes, timeout_segundos)
+        with self._round_trip("ejecutar_consulta"):
+            job = self.client.query(sql, job_config=job_config, timeout=timeout_segundos)
+            # Se leen páginas hasta `max_filas`; el resto del resultado queda en la tabla temporal del job.
+            resultado = job.result(page_size=min(max_filas, 500), max_results=max_filas, timeout=timeout_segundos)
+            filas = [dict(row) for row in resultado]
+        return filas, resultado.total_rows or len(filas)
+
+    def analizar_consulta(self, sql: str, parametros: dict = None) -> dict | None:
+        job_config = self._bigquery.QueryJobConfig(
+            dry_run=True, use_query_cache=False,
+            query_parameters=[self._parametro(nombre, valor) for nombre, valor in (parametros or {}).items()],
+        )
+        with self._round_trip("analizar_consulta"):
+            job = self.client.query(sql, job_config=job_config)
+        return {
+            "bytes": job.total_bytes_processed or 0,
+            "tablas": {f"{tabla.project}.{tabla.dataset_id}.{tabla.table_id}" for tabla in job.referenced_tables or []},
+        }
+
+    def insertar_eventos(self, eventos: list):
+        filas = [{**evento, "FechaEvento": evento["FechaEvento"].isoformat()} for evento in eventos]
+        with self._round_trip("insertar_eventos"):
+            errores = self.client.insert_rows_json(
+                self.eventos_table_id, filas, row_ids=[evento["EventoID"] for evento in eventos]
+            )
+        if errores:
+            raise RuntimeError(f"BigQuery rechazó {len(errores)} eventos: {errores}")
+
+    def insertar_tiquete(self, tiquete: dict):
+        query = f"""
+            INSERT INTO `{self.tickets_table_id}` (TicketID, Solicitante, FechaCreacion, SLA_Horas, FechaVencimiento)
+            VALUES (@ticket_id, @solicitante, @fecha_creacion, @sla_horas, @fecha_vencimiento)
+        """
+        self._ejecutar("insertar_tiquete", query, {
+            "ticket_id": tiquete["TicketID"], "solicitante": tiquete["Solicitante"],
+            "fecha_creacion": tiquete["FechaCreacion"], "sla_horas": tiquete["SLA_Horas"],
+            "fecha_vencimiento": tiquete["FechaVencimiento"],
+        })
+
+    def contar_tiquete(self, ticket_id: str) -> int:
+        query = f"SELECT COUNT(TicketID) as count FROM `{self.tickets_table_id}` WHERE TicketID = @ticket_id"
+        return self._ejecutar("contar_tiquete", query, {"ticket_id": ticket_id})[0]["count"]
+
+    def obtener_rol(self, user_email: str) -> dict | None:
+        query = f"""
+            SELECT role, department
+            FROM `{self.roles_table_id}`
+            WHERE user_email = @user_email
+            LIMIT 1
+        """
+        filas = self._ejecutar("obtener_rol", query, {"user_email": user_email})
+        return filas[0] if filas else None
+
+    def listar_roles(self) -> list:
+        query = f"SELECT user_email, role, department FROM `{self.roles_table_id}`"
+        return self._ejecutar("listar_roles", query)
+
+    def asegurar_tabla_estado(self):
+        columnas = ",\n                ".join(f"{columna} {tipo}" for columna, tipo in COLUMNAS_ESTADO.items())
+        query = f"""
+            CREATE TABLE IF NOT EXISTS `{self.ticket_state_table_id}` (
+                {columnas}
+            )
+            CLUSTER BY TicketID
+        """
+        self._ejecutar("asegurar_tabla_estado", query)
+
+    def _parametro_estados(self, estados: list):
+        return self._bigquery.ArrayQueryParameter("estados", "STRUCT", [
+            self._bigquery.StructQueryParameter(None, *[
+                self._bigquery.ScalarQueryParameter(columna, tipo, estado.get(columna))
+                for columna, tipo in COLUMNAS_ESTADO.items()
+            ])
+            for estado in estados
+        ])
+
+    def _sql_merge_estados(self, condicion: str = "") -> str:
+        columnas = list(COLUMNAS_ESTADO)
+        return f"""
+            MERGE `{self.ticket_state_table_id}` T
+            USING UNNEST(@estados) S
+            ON T.TicketID = S.TicketID
+            WHEN MATCHED {condicion} THEN
+                UPDATE SET {", ".join(f"{c} = S.{c}" for c in columnas if c != "TicketID")}
+            WHEN NOT MATCHED THEN
+                INSERT ({", ".join(columnas)}) VALUES ({", ".join(f"S.{c}" for c in columnas)})
+        """
+
+    def guardar_estados_tiquetes(self, estados: list):
+        if not estados:
+            return
+        self._ejecutar("guardar_estados_tiquetes", self._sql_merge_estados(), {"estados": self._parametro_estados(estados)})
+
+    def _parametro_filas_cubo(self, filas: list):
+        return self._bigquery.ArrayQueryParameter("filas", "STRUCT", [
+            self._bigquery.StructQueryParameter(None, *[
+                self._bigquery.ScalarQueryParameter(columna, tipo, fila.get(columna))
+                for columna, tipo in {**DIMENSIONES_CUBO, **MEDIDAS_CUBO}.items()
+            ])
+            for fila in filas
+        ])
+
+    def aplicar_proyecciones(self, estados: list, incrementos_cubo: list = None):
+        if not estados:
+            return
+        sentencias = [self._sql_merge_estados("AND (T.FechaUltimoEvento IS NULL OR S.FechaUltimoEvento >= T.FechaUltimoEvento)")]
+        parametros = {"estados": self._parametro_estados(estados)}
+        if incrementos_cubo:
+            columnas = [*DIMENSIONES_CUBO, *MEDIDAS_CUBO]
+            sentencias.append(f"""
+            MERGE `{self.metricas_diarias_table_id}` T
+            USING UNNEST(@filas) S
+            ON {" AND ".join(f"T.{c} = S.{c}" for c in DIMENSIONES_CUBO)}
+            WHEN MATCHED THEN
+                UPDATE SET {", ".join(f"{m} = T.{m} + S.{m}" for m in MEDIDAS_CUBO)}
+            WHEN NOT MATCHED THEN
+                INSERT ({", ".join(columnas)}) VALUES ({", ".join(f"S.{c}" for c in columnas)})
+            """)
+            parametros["filas"] = self._parametro_filas_cubo(incrementos_cubo)
+        query = "BEGIN TRANSACTION;\n" + ";\n".join(sentencias) + ";\nCOMMIT TRANSACTION;"
+        self._ejecutar("aplicar_proyecciones", query, parametros)
+
+    def obtener_estados_tiquetes(self, ticket_ids: list) -> list:
+        query = f"""
+            SELECT {", ".join(COLUMNAS_ESTADO)}
+            FROM `{self.ticket_state_table_id}`
+            WHERE TicketID IN UNNEST(@ticket_ids)
+        """
+        ids = self._bigquery.ArrayQueryParameter("ticket_ids", "STRING", list(ticket_ids))
+        return self._ejecutar("obtener_estados_tiquetes", query, {"ticket_ids": ids})
+
+    def asegurar_tabla_cubo(self):
+        columnas = ",\n                ".join(f"{columna} {tipo}" for columna, tipo in {**DIMENSIONES_CUBO, **MEDIDAS_CUBO}.items())
+        query = f"""
+            CREATE TABLE IF NOT EXISTS `{self.metricas_diarias_table_id}` (
+                {columnas}
+            )
+            PARTITION BY Fecha
+            CLUSTER BY Departamento, Responsable
+        """
+        self._ejecutar("asegurar_tabla_cubo", query)
+
+    def reemplazar_metricas_diarias(self, filas: list, desde: date = None, hasta: date = None):
+        columnas = {**DIMENSIONES_CUBO, **MEDIDAS_CUBO}
+        rango = " AND ".join(["TRUE"] + (["T.Fecha >= @desde"] if desde else []) + (["T.Fecha < @hasta"] if hasta else []))
+        parametros = {}
+        if desde:
+            parametros["desde"] = ("DATE", desde)
+        if hasta:
+            parametros["hasta"] = ("DATE", hasta)
+        if not filas:
+            # Un ARRAY<STRUCT> vacío no tiene tipo como parámetro; solo hay que borrar el rango.
+            query = f"DELETE FROM `{self.metricas_diarias_table_id}` T WHERE {rango}"
+            self._ejecutar("reemplazar_metricas_diarias", query, parametros)
+            return
+        parametros["filas"] = self._parametro_filas_cubo(filas)
+        query = f"""
+            MERGE `{self.metricas_diarias_table_id}` T
+            USING UNNEST(@filas) S
+            ON {" AND ".join(f"T.{c} = S.{c}" for c in DIMENSIONES_CUBO)}
+            WHEN MATCHED THEN
+                UPDATE SET {", ".join(f"{m} = S.{m}" for m in MEDIDAS_CUBO)}
+            WHEN NOT MATCHED THEN
+                INSERT ({", ".join(columnas)}) VALUES ({", ".join(f"S.{c}" for c in columnas)})
+            WHEN NOT MATCHED BY SOURCE AND {rango} THEN
+                DELETE
+        """
+        self._ejecutar("reemplazar_metricas_diarias", query, parametros)
+
+    def consultar_metricas_diarias(self, dimensiones: list, desde: date = None, hasta: date = None,
+                                   filtros: dict = None) -> list:
+        query, parametros = self._sql_consulta_cubo(f"`{self.metricas_diarias_table_id}`", "@", dimensiones, desde, hasta, filtros)
+        for nombre in ("desde", "hasta"):
+            if nombre in parametros:
+                parametros[nombre] = ("DATE", parametros[nombre])
+        return self._ejecutar("consultar_metricas_diarias", query, parametros)
+
+    def listar_eventos_historicos(self, ticket_ids: list = None, activos_desde: datetime = None) -> list:
+        filtros, parametros = [], {}
+        if ticket_ids:
+            filtros.append("TicketID IN UNNEST(@ticket_ids)")
+            parametros["ticket_ids"] = self._bigquery.ArrayQueryParameter("ticket_ids", "STRING", list(ticket_ids))
+        if activos_desde:
+            filtros.append(f"TicketID IN (SELECT TicketID FROM `{self.eventos_table_id}` WHERE FechaEvento >= @activos_desde)")
+            parametros["activos_desde"] = activos_desde
+        query = f"""
+            SELECT EventoID, TicketID, FechaEvento, Autor, TipoEvento, Detalles
+            FROM `{self.eventos_table_id}`
+            {"WHERE " + " AND ".join(filtros) if filtros else ""}
+            ORDER BY TicketID, FechaEvento
+        """
+        return self._ejecutar("listar_eventos_historicos", query, parametros)
+
+    def listar_sla_configuracion(self) -> list:
+        query = f"SELECT department, priority, sla_hours FROM `{self.sla_config_table_id}`"
+        return self._ejecutar("listar_sla_configuracion", query)
+
+    def obtener_snapshot_tiquete(self, ticket_id: str) -> dict | None:
+        query = f"""
+            SELECT
+                t.TicketID, t.Solicitante, t.FechaCreacion, t.SLA_Horas, t.FechaVencimiento,
+                s.TicketID IS NOT NULL AS Proyectado, s.Estado, s.Departamento, s.Responsable,
+                s.UltimoEvento, s.DetallesUltimoEvento
+            FROM `{self.tickets_table_id}` t
+            LEFT JOIN `{self.ticket_state_table_id}` s ON s.TicketID = t.TicketID
+            WHERE t.TicketID = @ticket_id
+        """
+        filas = self._ejecutar("obtener_snapshot_tiquete", query, {"ticket_id": ticket_id})
+        return filas[0] if filas else None
+
+    def actualizar_sla_tiquete(self, ticket_id: str, nuevas_horas: int, nueva_fecha: datetime):
+        query = f"""
+            UPDATE `{self.tickets_table_id}`
+            SET SLA_Horas = @nuevas_horas, FechaVencimiento = @nueva_fecha
+            WHERE TicketID = @ticket_id
+        """
+        self._ejecutar("actualizar_sla_tiquete", query, {
+            "ticket_id": ticket_id, "nuevas_horas": nuevas_horas, "nueva_fecha": nueva_fecha,
+        })
+
+    def listar_eventos(self, ticket_id: str) -> list:
+        query = f"""
+            SELECT TipoEvento, FechaEvento, Detalles, Autor
+            FROM `{self.eventos_table_id}`
+            WHERE TicketID = @ticket_id
+            ORDER BY FechaEvento ASC
+        """
+        return self._ejecutar("listar_eventos", query, {"ticket_id": ticket_id})
+
+    def listar_tiquetes_abiertos(self) -> list:
+        query = f"""
+            SELECT TicketID, Solicitante, FechaVencimiento, Responsable, Departamento
+            FROM `{self.ticket_state_table_id}`
+            WHERE Estado != 'Cerrado' AND FechaVencimiento IS NOT NULL
+        """
+        return self._ejecutar("listar_tiquetes_abiertos", query)
+
+    def asegurar_tabla_feedback(self):
+        query = f"ALTER TABLE `{self.nps_table_id}` ADD COLUMN IF NOT EXISTS message_id STRING"
+        self._ejecutar("asegurar_tabla_feedback", query)
+
+    def insertar_feedbacks(self, feedbacks: list):
+        if not feedbacks:
+            return
+        # DML y no streaming: las filas del buffer de streaming no admiten el UPDATE del comentario.
+        filas = self._bigquery.ArrayQueryParameter("feedbacks", "STRUCT", [
+            self._bigquery.StructQueryParameter(None, *[
+                self._bigquery.ScalarQueryParameter(columna, tipo, feedback.get(columna))
+                for columna, tipo in COLUMNAS_FEEDBACK.items()
+            ])
+            for feedback in feedbacks
+        ])
+        columnas = ", ".join(COLUMNAS_FEEDBACK)
+        query = f"""
+            INSERT INTO `{self.nps_table_id}` ({columnas})
+            SELECT {columnas} FROM UNNEST(@feedbacks)
+        """
+        self._ejecutar("insertar_feedbacks", query, {"feedbacks": filas})
+
+    def actualizar_comentario_feedback(self, session_id: str, comment: str):
+        query = f"""
+            UPDATE `{self.nps_table_id}`
+            SET comment = @comment
+            WHERE feedback_id = (
+                SELECT feedback_id
+                FROM `{self.nps_table_id}`
+                WHERE session_id = @session_id AND rating = 0
+                ORDER BY timestamp DESC
+                LIMIT 1
+            )
+        """
+        self._ejecutar("actualizar_comentario_feedback", query, {"comment": comment, "session_id": session_id})
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Réplica local de las tablas del helpdesk sobre SQLite, pensada para pruebas
+    de carga y benchmarks sin depender de un proyecto de GCP.
+    """
+    nombre = "sqlite"
+
+    ESQUEMA = f"""
+        CREATE TABLE IF NOT EXISTS {TICKETS_TABLE_NAME} (
+            TicketID TEXT PRIMARY KEY, Solicitante TEXT, FechaCreacion TEXT,
+            SLA_Horas INTEGER, FechaVencimiento TEXT
+        );
+        CREATE TABLE IF NOT EXISTS {EVENTOS_TABLE_NAME} (
+            EventoID TEXT PRIMARY KEY, TicketID TEXT, FechaEvento TEXT,
+            Autor TEXT, TipoEvento TEXT, Detalles TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_eventos_ticket ON {EVENTOS_TABLE_NAME} (TicketID, FechaEvento);
+        CREATE TABLE IF NOT EXISTS {ROLES_TABLE_NAME} (
+            user_email TEXT PRIMARY KEY, role TEXT, department TEXT
+        );
+        CREATE TABLE IF NOT EXISTS {SLA_CONFIG_TABLE_NAME} (
+            department TEXT, priority TEXT, sla_hours INTEGER,
+            PRIMARY KEY (department, priority)
+        );
+        CREATE TABLE IF NOT EXISTS {NPS_TABLE_NAME} (
+            feedback_id TEXT PRIMARY KEY, session_id TEXT, message_id TEXT, user_email TEXT,
+            rating INTEGER, timestamp TEXT, comment TEXT
+        );
+        CREATE TABLE IF NOT EXISTS {TICKET_STATE_TABLE_NAME} (
+            {", ".join(f"{columna} {'TEXT PRIMARY KEY' if columna == 'TicketID' else 'INTEGER' if tipo == 'INT64' else 'TEXT'}" for columna, tipo in COLUMNAS_ESTADO.items())}
+        );
+        CREATE TABLE IF NOT EXISTS {METRICAS_DIARIAS_TABLE_NAME} (
+            {", ".join(f"{columna} TEXT NOT NULL" for columna in DIMENSIONES_CUBO)},
+            {", ".join(f"{medida} INTEGER NOT NULL DEFAULT 0" for medida in MEDIDAS_CUBO)},
+            PRIMARY KEY ({", ".join(DIMENSIONES_CUBO)})
+        );
+    """
+    COLUMNAS_FECHA = {"FechaCreacion", "FechaVencimiento", "FechaEvento", "FechaUltimoEvento", "timestamp"}
+
+    def __init__(self, db_path: str = SQLITE_DB_PATH):
+        self._lock = threading.Lock()
+        self.conexion = sqlite3.connect(db_path, check_same_thread=False)
+        self.conexion.row_factory = sqlite3.Row
+        self.conexion.executescript(self.ESQUEMA)
+        prefijo = f"{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}."
+        self._alias_bigquery = {
+            f"{prefijo}{tabla}": tabla
+            for tabla in (TICKETS_TABLE_NAME, EVENTOS_TABLE_NAME, ROLES_TABLE_NAME, SLA_CONFIG_TABLE_NAME, NPS_TABLE_NAME,
+                          TICKET_STATE_TABLE_NAME, METRICAS_DIARIAS_TABLE_NAME)
+        }
+
+    @staticmethod
+    def _a_texto(valor):
+        if isinstance(valor, datetime):
+            if valor.tzinfo:
+                valor = valor.astimezone(timezone.utc).replace(tzinfo=None)
+            return valor.isoformat(timespec="microseconds")
+        if isinstance(valor, date):
+            return valor.isoformat()
+        return valor
+
+    @classmethod
+    def _a_fila(cls, fila: sqlite3.Row) -> dict:
+        datos = dict(fila)
+        for columna in cls.COLUMNAS_FECHA.intersection(datos):
+            if datos[columna]:
+                datos[columna] = datetime.fromisoformat(datos[columna]).replace(tzinfo=timezone.utc)
+        return datos
+
+    def _ejecutar_sql(self, sql: str, parametros: dict) -> list:
+        parametros = {nombre: self._a_texto(valor) for nombre, valor in parametros.items()}
+        with self._lock:
+            cursor = self.conexion.execute(sql, parametros)
+            filas = [self._a_fila(fila) for fila in cursor.fetchall()]
+            self.conexion.commit()
+        return filas
+
+    def insertar_filas(self, tabla: str, filas: list):
+        """Carga filas directamente en una tabla local (para sembrar datos de prueba)."""
+        if not filas:
+            return
+        columnas = list(filas[0].keys())
+        sql = f"INSERT OR REPLACE INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' for _ in columnas)})"
+        with self._lock:
+            self.conexion.executemany(sql, [[self._a_texto(fila[c]) for c in columnas] for fila in filas])
+            self.conexion.commit()
+
+    def insertar_eventos(self, eventos: list):
+        # OR IGNORE: un lote reencolado tras un fallo parcial no choca con los eventos ya escritos
+        # (EventoID es la clave, como el row_id de BigQuery).
+        query = f"""
+            INSERT OR IGNORE INTO {EVENTOS_TABLE_NAME} (EventoID, TicketID, FechaEvento, Autor, TipoEvento, Detalles)
+            VALUES (:EventoID, :TicketID, :FechaEvento, :Autor, :TipoEvento, :Detalles)
+        """
+        filas = [{nombre: self._a_texto(valor) for nombre, valor in evento.items()} for evento in eventos]
+        with self._round_trip("insertar_eventos"), self._lock, self.conexion:
+            self.conexion.executemany(query, filas)
+
+    def insertar_tiquete(self, tiquete: dict):
+        query = f"""
+            INSERT INTO {TICKETS_TABLE_NAME} (TicketID, Solicitante, FechaCreacion, SLA_Horas, FechaVencimiento)
+            VALUES (:TicketID, :Solicitante, :FechaCreacion, :SLA_Horas, :FechaVencimiento)
+        """
+        self._ejecutar("insertar_tiquete", query, tiquete)
+
+    def contar_tiquete(self, ticket_id: str) -> int:
+        query = f"SELECT COUNT(TicketID) as count FROM {TICKETS_TABLE_NAME} WHERE TicketID = :ticket_id"
+        return self._ejecutar("contar_tiquete", query, {"ticket_id": ticket_id})[0]["count"]
+
+    def obtener_rol(self, user_email: str) -> dict | None:
+        query = f"SELECT role, department FROM {ROLES_TABLE_NAME} WHERE user_email = :user_email LIMIT 1"
+        filas = self._ejecutar("obtener_rol", query, {"user_email": user_email})
+        return filas[0] if filas else None
+
+    def listar_roles(self) -> list:
+        query = f"SELECT user_email, role, department FROM {ROLES_TABLE_NAME}"
+        return self._ejecutar("listar_roles", query)
+
+    def asegurar_tabla_estado(self):
+        # El esquema local ya incluye la tabla al abrir la conexión.
+        pass
+
+    def guardar_estados_tiquetes(self, estados: list):
+        if not estados:
+            return
+        columnas = list(COLUMNAS_ESTADO)
+        query = f"""
+            INSERT INTO {TICKET_STATE_TABLE_NAME} ({", ".join(columnas)})
+            VALUES ({", ".join(":" + c for c in columnas)})
+            ON CONFLICT(TicketID) DO UPDATE SET {", ".join(f"{c} = excluded.{c}" for c in columnas if c != "TicketID")}
+        """
+        filas = [{c: self._a_texto(estado.get(c)) for c in columnas} for estado in estados]
+        with self._round_trip("guardar_estados_tiquetes"), self._lock:
+            self.conexion.executemany(query, filas)
+            self.conexion.commit()
+
+    def aplicar_proyecciones(self, estados: list, incrementos_cubo: list = None):
+        if not estados:
+            return
+        columnas = list(COLUMNAS_ESTADO)
+        query = f"""
+            INSERT INTO {TICKET_STATE_TABLE_NAME} ({", ".join(columnas)})
+            VALUES ({", ".join(":" + c for c in columnas)})
+            ON CONFLICT(TicketID) DO UPDATE SET {", ".join(f"{c} = excluded.{c}" for c in columnas if c != "TicketID")}
+            WHERE {TICKET_STATE_TABLE_NAME}.FechaUltimoEvento IS NULL
+               OR excluded.FechaUltimoEvento >= {TICKET_STATE_TABLE_NAME}.FechaUltimoEvento
+        """
+        filas = [{c: self._a_texto(estado.get(c)) for c in columnas} for estado in estados]
+        columnas_cubo = [*DIMENSIONES_CUBO, *MEDIDAS_CUBO]
+        query_cubo = f"""
+            INSERT INTO {METRICAS_DIARIAS_TABLE_NAME} ({", ".join(columnas_cubo)})
+            VALUES ({", ".join(":" + c for c in columnas_cubo)})
+            ON CONFLICT({", ".join(DIMENSIONES_CUBO)}) DO UPDATE SET {", ".join(f"{m} = {m} + excluded.{m}" for m in MEDIDAS_CUBO)}
+        """
+        incrementos = [{c: self._a_texto(fila.get(c)) for c in columnas_cubo} for fila in incrementos_cubo or []]
+        with self._round_trip("aplicar_proyecciones"), self._lock, self.conexion:
+            self.conexion.executemany(query, filas)
+            self.conexion.executemany(query_cubo, incrementos)
+
+    def obtener_estados_tiquetes(self, ticket_ids: list) -> list:
+        marcadores = {f"id{i}": ticket_id for i, ticket_id in enumerate(ticket_ids)}
+        if not marcadores:
+            return []
+        query = f"""
+            SELECT {", ".join(COLUMNAS_ESTADO)} FROM {TICKET_STATE_TABLE_NAME}
+            WHERE TicketID IN ({", ".join(":" + nombre for nombre in marcadores)})
+        """
+        return self._ejecutar("obtener_estados_tiquetes", query, marcadores)
+
+    def asegurar_tabla_cubo(self):
+        # El esquema local ya incluye la tabla al abrir la conexión.
+        pass
+
+    def reemplazar_metricas_diarias(self, filas: list, desde: date = None, hasta: date = None):
+        columnas = [*DIMENSIONES_CUBO, *MEDIDAS_CUBO]
+        rango = " AND ".join(["1 = 1"] + (["Fecha >= :desde"] if desde else []) + (["Fecha < :hasta"] if hasta else []))
+        query = f"""
+            INSERT INTO {METRICAS_DIARIAS_TABLE_NAME} ({", ".join(columnas)})
+            VALUES ({", ".join(":" + c for c in columnas)})
+        """
+        valores = [{c: self._a_texto(fila.get(c)) for c in columnas} for fila in filas]
+        with self._round_trip("reemplazar_metricas_diarias"), self._lock, self.conexion:
+            self.conexion.execute(f"DELETE FROM {METRICAS_DIARIAS_TABLE_NAME} WHERE {rango}",
+                                  {"desde": self._a_texto(desde), "hasta": self._a_texto(hasta)})
+            self.conexion.executemany(query, valores)
+
+    def consultar_metricas_diarias(self, dimensiones: list, desde: date = None, hasta: date = None,
+                                   filtros: dict = None) -> list:
+        query, parametros = self._sql_consulta_cubo(METRICAS_DIARIAS_TABLE_NAME, ":", dimensiones, desde, hasta, filtros)
+        return self._ejecutar("consultar_metricas_diarias", query, parametros)
+
+    def listar_eventos_historicos(self, ticket_ids: list = None, activos_desde: datetime = None) -> list:
+        filtros, parametros = [], {}
+        if ticket_ids:
+            marcadores = {f"id{i}": ticket_id for i, ticket_id in enumerate(ticket_ids)}
+            filtros.append(f"TicketID IN ({', '.join(':' + nombre for nombre in marcadores)})")
+            parametros.update(marcadores)
+        if activos_desde:
+            filtros.append(f"TicketID IN (SELECT TicketID FROM {EVENTOS_TABLE_NAME} WHERE FechaEvento >= :activos_desde)")
+            parametros["activos_desde"] = activos_desde
+        query = f"""
+            SELECT EventoID, TicketID, FechaEvento, Autor, TipoEvento, Detalles FROM {EVENTOS_TABLE_NAME}
+            {"WHERE " + " AND ".join(filtros) if filtros else ""}
+            ORDER BY TicketID, FechaEvento
+        """
+        return self._ejecutar("listar_eventos_historicos", query, parametros)
+
+    def listar_sla_configuracion(self) -> list:
+        query = f"SELECT department, priority, sla_hours FROM {SLA_CONFIG_TABLE_NAME}"
+        return self._ejecutar("listar_sla_configuracion", query)
+
+    def obtener_snapshot_tiquete(self, ticket_id: str) -> dict | None:
+        query = f"""
+            SELECT
+                t.TicketID, t.Solicitante, t.FechaCreacion, t.SLA_Horas, t.FechaVencimiento,
+                s.TicketID IS NOT NULL AS Proyectado, s.Estado, s.Departamento, s.Responsable,
+                s.UltimoEvento, s.DetallesUltimoEvento
+            FROM {TICKETS_TABLE_NAME} t
+            LEFT JOIN {TICKET_STATE_TABLE_NAME} s ON s.TicketID = t.TicketID
+            WHERE t.TicketID = :ticket_id
+        """
+        filas = self._ejecutar("obtener_snapshot_tiquete", query, {"ticket_id": ticket_id})
+        return filas[0] if filas else None
+
+    def actualizar_sla_tiquete(self, ticket_id: str, nuevas_horas: int, nueva_fecha: datetime):
+        query = f"""
+            UPDATE {TICKETS_TABLE_NAME}
+            SET SLA_Horas = :nuevas_horas, FechaVencimiento = :nueva_fecha
+            WHERE TicketID = :ticket_id
+        """
+        self._ejecutar("actualizar_sla_tiquete", query, {
+            "ticket_id": ticket_id, "nuevas_horas": nuevas_horas, "nueva_fecha": nueva_fecha,
+        })
+
+    def listar_eventos(self, ticket_id: str) -> list:
+        query = f"""
+            SELECT TipoEvento, FechaEvento, Detalles, Autor FROM {EVENTOS_TABLE_NAME}
+            WHERE TicketID = :ticket_id
+            ORDER BY FechaEvento ASC
+        """
+        return self._ejecutar("listar_eventos", query, {"ticket_id": ticket_id})
+
+    def listar_tiquetes_abiertos(self) -> list:
+        query = f"""
+            SELECT TicketID, Solicitante, FechaVencimiento, Responsable, Departamento
+            FROM {TICKET_STATE_TABLE_NAME}
+            WHERE Estado != 'Cerrado' AND FechaVencimiento IS NOT NULL
+        """
+        return self._ejecutar("listar_tiquetes_abiertos", query)
+
+    def asegurar_tabla_feedback(self):
+        columnas = {fila["name"] for fila in self._ejecutar("asegurar_tabla_feedback", f"PRAGMA table_info({NPS_TABLE_NAME})")}
+        if "message_id" not in columnas:
+            self._ejecutar("asegurar_tabla_feedback", f"ALTER TABLE {NPS_TABLE_NAME} ADD COLUMN message_id TEXT")
+
+    def insertar_feedbacks(self, feedbacks: list):
+        columnas = list(COLUMNAS_FEEDBACK)
+        query = f"""
+            INSERT INTO {NPS_TABLE_NAME} ({", ".join(columnas)})
+            VALUES ({", ".join(":" + c for c in columnas)})
+        """
+        filas = [{c: self._a_texto(feedback.get(c)) for c in columnas} for feedback in feedbacks]
+        with self._round_trip("insertar_feedbacks"), self._lock:
+            self.conexion.executemany(query, filas)
+            self.conexion.commit()
+
+    def actualizar_comentario_feedback(self, session_id: str, comment: str):
+        query = f"""
+            UPDATE {NPS_TABLE_NAME}
+            SET comment = :comment
+            WHERE feedback_id = (
+                SELECT feedback_id FROM {NPS_TABLE_NAME}
+                WHERE session_id = :session_id AND rating = 0
+                ORDER BY timestamp DESC
+                LIMIT 1
+            )
+        """
+        self._ejecutar("actualizar_comentario_feedback", query, {"comment": comment, "session_id": session_id})
+
+    def _adaptar_sql(self, sql: str, parametros: dict) -> str:
+        for tabla_bigquery, tabla_local in self._alias_bigquery.items():
+            sql = sql.replace(f"`{tabla_bigquery}`", tabla_local).replace(tabla_bigquery, tabla_local)
+        for nombre in parametros or {}:
+            sql = re.sub(rf"@{nombre}\b", f":{nombre}", sql)
+        return sql
+
+    @contextmanager
+    def _cursor_con_limite(self, sql: str, parametros: dict, timeout_segundos: float):
+        # SQLite no tiene límite de bytes; el tiempo se corta desde el progress handler.
+        limite = time.monotonic() + timeout_segundos if timeout_segundos else None
+        with self._round_trip("ejecutar_consulta"), self._lock:
+            if limite:
+                self.conexion.set_progress_handler(lambda: time.monotonic() > limite, 10000)
+            try:
+                yield self.conexion.execute(self._adaptar_sql(sql, parametros), {n: self._a_texto(v) for n, v in (parametros or {}).items()})
+            finally:
+                self.conexion.set_progress_handler(None, 0)
+
+    def ejecutar_consulta(self, sql: str, parametros: dict = None, max_bytes: int = None,
+                          timeout_segundos: float = None) -> list:
+        with self._cursor_con_limite(sql, parametros, timeout_segundos) as cursor:
+            return [self._a_fila(fila) for fila in cursor.fetchall()]
+
+    def ejecutar_consulta_acotada(self, sql: str, parametros: dict = None, max_filas: int = 500,
+                                  max_bytes: int = None, timeout_segundos: float = None) -> (list, int):
+        with self._cursor_con_limite(sql, parametros, timeout_segundos) as cursor:
+            filas = [self._a_fila(fila) for fila in cursor.fetchmany(max_filas)]
+            return filas, len(filas) + sum(1 for _ in cursor)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obtener_backend() -> StorageBackend:
+    """Devuelve la instancia única del backend configurado en STORAGE_BACKEND ('bigquery' o 'sqlite')."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if STORAGE_BACKEND == "sqlite":
+                _backend = SQLiteBackend()
+            elif STORAGE_BACKEND == "bigquery":
+                _backend = BigQueryBackend()
+            else:
+                raise ValueError(f"STORAGE_BACKEND desconocido: {STORAGE_BACKEND}")
+            print(f"✅ Backend de almacenamiento inicializado: {_backend.nombre}")
+        return _backend
+
+
+def usar_backend(backend: StorageBackend):
+    """Reemplaza el backend activo (p. ej. por un SQLiteBackend en memoria en benchmarks)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
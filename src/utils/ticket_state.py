@@ -0,0 +1,123 @@
+import json
+from datetime import datetime, timedelta, timezone
+from src.utils import metrics
+from src.utils.storage_backend import COLUMNAS_ESTADO, DIMENSIONES_CUBO, MEDIDAS_CUBO
+
+ESTADO_ABIERTO = "Abierto"
+ESTADO_CERRADO = "Cerrado"
+
+
+def _a_utc(valor) -> datetime | None:
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor.astimezone(timezone.utc)
+
+
+def aplicar_evento(estado: dict | None, evento: dict) -> dict:
+    """
+    Aplica un evento de `eventos_tiquetes` sobre el estado actual de un tiquete y
+    devuelve el nuevo estado. Es la única fuente de verdad de cómo se deriva la
+    proyección, tanto en el refresco programado como en la reconstrucción y la lectura
+    de un solo tiquete.
+    """
+    estado = dict(estado) if estado else {columna: None for columna in COLUMNAS_ESTADO}
+    estado["TicketID"] = evento["TicketID"]
+    detalles = json.loads(evento["Detalles"]) if isinstance(evento["Detalles"], str) else evento["Detalles"]
+    fecha_evento = _a_utc(evento["FechaEvento"])
+    tipo = evento["TipoEvento"]
+
+    ultimo = _a_utc(estado.get("FechaUltimoEvento"))
+    if ultimo and fecha_evento < ultimo:
+        # Evento que llega tarde: solo puede completar datos, no reemplazar el último evento.
+        metrics.incrementar("ticket_state.eventos_fuera_de_orden")
+        es_ultimo = False
+    else:
+        es_ultimo = True
+
+    if tipo == "CREADO":
+        estado["Departamento"] = detalles.get("equipo_asignado")
+        estado["Solicitante"] = evento.get("Autor")
+        estado["Prioridad"] = detalles.get("prioridad_asignada")
+        estado["FechaCreacion"] = _a_utc(detalles.get("fecha_creacion")) or fecha_evento
+        estado["SLA_Horas"] = detalles.get("sla_calculado_horas")
+        if detalles.get("fecha_vencimiento"):
+            estado["FechaVencimiento"] = _a_utc(detalles["fecha_vencimiento"])
+        elif estado["SLA_Horas"] is not None:
+            estado["FechaVencimiento"] = estado["FechaCreacion"] + timedelta(hours=estado["SLA_Horas"])
+    elif tipo == "SLA_MODIFICADO":
+        estado["SLA_Horas"] = detalles.get("nuevo_sla_horas")
+        if detalles.get("nueva_fecha_vencimiento"):
+            estado["FechaVencimiento"] = _a_utc(detalles["nueva_fecha_vencimiento"])
+        elif estado["FechaCreacion"] and estado["SLA_Horas"] is not None:
+            estado["FechaVencimiento"] = _a_utc(estado["FechaCreacion"]) + timedelta(hours=estado["SLA_Horas"])
+
+    if es_ultimo:
+        responsable = detalles.get("nuevo_responsable") or detalles.get("responsable_inicial")
+        if responsable:
+            estado["Responsable"] = responsable
+        if tipo == "CERRADO":
+            estado["Estado"] = ESTADO_CERRADO
+        elif tipo in ("CREADO", "REASIGNADO"):
+            estado["Estado"] = ESTADO_ABIERTO
+        estado["UltimoEvento"] = tipo
+        estado["DetallesUltimoEvento"] = json.dumps(detalles)
+        estado["FechaUltimoEvento"] = fecha_evento
+    elif not estado.get("Responsable"):
+        estado["Responsable"] = detalles.get("nuevo_responsable") or detalles.get("responsable_inicial")
+    return estado
+
+
+def acumular_cubo(cubo: dict, estado: dict, evento: dict):
+    """
+    Suma al cubo `metricas_diarias` (clave = día UTC + departamento, responsable y prioridad)
+    lo que aporta un evento, con `estado` ya actualizado por ese evento. Solo CREADO y
+    CERRADO aportan medidas.
+    """
+    tipo = evento["TipoEvento"]
+    if tipo not in ("CREADO", "CERRADO"):
+        return
+    fecha_evento = _a_utc(evento["FechaEvento"])
+    clave = (fecha_evento.date(), estado.get("Departamento") or "", estado.get("Responsable") or "", estado.get("Prioridad") or "")
+    medidas = cubo.setdefault(clave, {medida: 0 for medida in MEDIDAS_CUBO})
+    if tipo == "CREADO":
+        medidas["Abiertos"] += 1
+        return
+    medidas["Cerrados"] += 1
+    creacion, vencimiento = _a_utc(estado.get("FechaCreacion")), _a_utc(estado.get("FechaVencimiento"))
+    if creacion:
+        medidas["MinutosResolucion"] += max(int((fecha_evento - creacion).total_seconds() // 60), 0)
+    if vencimiento and fecha_evento > vencimiento:
+        medidas["CerradosVencidos"] += 1
+
+
+def filas_cubo(cubo: dict) -> list:
+    return [{**dict(zip(DIMENSIONES_CUBO, clave)), **medidas} for clave, medidas in cubo.items()]
+
+
+def proyectar_eventos(estados: dict, eventos: list, cubo: dict = None, acumular: set = None) -> dict:
+    """
+    Aplica una lista de eventos (en orden cronológico) sobre un diccionario TicketID -> estado.
+    Si se pasa `cubo`, acumula en él las medidas diarias de los eventos (ver `acumular_cubo`);
+    con `acumular`, solo las de los eventos cuyo EventoID está en ese conjunto.
+    """
+    for evento in sorted(eventos, key=lambda e: _a_utc(e["FechaEvento"])):
+        ticket_id = evento["TicketID"]
+        estados[ticket_id] = aplicar_evento(estados.get(ticket_id), evento)
+        if cubo is not None and (acumular is None or evento["EventoID"] in acumular):
+            acumular_cubo(cubo, estados[ticket_id], evento)
+    return estados
+
+
+
+def proyectar_lote(historial: list, lote: list, cubo: dict = None) -> dict:
+    """
+    Estado actual de los tiquetes de un lote de eventos recién escrito, a partir de su log
+    guardado (`historial`) más el propio lote. Se deduplica por EventoID porque el historial
+    puede incluir ya los eventos del lote. Con `cubo`, acumula en él solo lo que aportan los
+    eventos del lote: es el incremento que el flush suma a `metricas_diarias`.
+    """
+    eventos = {evento["EventoID"]: evento for evento in historial}
+    eventos.update({evento["EventoID"]: evento for evento in lote})
+    return proyectar_eventos({}, list(eventos.values()), cubo, {evento["EventoID"] for evento in lote})
@@ -0,0 +1,84 @@
+import os
+import json
+import numpy as np
+
+ARCHIVO_EMBEDDINGS = "embeddings.npy"
+ARCHIVO_IDS = "ids.json"
+
+
+def normalizar_filas(matriz: np.ndarray) -> np.ndarray:
+    """Escala cada fila a norma 1 para que el producto punto sea la similitud coseno."""
+    matriz = np.asarray(matriz, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def guardar_snapshot(directorio: str, ids: list, embeddings) -> None:
+    """Escribe un snapshot del índice: `embeddings.npy` (float32, filas normalizadas) e `ids.json`."""
+    matriz = normalizar_filas(embeddings)
+    if len(ids) != matriz.shape[0]:
+        raise ValueError(f"Se recibieron {len(ids)} ids para {matriz.shape[0]} embeddings.")
+    os.makedirs(directorio, exist_ok=True)
+    np.save(os.path.join(directorio, ARCHIVO_EMBEDDINGS), matriz)
+    with open(os.path.join(directorio, ARCHIVO_IDS), "w", encoding="utf-8") as archivo:
+        json.dump(list(ids), archivo)
+
+
+class IndiceVectorial:
+    """
+    Índice de vecinos más cercanos por similitud coseno, en el proceso.
+    La matriz se abre con memory-map (float32, filas ya normalizadas) y la búsqueda exacta
+    es un único producto matriz-vector de NumPy. Si `hnswlib` está instalado y el corpus
+    tiene al menos `min_docs_hnsw` documentos se construye además un índice HNSW aproximado.
+    """
+
+    def __init__(self, ids: list, matriz: np.ndarray, min_docs_hnsw: int = 0):
+        self.ids = list(ids)
+        self.matriz = matriz
+        self.dimension = matriz.shape[1] if matriz.ndim == 2 else 0
+        self._hnsw = None
+        if min_docs_hnsw and len(self.ids) >= min_docs_hnsw:
+            self._hnsw = self._construir_hnsw()
+
+    @classmethod
+    def cargar(cls, directorio: str, min_docs_hnsw: int = 0) -> "IndiceVectorial":
+        matriz = np.load(os.path.join(directorio, ARCHIVO_EMBEDDINGS), mmap_mode="r")
+        with open(os.path.join(directorio, ARCHIVO_IDS), encoding="utf-8") as archivo:
+            ids = json.load(archivo)
+        if matriz.dtype != np.float32 or matriz.ndim != 2 or matriz.shape[0] != len(ids):
+            raise ValueError(f"Snapshot inválido en {directorio}: {matriz.shape} {matriz.dtype} para {len(ids)} ids.")
+        return cls(ids, matriz, min_docs_hnsw)
+
+    def _construir_hnsw(self):
+        try:
+            import hnswlib
+        except ImportError:
+            print("⚠️  hnswlib no está instalado; se usará búsqueda exacta con NumPy.")
+            return None
+        indice = hnswlib.Index(space="cosine", dim=self.dimension)
+        indice.init_index(max_elements=len(self.ids), ef_construction=200, M=16)
+        indice.add_items(np.asarray(self.matriz), np.arange(len(self.ids)))
+        indice.set_ef(64)
+        return indice
+
+    def __len__(self):
+        return len(self.ids)
+
+    def buscar(self, vector, k: int = 1, exacto: bool = False) -> list:
+        """Devuelve hasta `k` pares (id, similitud coseno) ordenados de mayor a menor similitud."""
+        if not self.ids:
+            return []
+        k = min(k, len(self.ids))
+        consulta = normalizar_filas(vector)
+        if self._hnsw is not None and not exacto:
+            posiciones, distancias = self._hnsw.knn_query(consulta, k=k)
+            return [(self.ids[p], float(1.0 - d)) for p, d in zip(posiciones[0], distancias[0])]
+
+        similitudes = self.matriz @ consulta
+        if k < len(similitudes):
+            mejores = np.argpartition(-similitudes, k - 1)[:k]
+        else:
+            mejores = np.arange(len(similitudes))
+        mejores = mejores[np.argsort(-similitudes[mejores])]
+        return [(self.ids[p], float(similitudes[p])) for p in mejores]
@@ -0,0 +1,13 @@
+import os
+import sys
+
+# Las pruebas corren sin credenciales de GCP: backend SQLite en memoria y un proyecto ficticio.
+os.environ.setdefault("GCP_PROJECT_ID", "proyecto-test")
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_DB_PATH"] = ":memory:"
+# Con el emulador configurado, firestore.Client() no pide credenciales al importar memory_service;
+# las pruebas reemplazan `db` y nunca se conectan.
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8681")
+# Importar main.py arranca el pool de render; en las pruebas se dibuja en el propio hilo.
+os.environ.setdefault("TIMELINE_RENDER_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
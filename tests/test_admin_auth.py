@@ -0,0 +1,46 @@
+import pytest
+from google.oauth2 import id_token
+import main
+from src.utils import admin_auth
+
+RUTAS = [("get", "/metrics"), ("post", "/roles/invalidate"), ("post", "/run-summary"),
+         ("post", "/rebuild-ticket-state"), ("post", "/refresh-projections")]
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(admin_auth, "ADMIN_API_TOKEN", "secreto")
+    monkeypatch.setattr(admin_auth, "ADMIN_OIDC_AUDIENCE", "https://dex.a.run.app")
+    monkeypatch.setattr(admin_auth, "ADMIN_OIDC_SERVICE_ACCOUNTS", {"scheduler@proyecto.iam.gserviceaccount.com"})
+    monkeypatch.setattr(main, "invalidar_cache_roles", lambda email=None: None)
+    return main.app.test_client()
+
+
+def _claims(token, solicitud, audience):
+    if token == "invalido" or audience != "https://dex.a.run.app":
+        raise ValueError("Token used too late")
+    return {"email": f"{token}@proyecto.iam.gserviceaccount.com", "email_verified": True}
+
+
+@pytest.mark.parametrize("metodo, ruta", RUTAS)
+def test_sin_credenciales_responde_401(cliente, metodo, ruta):
+    assert getattr(cliente, metodo)(ruta).status_code == 401
+    assert getattr(cliente, metodo)(ruta, headers={"X-Admin-Token": "otro"}).status_code == 401
+
+
+def test_token_compartido(cliente):
+    assert cliente.get("/metrics", headers={"X-Admin-Token": "secreto"}).status_code == 200
+    assert cliente.post("/roles/invalidate", json={}, headers={"X-Admin-Token": "secreto"}).status_code == 200
+
+
+def test_oidc_de_la_cuenta_de_scheduler(cliente, monkeypatch):
+    monkeypatch.setattr(id_token, "verify_oauth2_token", _claims)
+    assert cliente.get("/metrics", headers={"Authorization": "Bearer scheduler"}).status_code == 200
+    assert cliente.get("/metrics", headers={"Authorization": "Bearer otra-cuenta"}).status_code == 401
+    assert cliente.get("/metrics", headers={"Authorization": "Bearer invalido"}).status_code == 401
+
+
+def test_sin_configuracion_rechaza_todo(cliente, monkeypatch):
+    monkeypatch.setattr(admin_auth, "ADMIN_API_TOKEN", None)
+    monkeypatch.setattr(admin_auth, "ADMIN_OIDC_AUDIENCE", None)
+    assert cliente.get("/metrics", headers={"X-Admin-Token": ""}).status_code == 401
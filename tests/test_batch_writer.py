@@ -0,0 +1,80 @@
+import pytest
+from src.utils import batch_writer
+from src.utils.batch_writer import BatchWriter
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    esperas = []
+    monkeypatch.setattr(batch_writer.time, "sleep", esperas.append)
+    return esperas
+
+
+class _Destino:
+    """Función de escritura que falla las primeras `fallos` llamadas."""
+
+    def __init__(self, fallos: int = 0):
+        self.fallos = fallos
+        self.lotes = []
+
+    def __call__(self, lote):
+        if self.fallos:
+            self.fallos -= 1
+            raise RuntimeError("503 backend no disponible")
+        self.lotes.append(list(lote))
+
+
+def _writer(destino, **kwargs) -> BatchWriter:
+    writer = BatchWriter("test", destino, intervalo_segundos=3600, **kwargs)
+    writer._cerrado = True  # sin hilo de fondo: las pruebas llaman a flush()
+    return writer
+
+
+def test_flush_escribe_en_lotes_de_tamano_lote(esperas):
+    destino = _Destino()
+    writer = _writer(destino, tamano_lote=2)
+    for i in range(5):
+        writer.agregar({"id": i})
+    assert writer.flush() == 5
+    assert [[fila["id"] for fila in lote] for lote in destino.lotes] == [[0, 1], [2, 3], [4]]
+    assert esperas == []
+
+
+def test_lote_fallido_se_reintenta_con_backoff_y_conserva_el_orden(esperas):
+    destino = _Destino(fallos=2)
+    writer = _writer(destino, tamano_lote=10, max_reintentos=3)
+    for i in range(3):
+        writer.agregar({"id": i})
+    assert writer.flush() == 3
+    assert [fila["id"] for fila in destino.lotes[0]] == [0, 1, 2]
+    assert esperas == [0.2, 0.4]
+    assert writer.pendientes() == 0
+
+
+def test_reintentos_agotados_dejan_las_filas_en_la_cola(esperas):
+    destino = _Destino(fallos=5)
+    writer = _writer(destino, tamano_lote=10, max_reintentos=3)
+    writer.agregar({"id": 1})
+    assert writer.flush() == 0
+    assert len(esperas) == 2
+    assert writer.pendientes() == 1
+    destino.fallos = 0
+    assert writer.flush() == 1
+
+
+def test_un_fallo_a_mitad_no_duplica_los_lotes_ya_escritos(esperas):
+    destino = _Destino()
+    writer = _writer(destino, tamano_lote=1)
+    writer.agregar({"id": 1})
+    writer.agregar({"id": 2})
+    escribir = destino.__call__
+
+    def falla_en_el_segundo(lote):
+        if lote[0]["id"] == 2 and len(destino.lotes) == 1 and not esperas:
+            raise RuntimeError("timeout")
+        escribir(lote)
+
+    writer._funcion_escritura = falla_en_el_segundo
+    assert writer.flush() == 2
+    assert [lote[0]["id"] for lote in destino.lotes] == [1, 2]
+    assert esperas == [0.2]
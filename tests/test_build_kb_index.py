@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from src.tasks import build_kb_index
+from src.utils import embedding_cache
+from src.utils.vector_index import IndiceVectorial
+
+DOCUMENTOS = {f"fuentes/doc{i}.md": f"documento {i} " * (i + 1) for i in range(5)}
+
+
+class _ModeloFalso:
+    def __init__(self):
+        self.lotes = []
+
+    def get_embeddings(self, textos, auto_truncate=True):
+        self.lotes.append(list(textos))
+        return [SimpleNamespace(values=[float(len(texto)), 1.0]) for texto in textos]
+
+
+@pytest.fixture
+def modelo(monkeypatch):
+    modelo = _ModeloFalso()
+    blobs = [SimpleNamespace(name="fuentes/")] + [SimpleNamespace(name=nombre) for nombre in DOCUMENTOS]
+    bucket = SimpleNamespace(list_blobs=lambda prefix: blobs)
+    monkeypatch.setattr(build_kb_index, "storage_client", SimpleNamespace(bucket=lambda nombre: bucket))
+    monkeypatch.setattr(build_kb_index, "documentos_kb", SimpleNamespace(obtener=DOCUMENTOS.get))
+    monkeypatch.setattr(build_kb_index, "embedding_model", modelo)
+    monkeypatch.setattr(build_kb_index, "KB_INDEX_EMBED_BATCH_SIZE", 2)
+    monkeypatch.setattr(build_kb_index, "KB_INDEX_MAX_CHARS", 30)
+    return modelo
+
+
+def test_documentos_en_lotes_y_truncados(modelo, tmp_path):
+    assert build_kb_index.construir_indice_kb(str(tmp_path)) == 5
+    assert [len(lote) for lote in modelo.lotes] == [2, 2, 1]
+    assert max(len(texto) for lote in modelo.lotes for texto in lote) == 30
+
+    indice = IndiceVectorial.cargar(str(tmp_path))
+    assert len(indice) == 5
+    assert indice.buscar([30.0, 1.0], k=1)[0][0] in {"doc3.md", "doc4.md"}
+
+
+def test_los_documentos_no_pasan_por_la_cache_de_consultas(modelo, monkeypatch, tmp_path):
+    guardados = []
+    monkeypatch.setattr(embedding_cache._memoria, "guardar", lambda *args: guardados.append(args))
+    build_kb_index.construir_indice_kb(str(tmp_path))
+    assert guardados == []
+    assert np.load(tmp_path / "embeddings.npy").shape == (5, 2)
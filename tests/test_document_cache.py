@@ -0,0 +1,72 @@
+import pytest
+from google.api_core.exceptions import NotFound, NotModified
+from src.utils.document_cache import DocumentCache
+
+
+class _BucketFalso:
+    """Bucket en memoria: nombre -> (contenido, generación). Registra cada descarga."""
+
+    def __init__(self, objetos: dict):
+        self.objetos = objetos
+        self.descargas = []
+
+    def blob(self, nombre):
+        return _BlobFalso(self, nombre)
+
+
+class _BlobFalso:
+    def __init__(self, bucket, nombre):
+        self._bucket, self.name, self.generation = bucket, nombre, None
+
+    def download_as_bytes(self, if_generation_not_match=None):
+        self._bucket.descargas.append((self.name, if_generation_not_match))
+        if self.name not in self._bucket.objetos:
+            raise NotFound(self.name)
+        contenido, generacion = self._bucket.objetos[self.name]
+        if if_generation_not_match == generacion:
+            raise NotModified(self.name)
+        self.generation = generacion
+        return contenido.encode("utf-8")
+
+
+@pytest.fixture
+def bucket():
+    return _BucketFalso({"fuentes/vpn.md": ("Reinicia la VPN.", 1), "fuentes/correo.md": ("Revisa el spam.", 1)})
+
+
+def _cache(bucket, **kwargs) -> DocumentCache:
+    return DocumentCache("test_docs", lambda: bucket, **{"max_bytes": 1024, "revalidar_segundos": 300, **kwargs})
+
+
+def test_dentro_del_plazo_no_toca_gcs(bucket):
+    cache = _cache(bucket)
+    assert cache.obtener("fuentes/vpn.md") == "Reinicia la VPN."
+    assert cache.obtener("fuentes/vpn.md") == "Reinicia la VPN."
+    assert bucket.descargas == [("fuentes/vpn.md", None)]
+
+
+def test_revalidacion_condicional_por_generacion(bucket):
+    cache = _cache(bucket, revalidar_segundos=0)
+    cache.obtener("fuentes/vpn.md")
+    assert cache.obtener("fuentes/vpn.md") == "Reinicia la VPN."
+    assert bucket.descargas[-1] == ("fuentes/vpn.md", 1)
+
+    bucket.objetos["fuentes/vpn.md"] = ("Reinicia la VPN y el equipo.", 2)
+    assert cache.obtener("fuentes/vpn.md") == "Reinicia la VPN y el equipo."
+    assert cache.obtener("fuentes/vpn.md") == "Reinicia la VPN y el equipo."
+    assert bucket.descargas[-1] == ("fuentes/vpn.md", 2)
+
+
+def test_objeto_inexistente_se_recuerda(bucket):
+    cache = _cache(bucket)
+    assert cache.obtener("fuentes/no_existe.md") is None
+    assert cache.obtener("fuentes/no_existe.md") is None
+    assert len(bucket.descargas) == 1
+
+
+def test_se_desaloja_lo_menos_usado_al_pasar_max_bytes(bucket):
+    cache = _cache(bucket, max_bytes=len("Reinicia la VPN.") + len("Revisa el spam.") - 1)
+    cache.obtener("fuentes/vpn.md")
+    cache.obtener("fuentes/correo.md")
+    cache.obtener("fuentes/vpn.md")
+    assert [nombre for nombre, _ in bucket.descargas] == ["fuentes/vpn.md", "fuentes/correo.md", "fuentes/vpn.md"]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from src.utils import embedding_cache
+from src.utils.embedding_cache import obtener_embedding, clave_embedding
+
+
+@pytest.fixture
+def llamadas(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_BACKEND", "disk")
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIR", str(tmp_path))
+    embedding_cache._memoria.invalidar()
+    llamadas = []
+
+    def embedding(texto):
+        llamadas.append(texto)
+        return [float(len(texto)), 1.0, 0.5]
+
+    yield llamadas, embedding
+    embedding_cache._memoria.invalidar()
+
+
+def test_variantes_triviales_comparten_clave():
+    assert clave_embedding("¿Cómo reinicio la VPN?", "m") == clave_embedding("  ¿cómo REINICIO   la vpn ", "m")
+    assert clave_embedding("reinicio la VPN", "m") != clave_embedding("reinicio la VPN", "otro-modelo")
+
+
+def test_acierto_en_memoria_no_llama_a_la_api(llamadas):
+    llamadas, embedding = llamadas
+    primero = obtener_embedding("¿Cómo reinicio la VPN?", "m", embedding)
+    segundo = obtener_embedding("¿cómo reinicio la VPN", "m", embedding)
+    assert llamadas == ["¿Cómo reinicio la VPN?"]
+    assert np.array_equal(primero, segundo)
+    assert primero.dtype == np.float32 and not primero.flags.writeable
+
+
+def test_el_nivel_persistente_sobrevive_a_la_memoria(llamadas):
+    llamadas, embedding = llamadas
+    primero = obtener_embedding("reinicio la VPN", "m", embedding)
+    embedding_cache._memoria.invalidar()
+    assert np.array_equal(obtener_embedding("reinicio la VPN", "m", embedding), primero)
+    assert len(llamadas) == 1
+
+
+def test_un_fallo_del_nivel_persistente_no_impide_responder(llamadas, monkeypatch):
+    llamadas, embedding = llamadas
+    monkeypatch.setattr(embedding_cache, "_leer_persistente", lambda *args: 1 / 0)
+    monkeypatch.setattr(embedding_cache, "_escribir_persistente", lambda *args: 1 / 0)
+    assert obtener_embedding("reinicio la VPN", "m", embedding).shape == (3,)
+    assert obtener_embedding("reinicio la VPN", "m", embedding).shape == (3,)
+    assert len(llamadas) == 1
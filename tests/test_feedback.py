@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+import pytest
+import main
+from src.utils import bigquery_client
+from src.utils.storage_backend import SQLiteBackend, usar_backend
+
+
+@pytest.fixture
+def feedbacks(monkeypatch):
+    registrados = []
+    monkeypatch.setattr(main, "registrar_feedback", lambda *args: registrados.append(args))
+    monkeypatch.setattr(main, "set_session_state", lambda *args, **kwargs: registrados.append(("estado", args, kwargs)))
+    monkeypatch.setattr(main, "abrir_turno", lambda *args, **kwargs: pytest.fail("el clic no debe leer la sesión"))
+    return registrados
+
+
+def _clic(accion: str, parametros: dict, **evento) -> dict:
+    return {
+        "type": "CARD_CLICKED",
+        "user": {"name": "users/123", "email": "ana@connect.inc"},
+        "common": {"invokedFunction": accion, "parameters": parametros},
+        "message": {"name": "spaces/AAA/messages/BBB"},
+        **evento,
+    }
+
+
+def test_el_clic_lleva_la_sesion_y_el_mensaje(feedbacks):
+    respuesta = main.app.test_client().post("/", json=_clic("register_feedback_positive", {"session_id": "s1", "message_id": "00000007"}))
+    assert respuesta.status_code == 200
+    assert feedbacks == [("s1", "ana@connect.inc", 1, "00000007")]
+
+
+def test_valoracion_negativa_espera_comentario_de_esa_sesion(feedbacks):
+    main.app.test_client().post("/", json=_clic("register_feedback_negative", {"session_id": "s1", "message_id": "00000007"}))
+    assert feedbacks == [
+        ("s1", "ana@connect.inc", 0, "00000007"),
+        ("estado", ("users/123", "AWAITING_FEEDBACK_COMMENT"), {"feedback_session_id": "s1"}),
+    ]
+
+
+def test_tarjeta_anterior_sin_message_id_guarda_none(feedbacks, monkeypatch):
+    turnos = []
+    monkeypatch.setattr(main, "abrir_turno", lambda user_id, con_historial: turnos.append(con_historial) or SimpleNamespace(
+        session_id="s9", confirmar=lambda: None))
+    evento = _clic("register_feedback_positive", {})
+    del evento["common"]["parameters"]
+    main.app.test_client().post("/", json=evento)
+    assert turnos == [False]
+    assert feedbacks == [("s9", "ana@connect.inc", 1, None)]
+
+
+def test_las_valoraciones_se_escriben_en_lote_con_message_id():
+    backend = SQLiteBackend(":memory:")
+    usar_backend(backend)
+    try:
+        bigquery_client.registrar_feedback("s1", "ana@connect.inc", 1, "00000007")
+        bigquery_client.registrar_feedback("s2", "luis@connect.inc", 0)
+        assert bigquery_client.feedback_writer.flush() == 2
+        filas = backend.ejecutar_consulta("SELECT session_id, message_id, rating FROM nps_feedback ORDER BY session_id")
+        assert [(f["session_id"], f["message_id"], f["rating"]) for f in filas] == [("s1", "00000007", 1), ("s2", None, 0)]
+    finally:
+        usar_backend(None)
@@ -0,0 +1,28 @@
+import numpy as np
+from src.services import knowledge_service
+from src.utils.vector_index import IndiceVectorial, guardar_snapshot
+
+IDS = ["vpn.md", "correo.md", "accesos.md"]
+EMBEDDINGS = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.6, 0.8, 0.0]]
+
+
+def _usar_snapshot(monkeypatch, directorio):
+    guardar_snapshot(str(directorio), IDS, EMBEDDINGS)
+    monkeypatch.setattr(knowledge_service, "KB_SEARCH_BACKEND", "local")
+    monkeypatch.setattr(knowledge_service, "KB_VECTOR_INDEX_PATH", str(directorio))
+    monkeypatch.setattr(knowledge_service, "_indice_local", None)
+
+
+def test_buscar_sobre_un_snapshot(tmp_path):
+    guardar_snapshot(str(tmp_path), IDS, EMBEDDINGS)
+    indice = IndiceVectorial.cargar(str(tmp_path))
+    resultados = indice.buscar([2.0, 0.1, 0.0], k=2)
+    assert [doc for doc, _ in resultados] == ["vpn.md", "accesos.md"]
+    assert resultados[0][1] > resultados[1][1]
+
+
+def test_buscar_vecino_con_indice_local(monkeypatch, tmp_path):
+    _usar_snapshot(monkeypatch, tmp_path)
+    documento, similitud = knowledge_service._buscar_vecino([0.0, 3.0, 0.0])
+    assert documento == "correo.md"
+    assert np.isclose(similitud, 1.0)
@@ -0,0 +1,232 @@
+from types import SimpleNamespace
+import pytest
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import firestore
+from vertexai.generative_models import Content
+from src.services import memory_service
+from src.services.memory_service import (
+    TurnoMemoria, FORMATO_HISTORIAL, PREFIJO_RESUMEN,
+    _datos_padre, _leer_cola, _inicio_ventana, _construir_historial, actualizar_resumen_historial
+)
+from src.utils import metrics
+
+
+def _usuario(texto: str) -> dict:
+    return {"role": "user", "parts": [{"text": texto}]}
+
+
+def _modelo(texto: str) -> dict:
+    return {"role": "model", "parts": [{"text": texto}]}
+
+
+def _llamada(nombre: str) -> dict:
+    return {"role": "model", "parts": [{"function_call": {"name": nombre, "args": {"ticket_id": "DEX-1"}}}]}
+
+
+def _respuesta(nombre: str) -> dict:
+    return {"role": "user", "parts": [{"function_response": {"name": nombre, "response": {"estado": "Abierto"}}}]}
+
+
+class _Ref:
+    def __init__(self, db, path: str):
+        self._db, self.path = db, path
+
+    def collection(self, nombre: str):
+        return _Coleccion(self._db, f"{self.path}/{nombre}")
+
+    def get(self):
+        return SimpleNamespace(to_dict=lambda: self._db.documentos.get(self.path))
+
+    def set(self, datos: dict, merge: bool = False):
+        self._db.escrituras.append((self.path, datos, merge))
+
+
+class _Coleccion:
+    def __init__(self, db, path: str):
+        self._db, self.path = db, path
+
+    def document(self, id_documento: str):
+        return _Ref(self._db, f"{self.path}/{id_documento}")
+
+
+class _Lote:
+    def __init__(self, db):
+        self._db, self.operaciones = db, []
+
+    def create(self, ref, datos):
+        self.operaciones.append(("create", ref.path, datos))
+
+    def update(self, ref, datos, option=None):
+        self.operaciones.append(("update", ref.path, datos, option))
+
+    def set(self, ref, datos, merge=False):
+        self.operaciones.append(("set", ref.path, datos))
+
+    def commit(self):
+        self._db.lotes.append(self.operaciones)
+        if self._db.error is not None:
+            raise self._db.error
+
+
+class _FirestoreFalso:
+    """Registra los lotes y escrituras; `error` hace fallar el commit del lote."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.documentos, self.lotes, self.escrituras = {}, [], []
+
+    def collection(self, nombre: str):
+        return _Coleccion(self, nombre)
+
+    def batch(self):
+        return _Lote(self)
+
+
+@pytest.fixture(autouse=True)
+def limites(monkeypatch):
+    monkeypatch.setattr(memory_service, "HISTORY_RECENT_TURNS", 2)
+    monkeypatch.setattr(memory_service, "HISTORY_TOKEN_BUDGET", 6000)
+    monkeypatch.setattr(memory_service, "HISTORY_SUMMARY_MIN_PENDING", 4)
+    monkeypatch.setattr(memory_service, "HISTORY_TAIL_MESSAGES", 60)
+
+
+@pytest.fixture
+def sin_consultas(monkeypatch):
+    consultas = []
+    monkeypatch.setattr(memory_service, "_leer_mensajes", lambda ref, desde, hasta: consultas.append((desde, hasta)) or [])
+    return consultas
+
+
+def test_la_ventana_conserva_turnos_completos():
+    items = [_usuario("hola"), _modelo("hola"), _usuario("estado de DEX-1"), _llamada("consultar"),
+             _respuesta("consultar"), _modelo("Está abierto"), _usuario("gracias"), _modelo("de nada")]
+    assert _inicio_ventana(items) == 2
+
+
+def test_el_presupuesto_de_tokens_corta_al_inicio_de_un_turno(monkeypatch):
+    monkeypatch.setattr(memory_service, "HISTORY_TOKEN_BUDGET", 50)
+    items = [_usuario("a" * 400), _modelo("b" * 400), _usuario("c"), _modelo("d")]
+    assert _inicio_ventana(items) == 2
+
+
+def test_la_ventana_guardada_sigue_al_historial_completo(sin_consultas):
+    datos, todos = {}, []
+    for i in range(6):
+        nuevos = [_usuario(f"pregunta {i}"), _llamada("consultar"), _respuesta("consultar"), _modelo(f"respuesta {i}")]
+        datos = {**datos, **_datos_padre(datos, nuevos, "123")}
+        todos += nuevos
+        inicio = _inicio_ventana(todos)
+        assert _leer_cola(None, datos) == (todos[inicio:], inicio)
+    assert datos["total_mensajes"] == 24
+    assert sin_consultas == []
+
+
+def test_una_ventana_desfasada_consulta_la_subcoleccion(sin_consultas):
+    datos = {"formato": FORMATO_HISTORIAL, "total_mensajes": 10, "ventana": [_usuario("x")], "ventana_desde": 3}
+    assert _leer_cola(None, datos) == ([], 0)
+    assert sin_consultas == [(0, 10)]
+
+
+def test_la_cola_leida_repara_la_ventana_y_una_demasiado_grande_se_borra(monkeypatch):
+    datos = {"formato": FORMATO_HISTORIAL, "total_mensajes": 2, "ventana": [_usuario("x")], "ventana_desde": 0}
+    padre = _datos_padre(datos, [_usuario("y")], "123", cola=([_usuario("x"), _modelo("z")], 0))
+    assert (padre["ventana_desde"], len(padre["ventana"])) == (0, 3)
+
+    monkeypatch.setattr(memory_service, "HISTORY_TOKEN_BUDGET", 50)
+    padre = _datos_padre(datos, [_usuario("y" * 400)], "123", cola=([_usuario("x"), _modelo("z")], 0))
+    assert padre["ventana"] is padre["ventana_desde"] is firestore.DELETE_FIELD
+
+
+def test_el_historial_lleva_el_resumen_antes_de_la_ventana(monkeypatch):
+    programados = []
+    monkeypatch.setattr(memory_service, "_programar_resumen", programados.append)
+    datos = {"formato": FORMATO_HISTORIAL, "resumen": "Pidió acceso a BigQuery.", "resumen_hasta": 4, "tokens_totales": 500}
+    historial = _construir_historial("s1", datos, [_usuario("¿ya está?"), _modelo("Sí")], 4)
+    assert [contenido.role for contenido in historial] == ["user", "model", "user", "model"]
+    assert historial[0].parts[0].text.startswith(PREFIJO_RESUMEN)
+    assert programados == []
+
+    _construir_historial("s1", {**datos, "resumen_hasta": 0}, [_usuario("¿ya está?"), _modelo("Sí")], 4)
+    assert programados == ["s1"]
+
+
+def test_el_resumen_solo_escribe_sus_campos(monkeypatch, sin_consultas):
+    db = _FirestoreFalso()
+    db.documentos["chat_histories/s1"] = {
+        "formato": FORMATO_HISTORIAL, "total_mensajes": 6, "ventana_desde": 4,
+        "ventana": [_usuario("¿ya está?"), _modelo("Sí")],
+    }
+    monkeypatch.setattr(memory_service, "db", db)
+    modelo = SimpleNamespace(generate_content=lambda prompt: SimpleNamespace(text=" Pidió acceso a BigQuery. "))
+    monkeypatch.setattr(memory_service, "GenerativeModel", lambda nombre: modelo)
+    memory_service._resumenes_en_curso.add("s1")
+
+    actualizar_resumen_historial("s1")
+    assert db.escrituras == [("chat_histories/s1", {"resumen": "Pidió acceso a BigQuery.", "resumen_hasta": 4}, True)]
+    assert sin_consultas == [(0, 4)]
+    assert "s1" not in memory_service._resumenes_en_curso
+
+
+def _turno(datos_historial):
+    turno = TurnoMemoria("users/123", "s1", None, datos_historial, {})
+    turno.agregar_mensajes([Content.from_dict(_usuario("hola")), Content.from_dict(_modelo("¡Hola!"))])
+    return turno
+
+
+def test_confirmar_escribe_un_lote_sin_precondicion_sobre_el_padre(monkeypatch):
+    db = _FirestoreFalso()
+    monkeypatch.setattr(memory_service, "db", db)
+    turno = _turno({"formato": FORMATO_HISTORIAL, "total_mensajes": 2, "ventana": [_usuario("a"), _modelo("b")], "ventana_desde": 0})
+    turno.confirmar()
+
+    [operaciones] = db.lotes
+    assert [(op[0], op[1]) for op in operaciones] == [
+        ("create", "chat_histories/s1/mensajes/00000002"),
+        ("create", "chat_histories/s1/mensajes/00000003"),
+        ("update", "chat_histories/s1"),
+        ("set", "active_sessions/123"),
+    ]
+    padre, opcion = operaciones[2][2], operaciones[2][3]
+    assert opcion is None
+    assert (padre["total_mensajes"], padre["ventana_desde"], len(padre["ventana"])) == (4, 0, 4)
+    assert turno.id_ultimo_mensaje == "00000003"
+
+
+def test_confirmar_crea_el_historial_de_una_sesion_nueva(monkeypatch):
+    db = _FirestoreFalso()
+    monkeypatch.setattr(memory_service, "db", db)
+    _turno(None).confirmar()
+    assert db.lotes[0][2][:2] == ("create", "chat_histories/s1")
+
+
+def test_un_turno_concurrente_cae_a_la_transaccion(monkeypatch):
+    monkeypatch.setattr(memory_service, "db", _FirestoreFalso(error=AlreadyExists("00000002")))
+    transacciones = []
+    monkeypatch.setattr(memory_service, "_guardar_con_transaccion",
+                        lambda session_id, user_id, items, sesion: transacciones.append(len(items)) or 5)
+    conflictos = metrics.obtener_contador("firestore.conflictos_historial")
+    turno = _turno({"formato": FORMATO_HISTORIAL, "total_mensajes": 2})
+    turno.confirmar()
+    assert transacciones == [2]
+    assert turno.id_ultimo_mensaje == "00000006"
+    assert metrics.obtener_contador("firestore.conflictos_historial") == conflictos + 1
+
+
+def test_migrar_pasa_el_arreglo_a_documentos_por_seq(monkeypatch):
+    db = _FirestoreFalso()
+    db.documentos["chat_histories/s1"] = {"history": [_usuario("hola"), _modelo("¡Hola!"), _usuario("gracias")]}
+    monkeypatch.setattr(memory_service, "db", db)
+    assert memory_service.migrar_historial_sesion("s1") == 3
+
+    [operaciones] = db.lotes
+    assert [(op[1], op[2]["seq"]) for op in operaciones] == [
+        ("chat_histories/s1/mensajes/00000000", 0),
+        ("chat_histories/s1/mensajes/00000001", 1),
+        ("chat_histories/s1/mensajes/00000002", 2),
+    ]
+    [(ruta, padre, merge)] = db.escrituras
+    assert (ruta, padre["formato"], padre["total_mensajes"], merge) == ("chat_histories/s1", FORMATO_HISTORIAL, 3, True)
+    assert padre["history"] is firestore.DELETE_FIELD
+
+    db.documentos["chat_histories/s1"] = {"formato": FORMATO_HISTORIAL, "total_mensajes": 3}
+    assert memory_service.migrar_historial_sesion("s1") == 0
@@ -0,0 +1,94 @@
+import json
+import pytest
+from src.utils.outbox import Outbox, ErrorReintentable
+
+
+class _Destino:
+    """Función de envío que lanza ErrorReintentable las primeras `fallos` llamadas."""
+
+    def __init__(self, fallos: int = 0, error=None):
+        self.fallos = fallos
+        self.error = error
+        self.intentos = []
+        self.entregados = []
+
+    def __call__(self, mensaje):
+        self.intentos.append(mensaje)
+        if self.error is not None:
+            raise self.error
+        if self.fallos:
+            self.fallos -= 1
+            raise ErrorReintentable("429 Too Many Requests", reintentar_en=0)
+        self.entregados.append(mensaje)
+
+
+@pytest.fixture
+def ruta_spill(tmp_path):
+    return str(tmp_path / "outbox.jsonl")
+
+
+def _outbox(destino, ruta_spill, **kwargs) -> Outbox:
+    return Outbox("test", destino, backoff_base_segundos=0, ruta_spill=ruta_spill, **kwargs)
+
+
+def _spill(ruta_spill) -> list:
+    with open(ruta_spill, encoding="utf-8") as archivo:
+        return [json.loads(linea) for linea in archivo]
+
+
+def test_error_transitorio_se_reintenta_hasta_entregar(ruta_spill):
+    destino = _Destino(fallos=2)
+    outbox = _outbox(destino, ruta_spill, max_reintentos=3)
+    assert outbox.enviar_ahora({"id": 1}) is True
+    assert len(destino.intentos) == 3
+    assert destino.entregados == [{"id": 1}]
+
+
+def test_reintentos_agotados_van_al_spill_y_se_recuperan_al_iniciar(ruta_spill):
+    destino = _Destino(fallos=10)
+    outbox = _outbox(destino, ruta_spill, max_reintentos=2)
+    assert outbox.enviar_ahora({"id": 1}) is False
+    assert len(destino.intentos) == 3
+    assert _spill(ruta_spill) == [{"id": 1}]
+
+    destino_nuevo = _Destino()
+    siguiente = _outbox(destino_nuevo, ruta_spill)
+    siguiente.iniciar()
+    assert siguiente.esperar(5)
+    siguiente.cerrar()
+    assert destino_nuevo.entregados == [{"id": 1}]
+
+
+def test_iniciar_recupera_el_spill_una_sola_vez(ruta_spill):
+    outbox = _outbox(_Destino(), ruta_spill, workers=0)
+    outbox.iniciar()
+    _outbox(_Destino(fallos=10), ruta_spill, max_reintentos=0).enviar_ahora({"id": 2})
+    outbox.iniciar()
+    assert outbox.pendientes() == 0
+    assert _spill(ruta_spill) == [{"id": 2}]
+
+
+def test_error_no_recuperable_descarta_sin_spill(ruta_spill):
+    destino = _Destino(error=ValueError("400 Bad Request"))
+    outbox = _outbox(destino, ruta_spill)
+    assert outbox.enviar_ahora({"id": 1}) is False
+    assert len(destino.intentos) == 1
+    with pytest.raises(FileNotFoundError):
+        _spill(ruta_spill)
+
+
+def test_cola_llena_va_al_spill(ruta_spill):
+    outbox = _outbox(_Destino(), ruta_spill, workers=0, tamano_maximo=1)
+    assert outbox.encolar({"id": 1}) and outbox.encolar({"id": 2})
+    assert outbox.pendientes() == 1
+    assert _spill(ruta_spill) == [{"id": 2}]
+    outbox.cerrar(timeout_segundos=0)
+    assert _spill(ruta_spill) == [{"id": 2}, {"id": 1}]
+
+
+def test_en_cloud_run_se_exige_un_spill_en_gcs(monkeypatch):
+    from src.services import notification_service
+    monkeypatch.setenv("K_SERVICE", "dex-helpdesk")
+    monkeypatch.setattr(notification_service, "NOTIFICATION_SPILL_PATH", "notificaciones_pendientes.jsonl")
+    with pytest.raises(RuntimeError, match="gs://"):
+        notification_service.iniciar_outbox_notificaciones()
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from src.services import response_cache
+from src.services.response_cache import buscar_respuesta, guardar_respuesta, _despersonalizar
+
+
+@pytest.fixture(autouse=True)
+def cache_vacia(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_SIMILARITY", 0.95)
+    response_cache.invalidar_respuestas()
+    yield
+    response_cache.invalidar_respuestas()
+
+
+def _vector(*componentes):
+    return np.array(componentes, dtype=np.float32)
+
+
+def test_el_nombre_solo_se_reemplaza_como_palabra_completa():
+    respuesta = _despersonalizar("Hola Ana, Analiza el tiquete con Ana María.", "Ana")
+    assert respuesta == "Hola {{nombre_completo}}, Analiza el tiquete con {{nombre_completo}} María."
+    respuesta = _despersonalizar("Hola Ana, Analiza el reporte de Ana López.", "Ana López")
+    assert respuesta == "Hola {{primer_nombre}}, Analiza el reporte de {{nombre_completo}}."
+
+
+def test_pregunta_similar_del_mismo_rol_reutiliza_la_respuesta_personalizada():
+    guardar_respuesta(_vector(1, 0, 0), "usuario", "Ana López", "Hola Ana, reinicia la VPN.", 1200)
+    assert buscar_respuesta(_vector(0.99, 0.05, 0), "usuario", "Luis Pérez") == "Hola Luis, reinicia la VPN."
+
+
+def test_pregunta_poco_similar_no_reutiliza():
+    guardar_respuesta(_vector(1, 0, 0), "usuario", "Ana López", "Reinicia la VPN.", 1200)
+    assert buscar_respuesta(_vector(0.8, 0.6, 0), "usuario", "Luis Pérez") is None
+
+
+def test_las_respuestas_no_se_comparten_entre_roles():
+    guardar_respuesta(_vector(1, 0, 0), "admin", "Ana López", "Puedes reasignar el tiquete.", 1200)
+    assert buscar_respuesta(_vector(1, 0, 0), "usuario", "Luis Pérez") is None
+    assert buscar_respuesta(_vector(1, 0, 0), "admin", "Luis Pérez") == "Puedes reasignar el tiquete."
+
+
+def test_entradas_expiradas_no_se_devuelven(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_TTL_SECONDS", -1)
+    guardar_respuesta(_vector(1, 0, 0), "usuario", "Ana López", "Reinicia la VPN.", 1200)
+    assert buscar_respuesta(_vector(1, 0, 0), "usuario", "Luis Pérez") is None
@@ -0,0 +1,61 @@
+import json
+import pytest
+from src.services import result_summary
+from src.services.result_summary import resumir_resultado
+
+
+@pytest.fixture(autouse=True)
+def limites_pequenos(monkeypatch):
+    monkeypatch.setattr(result_summary, "METRICS_RESULT_PROMPT_ROWS", 5)
+    monkeypatch.setattr(result_summary, "METRICS_RESULT_PROMPT_CHARS", 600)
+
+
+def _filas(cantidad: int) -> list:
+    return [{"Departamento": f"Depto {i}", "Total": i, "Promedio": i / 2} for i in range(cantidad)]
+
+
+def test_sin_filas():
+    assert resumir_resultado([]) == "La consulta no arrojó resultados."
+
+
+def test_resultado_pequeno_se_devuelve_tal_cual():
+    filas = _filas(3)
+    assert json.loads(resumir_resultado(filas)) == filas
+
+
+def test_resultado_grande_se_resume_con_totales():
+    filas = _filas(40)
+    resumen = json.loads(resumir_resultado(filas))
+    assert resumen["columnas"] == ["Departamento", "Total", "Promedio"]
+    assert resumen["filas"][0] == ["Depto 0", 0, 0.0]
+    assert len(resumen["filas"]) + resumen["filas_omitidas"] == 40
+    assert resumen["totales"] == {"Total": sum(range(40)), "Promedio": sum(range(40)) / 2}
+    assert resumen["totales_parciales"] is False
+    assert "nota" not in resumen
+
+
+def test_muestra_se_reduce_hasta_caber():
+    filas = [{"Resumen": "x" * 150, "Total": i} for i in range(20)]
+    texto = resumir_resultado(filas)
+    resumen = json.loads(texto)
+    assert len(texto) <= result_summary.METRICS_RESULT_PROMPT_CHARS
+    assert 1 <= len(resumen["filas"]) < 5
+    assert resumen["filas_omitidas"] == 20 - len(resumen["filas"])
+
+
+def test_filas_omitidas_por_el_limite():
+    filas = _filas(3)
+    resumen = json.loads(resumir_resultado(filas, total_filas=10, limite=10))
+    assert resumen["total_filas"] == 10
+    assert resumen["filas_omitidas"] == 7
+    assert resumen["totales_parciales"] is True
+    assert "10 filas" in resumen["nota"]
+
+
+def test_solo_suma_columnas_numericas():
+    filas = [
+        {"Activo": True, "Codigo": "A1", "Horas": None},
+        {"Activo": False, "Codigo": 7, "Horas": 2.5},
+    ]
+    resumen = json.loads(resumir_resultado(filas, total_filas=5))
+    assert resumen["totales"] == {"Horas": 2.5}
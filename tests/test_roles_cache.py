@@ -0,0 +1,58 @@
+import pytest
+from src.utils import bigquery_client
+from src.utils.bigquery_client import obtener_rol_usuario, precargar_roles, invalidar_cache_roles
+from src.utils.storage_backend import SQLiteBackend, ROLES_TABLE_NAME, usar_backend
+
+
+@pytest.fixture
+def consultas(monkeypatch):
+    backend = SQLiteBackend(":memory:")
+    backend.insertar_filas(ROLES_TABLE_NAME, [{"user_email": "ana@connect.inc", "role": "admin", "department": "Data"}])
+    consultas = []
+    obtener_rol = backend.obtener_rol
+    monkeypatch.setattr(backend, "obtener_rol", lambda email: consultas.append(email) or obtener_rol(email))
+    usar_backend(backend)
+    invalidar_cache_roles()
+    yield consultas
+    invalidar_cache_roles()
+    usar_backend(None)
+
+
+def test_el_rol_se_consulta_una_sola_vez(consultas):
+    assert obtener_rol_usuario("ana@connect.inc") == ("admin", "Data")
+    assert obtener_rol_usuario("ana@connect.inc") == ("admin", "Data")
+    assert consultas == ["ana@connect.inc"]
+
+
+def test_usuario_desconocido_se_cachea_con_el_ttl_negativo(consultas, monkeypatch):
+    assert obtener_rol_usuario("nuevo@connect.inc") == ("user", None)
+    assert obtener_rol_usuario("nuevo@connect.inc") == ("user", None)
+    assert consultas == ["nuevo@connect.inc"]
+
+    monkeypatch.setattr(bigquery_client, "ROLES_NEGATIVE_CACHE_TTL_SECONDS", -1)
+    invalidar_cache_roles("nuevo@connect.inc")
+    obtener_rol_usuario("nuevo@connect.inc")
+    obtener_rol_usuario("nuevo@connect.inc")
+    assert consultas == ["nuevo@connect.inc"] * 3
+
+
+def test_con_la_precarga_vigente_no_se_consulta_la_base(consultas):
+    assert precargar_roles() == 1
+    assert obtener_rol_usuario("ana@connect.inc") == ("admin", "Data")
+    assert obtener_rol_usuario("nuevo@connect.inc") == ("user", None)
+    assert consultas == []
+
+
+def test_invalidar_obliga_a_releer(consultas):
+    obtener_rol_usuario("ana@connect.inc")
+    invalidar_cache_roles("ana@connect.inc")
+    obtener_rol_usuario("ana@connect.inc")
+    assert consultas == ["ana@connect.inc"] * 2
+
+
+def test_un_error_no_queda_en_cache(consultas, monkeypatch):
+    backend = bigquery_client.obtener_backend()
+    monkeypatch.setattr(backend, "obtener_rol", lambda email: consultas.append(email) or 1 / 0)
+    assert obtener_rol_usuario("ana@connect.inc") == ("user", None)
+    assert obtener_rol_usuario("ana@connect.inc") == ("user", None)
+    assert len(consultas) == 2
@@ -0,0 +1,50 @@
+import pytest
+from src.services import sentiment_service
+from src.services.sentiment_service import analizar_sentimiento, clasificar_local
+
+
+@pytest.fixture
+def llamadas_llm(monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(sentiment_service, "clasificar_con_llm", lambda mensaje: llamadas.append(mensaje) or "negativo")
+    monkeypatch.setattr(sentiment_service, "SENTIMENT_MODE", "hybrid")
+    monkeypatch.setattr(sentiment_service, "SENTIMENT_CONFIDENCE_THRESHOLD", 0.5)
+    sentiment_service._cache_sentimientos.invalidar()
+    yield llamadas
+    sentiment_service._cache_sentimientos.invalidar()
+
+
+@pytest.mark.parametrize("mensaje, sentimiento", [
+    ("¡Gracias, excelente servicio!", "positivo"),
+    ("Estoy muy frustrado, la VPN está caída otra vez!!", "negativo"),
+    ("¿Cuál es el estado del tiquete DEX-20250826-1FA8?", "neutro"),
+    ("esto es inaceptable 😡", "negativo"),
+    ("no está mal 🙂", "positivo"),
+])
+def test_mensajes_claros_se_clasifican_con_confianza(mensaje, sentimiento):
+    resultado, confianza = clasificar_local(mensaje)
+    assert resultado == sentimiento
+    assert confianza >= 0.5
+
+
+@pytest.mark.parametrize("mensaje", ["gracias pero sigue el error", "No funciona", "Todo bien"])
+def test_mensajes_ambiguos_tienen_confianza_baja(mensaje):
+    _, confianza = clasificar_local(mensaje)
+    assert confianza < 0.5
+
+
+def test_sobre_el_umbral_no_se_llama_al_llm(llamadas_llm):
+    assert analizar_sentimiento("¡Gracias, excelente servicio!") == "positivo"
+    assert llamadas_llm == []
+
+
+def test_bajo_el_umbral_se_recurre_al_llm_una_vez(llamadas_llm):
+    assert analizar_sentimiento("gracias pero sigue el error") == "negativo"
+    assert analizar_sentimiento("Gracias pero  sigue el ERROR") == "negativo"
+    assert llamadas_llm == ["gracias pero sigue el error"]
+
+
+def test_modo_local_nunca_llama_al_llm(llamadas_llm, monkeypatch):
+    monkeypatch.setattr(sentiment_service, "SENTIMENT_MODE", "local")
+    assert analizar_sentimiento("gracias pero sigue el error") == "positivo"
+    assert llamadas_llm == []
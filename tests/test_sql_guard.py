@@ -0,0 +1,127 @@
+import pytest
+from src.services.sql_guard import ConsultaNoPermitida, aplicar_limite, validar_sql
+from src.utils.bigquery_client import TICKETS_TABLE_ID, EVENTOS_TABLE_ID
+
+PROYECTO, DATASET, TICKETS = TICKETS_TABLE_ID.split(".")
+EVENTOS = EVENTOS_TABLE_ID.split(".")[2]
+
+
+def test_acepta_select_sobre_tablas_permitidas():
+    sql = f"SELECT COUNT(*) FROM `{EVENTOS_TABLE_ID}` WHERE TipoEvento = 'CREADO'"
+    assert validar_sql(sql, {}) == set()
+
+
+def test_devuelve_parametros_usados():
+    sql = f"SELECT * FROM `{EVENTOS_TABLE_ID}` WHERE FechaEvento >= @fecha_inicio AND FechaEvento < @fecha_fin"
+    assert validar_sql(sql, {"fecha_inicio", "fecha_fin", "departamento"}) == {"fecha_inicio", "fecha_fin"}
+
+
+def test_rechaza_parametros_no_disponibles():
+    sql = f"SELECT * FROM `{EVENTOS_TABLE_ID}` WHERE Autor = @responsable"
+    with pytest.raises(ConsultaNoPermitida, match="responsable"):
+        validar_sql(sql, {"fecha_inicio"})
+
+
+@pytest.mark.parametrize("sql", [
+    f"DELETE FROM `{EVENTOS_TABLE_ID}` WHERE TRUE",
+    f"SELECT 1; DROP TABLE `{EVENTOS_TABLE_ID}`",
+    f"WITH x AS (SELECT 1) INSERT INTO `{EVENTOS_TABLE_ID}` SELECT * FROM x",
+])
+def test_rechaza_escrituras_y_varias_sentencias(sql):
+    with pytest.raises(ConsultaNoPermitida):
+        validar_sql(sql, {})
+
+
+def test_extract_from_no_es_una_tabla():
+    sql = (
+        f"SELECT EXTRACT(MONTH FROM t.FechaCreacion) AS mes, COUNT(*) AS total "
+        f"FROM `{TICKETS_TABLE_ID}` t GROUP BY mes"
+    )
+    assert validar_sql(sql, {}) == set()
+
+
+@pytest.mark.parametrize("referencia", [
+    f"`{PROYECTO}`.`{DATASET}`.`{TICKETS}`",
+    f"{PROYECTO}.{DATASET}.{TICKETS}",
+    f"`{PROYECTO}.{DATASET}.{TICKETS}`",
+    f"{DATASET}.{TICKETS}",
+])
+def test_normaliza_nombres_de_varias_partes(referencia):
+    assert validar_sql(f"SELECT COUNT(*) FROM {referencia} t", {}) == set()
+
+
+def test_subconsultas_ctes_y_unnest():
+    sql = f"""
+        WITH Cierres AS (
+            SELECT TicketID, MAX(FechaEvento) AS fecha_cierre FROM `{EVENTOS_TABLE_ID}`
+            WHERE TipoEvento = 'CERRADO' GROUP BY TicketID
+        )
+        SELECT t.TicketID, ARRAY(SELECT AS STRUCT e.TipoEvento FROM `{EVENTOS_TABLE_ID}` e WHERE e.TicketID = t.TicketID) AS eventos
+        FROM `{TICKETS_TABLE_ID}` t
+        JOIN Cierres c ON c.TicketID = t.TicketID
+        CROSS JOIN UNNEST([1, 2]) AS n
+    """
+    assert validar_sql(sql, {}) == set()
+
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT * FROM `{PROYECTO}.{DATASET}.roles_usuarios`",
+    f"SELECT * FROM `{TICKETS_TABLE_ID}` t JOIN `otro-proyecto`.`{DATASET}`.`{TICKETS}` o USING (TicketID)",
+    f"SELECT * FROM `{TICKETS_TABLE_ID}` t, `otro-proyecto.{DATASET}.{TICKETS}` o",
+    f"SELECT * FROM `{TICKETS_TABLE_ID}` WHERE TicketID IN (SELECT TicketID FROM {DATASET}.nps_feedback)",
+    "SELECT * FROM INFORMATION_SCHEMA.TABLES",
+])
+def test_rechaza_otras_tablas(sql):
+    with pytest.raises(ConsultaNoPermitida, match="tablas no permitidas"):
+        validar_sql(sql, {})
+
+
+def test_ignora_from_en_literales_y_comentarios():
+    sql = f"SELECT 'from otra.tabla.x' AS texto FROM `{TICKETS_TABLE_ID}` -- join `otro.dataset.tabla`"
+    assert validar_sql(sql, {}) == set()
+
+
+class _BackendDryRun:
+    def __init__(self, tablas, bytes_estimados=1000):
+        self.analisis = {"tablas": set(tablas), "bytes": bytes_estimados}
+
+    def analizar_consulta(self, sql, parametros=None):
+        return self.analisis
+
+
+def test_dry_run_confirma_las_tablas(monkeypatch):
+    from src.services import sql_guard
+    monkeypatch.setattr(sql_guard, "obtener_backend", lambda: _BackendDryRun({TICKETS_TABLE_ID, EVENTOS_TABLE_ID}))
+    assert sql_guard.verificar_costo("SELECT 1", {}) == 1000
+
+    # Una vista o un alias que el texto no delata: manda lo que resolvió BigQuery.
+    monkeypatch.setattr(sql_guard, "obtener_backend", lambda: _BackendDryRun({f"{PROYECTO}.{DATASET}.roles_usuarios"}))
+    with pytest.raises(ConsultaNoPermitida, match="roles_usuarios"):
+        sql_guard.verificar_costo("SELECT 1", {})
+
+
+def test_dry_run_rechaza_consultas_costosas(monkeypatch):
+    from src.services import sql_guard
+    monkeypatch.setattr(sql_guard, "obtener_backend", lambda: _BackendDryRun({TICKETS_TABLE_ID}, 5_000))
+    with pytest.raises(sql_guard.ConsultaDemasiadoCostosa):
+        sql_guard.verificar_costo("SELECT 1", {}, limite=1_000)
+
+
+def test_aplicar_limite_agrega_limit_y_quita_punto_y_coma():
+    sql = f"SELECT * FROM `{EVENTOS_TABLE_ID}`;  "
+    assert aplicar_limite(sql, 100) == f"SELECT * FROM `{EVENTOS_TABLE_ID}`\nLIMIT 100"
+
+
+def test_aplicar_limite_respeta_un_limit_menor():
+    sql = f"SELECT * FROM `{EVENTOS_TABLE_ID}` LIMIT 10"
+    assert aplicar_limite(sql, 100) == sql
+
+
+def test_aplicar_limite_reduce_un_limit_mayor_y_conserva_offset():
+    sql = f"SELECT * FROM `{EVENTOS_TABLE_ID}` ORDER BY FechaEvento limit 5000 OFFSET 20"
+    assert aplicar_limite(sql, 100) == f"SELECT * FROM `{EVENTOS_TABLE_ID}` ORDER BY FechaEvento LIMIT 100 OFFSET 20"
+
+
+def test_aplicar_limite_ignora_limit_de_subconsultas():
+    sql = f"SELECT * FROM (SELECT * FROM `{EVENTOS_TABLE_ID}` LIMIT 5000) AS e WHERE e.TipoEvento = 'CREADO'"
+    assert aplicar_limite(sql, 100) == f"{sql}\nLIMIT 100"
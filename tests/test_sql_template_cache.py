@@ -0,0 +1,57 @@
+from datetime import datetime
+import pytest
+from src.services import sql_template_cache
+from src.services.sql_template_cache import extraer_parametros
+
+AHORA = datetime(2025, 8, 26, 15, 30)
+
+
+@pytest.fixture(autouse=True)
+def departamentos(monkeypatch):
+    monkeypatch.setattr(sql_template_cache, "listar_departamentos", lambda: ["Data", "Data Analytics", "Finanzas"])
+
+
+def test_preguntas_que_solo_difieren_en_parametros_comparten_forma():
+    forma_a, parametros_a = extraer_parametros("¿Cuántos tiquetes se cerraron en marzo del equipo de Finanzas?", AHORA)
+    forma_b, parametros_b = extraer_parametros("cuantos tiquetes se cerraron en julio del equipo de Data", AHORA)
+    assert forma_a == forma_b == "cuantos tiquetes se cerraron param_fechas param_equipo"
+    assert parametros_a == {"fecha_inicio": datetime(2025, 3, 1), "fecha_fin": datetime(2025, 4, 1), "departamento": "Finanzas"}
+    assert parametros_b["departamento"] == "Data"
+
+
+def test_mes_sin_anio_toma_la_ultima_ocurrencia():
+    _, parametros = extraer_parametros("tiquetes creados en diciembre", AHORA)
+    assert (parametros["fecha_inicio"], parametros["fecha_fin"]) == (datetime(2024, 12, 1), datetime(2025, 1, 1))
+
+
+def test_rango_iso_incluye_el_ultimo_dia():
+    _, parametros = extraer_parametros("tiempo de resolución de Finanzas entre 2025-01-01 y 2025-01-31", AHORA)
+    assert (parametros["fecha_inicio"], parametros["fecha_fin"]) == (datetime(2025, 1, 1), datetime(2025, 2, 1))
+
+
+@pytest.mark.parametrize("expresion, inicio, fin", [
+    ("hoy", datetime(2025, 8, 26), datetime(2025, 8, 27)),
+    ("la semana pasada", datetime(2025, 8, 18), datetime(2025, 8, 25)),
+    ("el mes pasado", datetime(2025, 7, 1), datetime(2025, 8, 1)),
+    ("los últimos 3 días", datetime(2025, 8, 23, 15, 30), AHORA),
+])
+def test_fechas_relativas(expresion, inicio, fin):
+    forma, parametros = extraer_parametros(f"tiquetes cerrados {expresion}", AHORA)
+    assert forma == "tiquetes cerrados param_fechas"
+    assert (parametros["fecha_inicio"], parametros["fecha_fin"]) == (inicio, fin)
+
+
+def test_departamento_mas_largo_tiene_prioridad():
+    forma, parametros = extraer_parametros("Tiempo de resolución de Data Analytics en los últimos 3 meses", AHORA)
+    assert forma == "tiempo de resolucion param_equipo param_fechas"
+    assert parametros["departamento"] == "Data Analytics"
+
+
+def test_correo_del_responsable():
+    forma, parametros = extraer_parametros("Cuántos tiquetes cerró ana@connect.inc este mes", AHORA)
+    assert forma == "cuantos tiquetes cerro param_responsable param_fechas"
+    assert parametros["responsable"] == "ana@connect.inc"
+
+
+def test_pregunta_sin_parametros():
+    assert extraer_parametros("Cuántos tiquetes hay abiertos", AHORA) == ("cuantos tiquetes hay abiertos", {})
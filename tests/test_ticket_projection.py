@@ -0,0 +1,94 @@
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from src.utils.bigquery_client import _escribir_eventos, cargar_snapshot_tiquete, obtener_estado_tiquete
+from src.tasks.rebuild_ticket_state import reconstruir_ticket_state
+from src.utils.storage_backend import SQLiteBackend, TICKETS_TABLE_NAME, usar_backend
+
+INICIO = datetime(2025, 8, 26, 9, 0, tzinfo=timezone.utc)
+TICKET = "DEX-20250826-1FA8"
+
+
+@pytest.fixture
+def backend():
+    backend = SQLiteBackend(":memory:")
+    usar_backend(backend)
+    backend.insertar_filas(TICKETS_TABLE_NAME, [{
+        "TicketID": TICKET, "Solicitante": "ana@connect.inc", "FechaCreacion": INICIO,
+        "SLA_Horas": 8, "FechaVencimiento": INICIO + timedelta(hours=8),
+    }])
+    yield backend
+    usar_backend(None)
+
+
+def _evento(evento_id: str, tipo: str, horas: float, detalles: dict) -> dict:
+    return {
+        "EventoID": evento_id, "TicketID": TICKET, "FechaEvento": INICIO + timedelta(hours=horas),
+        "Autor": "ana@connect.inc", "TipoEvento": tipo, "Detalles": json.dumps(detalles),
+    }
+
+
+CREADO = _evento("e1", "CREADO", 0, {"equipo_asignado": "Data", "prioridad_asignada": "alta", "responsable_inicial": "luis@connect.inc"})
+REASIGNADO = _evento("e2", "REASIGNADO", 1, {"nuevo_responsable": "eva@connect.inc"})
+CERRADO = _evento("e3", "CERRADO", 2, {"resolucion": "Listo"})
+
+
+def test_cada_flush_actualiza_ticket_state(backend):
+    _escribir_eventos([CREADO])
+    _escribir_eventos([REASIGNADO])
+    [estado] = backend.obtener_estados_tiquetes([TICKET])
+    assert estado["Responsable"] == "eva@connect.inc"
+    assert estado["UltimoEvento"] == "REASIGNADO"
+
+
+def test_un_estado_anterior_no_pisa_uno_mas_reciente(backend):
+    _escribir_eventos([CREADO, CERRADO])
+    backend.aplicar_proyecciones([{"TicketID": TICKET, "Estado": "Abierto", "FechaUltimoEvento": INICIO}])
+    assert backend.obtener_estados_tiquetes([TICKET])[0]["Estado"] == "Cerrado"
+
+
+def test_snapshot_lee_la_proyeccion(backend):
+    _escribir_eventos([CREADO, REASIGNADO])
+    snapshot = cargar_snapshot_tiquete(TICKET)
+    assert snapshot.existe and snapshot.estado == "Abierto"
+    assert snapshot.responsable == "eva@connect.inc"
+    assert snapshot.detalles_ultimo_evento == {"nuevo_responsable": "eva@connect.inc"}
+
+
+def test_tiquete_fuera_de_la_proyeccion_se_lee_del_log(backend):
+    backend.insertar_eventos([CREADO, CERRADO])
+    assert backend.obtener_estados_tiquetes([TICKET]) == []
+    assert obtener_estado_tiquete(TICKET)["Estado"] == "Cerrado"
+    assert cargar_snapshot_tiquete(TICKET).ultimo_evento == "CERRADO"
+
+
+def test_snapshot_con_error_de_almacenamiento(backend, monkeypatch):
+    def fallar(ticket_id):
+        raise RuntimeError("BigQuery no disponible")
+    monkeypatch.setattr(backend, "obtener_snapshot_tiquete", fallar)
+    snapshot = cargar_snapshot_tiquete(TICKET.lower())
+    assert (snapshot.ticket_id, snapshot.existe) == (TICKET, False)
+
+
+def test_fallo_de_proyeccion_no_reintenta_el_lote(backend, monkeypatch):
+    def fallar(estados):
+        raise RuntimeError("MERGE rechazado")
+    monkeypatch.setattr(backend, "aplicar_proyecciones", fallar)
+    _escribir_eventos([CREADO])
+    assert len(backend.listar_eventos_historicos([TICKET])) == 1
+    assert obtener_estado_tiquete(TICKET)["Estado"] == "Abierto"
+
+
+
+def _cubo(backend) -> dict:
+    return {fila["Responsable"]: (fila["Abiertos"], fila["Cerrados"], fila["MinutosResolucion"])
+            for fila in backend.consultar_metricas_diarias(["Responsable"])}
+
+
+def test_cada_flush_suma_su_aporte_al_cubo(backend):
+    _escribir_eventos([CREADO])
+    assert _cubo(backend) == {"luis@connect.inc": (1, 0, 0)}
+    _escribir_eventos([REASIGNADO, CERRADO])
+    assert _cubo(backend) == {"luis@connect.inc": (1, 0, 0), "eva@connect.inc": (0, 1, 120)}
+    reconstruir_ticket_state()
+    assert _cubo(backend) == {"luis@connect.inc": (1, 0, 0), "eva@connect.inc": (0, 1, 120)}
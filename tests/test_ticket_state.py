@@ -0,0 +1,76 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+from src.utils.ticket_state import ESTADO_ABIERTO, ESTADO_CERRADO, aplicar_evento, filas_cubo, proyectar_eventos
+
+INICIO = datetime(2025, 8, 26, 9, 0, tzinfo=timezone.utc)
+TICKET = "DEX-20250826-1FA8"
+
+
+def _evento(tipo: str, horas: float, detalles: dict, ticket_id: str = TICKET) -> dict:
+    return {
+        "TicketID": ticket_id, "TipoEvento": tipo, "Autor": "ana@connect.inc",
+        "FechaEvento": INICIO + timedelta(hours=horas), "Detalles": json.dumps(detalles),
+    }
+
+
+def _creado(ticket_id: str = TICKET, sla_horas: int = 8) -> dict:
+    return _evento("CREADO", 0, {
+        "equipo_asignado": "Data", "prioridad_asignada": "alta",
+        "responsable_inicial": "luis@connect.inc", "sla_calculado_horas": sla_horas,
+    }, ticket_id)
+
+
+def test_creado_abre_el_tiquete_y_calcula_vencimiento():
+    estado = aplicar_evento(None, _creado())
+    assert estado["Estado"] == ESTADO_ABIERTO
+    assert estado["Departamento"] == "Data"
+    assert estado["Responsable"] == "luis@connect.inc"
+    assert estado["Solicitante"] == "ana@connect.inc"
+    assert estado["FechaVencimiento"] == INICIO + timedelta(hours=8)
+    assert estado["UltimoEvento"] == "CREADO"
+
+
+def test_reasignar_sla_y_cerrar():
+    estados = proyectar_eventos({}, [
+        _creado(),
+        _evento("REASIGNADO", 1, {"nuevo_responsable": "eva@connect.inc"}),
+        _evento("SLA_MODIFICADO", 2, {"nuevo_sla_horas": 24}),
+        _evento("CERRADO", 3, {}),
+    ])
+    estado = estados[TICKET]
+    assert estado["Estado"] == ESTADO_CERRADO
+    assert estado["Responsable"] == "eva@connect.inc"
+    assert estado["SLA_Horas"] == 24
+    assert estado["FechaVencimiento"] == INICIO + timedelta(hours=24)
+    assert estado["FechaUltimoEvento"] == INICIO + timedelta(hours=3)
+
+
+def test_evento_tardio_no_reemplaza_el_ultimo():
+    estado = aplicar_evento(None, _creado())
+    estado = aplicar_evento(estado, _evento("CERRADO", 5, {}))
+    estado = aplicar_evento(estado, _evento("REASIGNADO", 2, {"nuevo_responsable": "eva@connect.inc"}))
+    assert estado["Estado"] == ESTADO_CERRADO
+    assert estado["UltimoEvento"] == "CERRADO"
+    assert estado["Responsable"] == "luis@connect.inc"
+
+
+def test_proyectar_ordena_los_eventos_por_fecha():
+    eventos = [_evento("CERRADO", 3, {}), _creado()]
+    assert proyectar_eventos({}, eventos)[TICKET]["Estado"] == ESTADO_CERRADO
+
+
+def test_cubo_cuenta_abiertos_cerrados_y_vencidos():
+    otro = "DEX-20250826-2BB0"
+    cubo = {}
+    proyectar_eventos({}, [
+        _creado(),
+        _creado(otro, sla_horas=1),
+        _evento("REASIGNADO", 1, {"nuevo_responsable": "eva@connect.inc"}, otro),
+        _evento("CERRADO", 2, {}, otro),
+    ], cubo)
+    filas = {fila["Responsable"]: fila for fila in filas_cubo(cubo)}
+    assert filas["luis@connect.inc"]["Abiertos"] == 2
+    assert filas["luis@connect.inc"]["Fecha"] == date(2025, 8, 26)
+    cerrado = filas["eva@connect.inc"]
+    assert (cerrado["Abiertos"], cerrado["Cerrados"], cerrado["CerradosVencidos"]) == (0, 1, 1)
+    assert cerrado["MinutosResolucion"] == 120
@@ -0,0 +1,62 @@
+import json
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from types import SimpleNamespace
+import pytest
+from src.services import ticket_visualizer
+from src.services.ticket_visualizer import clave_linea_tiempo, obtener_url_linea_tiempo
+
+EVENTOS = [
+    {"TipoEvento": "CREADO", "FechaEvento": "2025-08-26T10:00:00", "Detalles": None, "Autor": "ana@connect.inc"},
+    {"TipoEvento": "CERRADO", "FechaEvento": "2025-08-26T12:00:00", "Detalles": "Resuelto", "Autor": "luis@connect.inc"},
+]
+
+
+@pytest.fixture
+def subidas(monkeypatch):
+    nombres = []
+
+    def subir(nombre_blob, generar):
+        nombres.append(nombre_blob)
+        generar()
+        return f"https://storage.googleapis.com/bucket/{nombre_blob}"
+
+    monkeypatch.setattr(ticket_visualizer, "_subir_si_no_existe", subir)
+    ticket_visualizer._urls_conocidas.invalidar()
+    yield nombres
+    ticket_visualizer._urls_conocidas.invalidar()
+
+
+def test_la_clave_depende_del_tiquete_los_eventos_y_la_version():
+    clave = clave_linea_tiempo("TICKET-1", EVENTOS, "v1")
+    assert clave == clave_linea_tiempo("TICKET-1", [dict(e) for e in EVENTOS], "v1")
+    assert clave != clave_linea_tiempo("TICKET-2", EVENTOS, "v1")
+    assert clave != clave_linea_tiempo("TICKET-1", EVENTOS, "v2")
+    assert clave != clave_linea_tiempo("TICKET-1", EVENTOS[:1], "v1")
+
+
+def test_tiquetes_con_los_mismos_eventos_no_comparten_imagen(subidas):
+    url_a = obtener_url_linea_tiempo("TICKET-1", EVENTOS, lambda: b"png", "v1")
+    url_b = obtener_url_linea_tiempo("TICKET-2", EVENTOS, lambda: b"png", "v1")
+    assert url_a != url_b
+    assert [nombre.split("_")[0] for nombre in subidas] == ["flujos/TICKET-1", "flujos/TICKET-2"]
+
+
+def test_la_url_conocida_no_vuelve_a_generar(subidas):
+    generaciones = []
+    generar = lambda: generaciones.append(1) or b"png"
+    primera = obtener_url_linea_tiempo("TICKET-1", EVENTOS, generar, "v1")
+    assert obtener_url_linea_tiempo("TICKET-1", EVENTOS, generar, "v1") == primera
+    assert len(generaciones) == len(subidas) == 1
+
+
+def test_un_render_que_supera_el_plazo_devuelve_un_error_claro(monkeypatch):
+    def agotar_plazo(*args):
+        raise FuturesTimeoutError()
+
+    monkeypatch.setattr(ticket_visualizer, "GCS_BUCKET_NAME", "bucket")
+    monkeypatch.setattr(ticket_visualizer, "validar_tiquete", lambda ticket_id: (ticket_id, True))
+    monkeypatch.setattr(ticket_visualizer, "flush_eventos", lambda ticket_id: None)
+    monkeypatch.setattr(ticket_visualizer, "obtener_backend", lambda: SimpleNamespace(listar_eventos=lambda ticket_id: EVENTOS))
+    monkeypatch.setattr(ticket_visualizer, "obtener_url_linea_tiempo", agotar_plazo)
+    respuesta = json.loads(ticket_visualizer.visualizar_flujo_tiquete("ticket-1"))
+    assert "tardó demasiado" in respuesta["error"]
@@ -0,0 +1,80 @@
+import json
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from io import BytesIO
+from PIL import Image
+import pytest
+from src.services import timeline_renderer
+from src.services.timeline_renderer import preparar_hitos, renderizar_linea_tiempo
+from src.utils import metrics
+
+
+def _evento(tipo: str, hora: int, detalles: dict = None) -> dict:
+    return {
+        "TipoEvento": tipo, "FechaEvento": datetime(2025, 8, 26, hora, 0, tzinfo=timezone.utc),
+        "Detalles": json.dumps(detalles) if detalles else None, "Autor": "ana@connect.inc",
+    }
+
+
+EVENTOS = [
+    _evento("CREADO", 9, {"prioridad_asignada": "alta"}),
+    _evento("REASIGNADO", 10, {"nuevo_responsable": "luis@connect.inc"}),
+    _evento("EN_PROGRESO", 11),
+]
+
+
+class _PoolFalso:
+    """Pool cuyo `submit` devuelve un Future que nunca termina o que falla con `error`."""
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def submit(self, funcion, *args):
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_hitos_con_detalle_y_estado_actual():
+    hitos = preparar_hitos(EVENTOS)
+    assert [(h["tipo"], h["detalle"], h["actual"]) for h in hitos] == [
+        ("Creado", "Prioridad alta", False),
+        ("Reasignado", "Asignado a luis@connect.inc", False),
+        ("En Progreso", "", True),
+    ]
+    assert json.loads(json.dumps(hitos)) == hitos
+
+
+def test_un_tiquete_cerrado_no_tiene_estado_actual():
+    hitos = preparar_hitos(EVENTOS + [_evento("CERRADO", 12, {"resolucion": "Listo"})])
+    assert not any(h["actual"] for h in hitos)
+
+
+@pytest.mark.parametrize("cantidad", [1, 3, 12])
+def test_el_dibujo_es_un_png_determinista(cantidad):
+    eventos = (EVENTOS * 4)[:cantidad]
+    png = renderizar_linea_tiempo("DEX-20250826-1FA8", eventos)
+    assert Image.open(BytesIO(png)).size == (timeline_renderer.ANCHO, timeline_renderer.ALTO)
+    assert renderizar_linea_tiempo("DEX-20250826-1FA8", eventos) == png
+
+
+def test_un_dibujo_lento_propaga_el_timeout(monkeypatch):
+    monkeypatch.setattr(timeline_renderer, "TIMELINE_RENDER_WORKERS", 1)
+    monkeypatch.setattr(timeline_renderer, "TIMELINE_RENDER_TIMEOUT_SECONDS", 0.01)
+    monkeypatch.setattr(timeline_renderer, "_obtener_pool", lambda: _PoolFalso())
+    timeouts = metrics.obtener_contador("visualizador.render_timeout")
+    with pytest.raises(FuturesTimeoutError):
+        renderizar_linea_tiempo("DEX-1", EVENTOS)
+    assert metrics.obtener_contador("visualizador.render_timeout") == timeouts + 1
+
+
+def test_un_pool_roto_dibuja_en_el_hilo_actual(monkeypatch):
+    monkeypatch.setattr(timeline_renderer, "TIMELINE_RENDER_WORKERS", 1)
+    monkeypatch.setattr(timeline_renderer, "_obtener_pool", lambda: _PoolFalso(BrokenProcessPool("murió")))
+    png = renderizar_linea_tiempo("DEX-1", EVENTOS)
+    assert png.startswith(b"\x89PNG")
@@ -0,0 +1,60 @@
+import json
+import numpy as np
+import pytest
+from src.utils.vector_index import IndiceVectorial, guardar_snapshot, ARCHIVO_IDS
+
+
+def _fuerza_bruta(matriz: np.ndarray, vector: np.ndarray, k: int) -> list:
+    filas = matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+    similitudes = filas @ (vector / np.linalg.norm(vector))
+    return [int(p) for p in np.argsort(-similitudes)[:k]]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    generador = np.random.default_rng(7)
+    matriz = generador.normal(size=(300, 32)).astype(np.float32)
+    ids = [f"doc{i}.md" for i in range(len(matriz))]
+    guardar_snapshot(str(tmp_path), ids, matriz)
+    return tmp_path, ids, matriz, generador
+
+
+@pytest.mark.parametrize("k", [1, 5, 20])
+def test_top_k_coincide_con_fuerza_bruta(corpus, k):
+    directorio, ids, matriz, generador = corpus
+    indice = IndiceVectorial.cargar(str(directorio))
+    for _ in range(10):
+        vector = generador.normal(size=32)
+        resultados = indice.buscar(vector, k=k)
+        assert [doc for doc, _ in resultados] == [ids[p] for p in _fuerza_bruta(matriz, vector, k)]
+        similitudes = [similitud for _, similitud in resultados]
+        assert similitudes == sorted(similitudes, reverse=True)
+
+
+def test_k_mayor_que_el_corpus_devuelve_todos(corpus):
+    directorio, ids, _, _ = corpus
+    assert len(IndiceVectorial.cargar(str(directorio)).buscar(np.ones(32), k=1000)) == len(ids)
+
+
+def test_indice_vacio_no_devuelve_resultados():
+    assert IndiceVectorial([], np.empty((0, 0), dtype=np.float32)).buscar([1.0, 0.0]) == []
+
+
+def test_snapshot_con_ids_desalineados_falla(corpus):
+    directorio, ids, _, _ = corpus
+    with open(directorio / ARCHIVO_IDS, "w", encoding="utf-8") as archivo:
+        json.dump(ids[:-1], archivo)
+    with pytest.raises(ValueError, match="Snapshot inválido"):
+        IndiceVectorial.cargar(str(directorio))
+
+
+def test_hnsw_recupera_casi_todo_el_top_k_exacto(corpus):
+    pytest.importorskip("hnswlib")
+    directorio, _, _, generador = corpus
+    indice = IndiceVectorial.cargar(str(directorio), min_docs_hnsw=1)
+    aciertos = 0
+    for _ in range(20):
+        vector = generador.normal(size=32)
+        exactos = {doc for doc, _ in indice.buscar(vector, k=10, exacto=True)}
+        aciertos += len(exactos & {doc for doc, _ in indice.buscar(vector, k=10)})
+    assert aciertos / 200 >= 0.9